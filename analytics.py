@@ -0,0 +1,210 @@
+# analytics.py — columnar analytics behind /graph and /insights
+# All HabitLog rows needed are pulled in one query as NumPy arrays; every
+# metric below is computed with array operations, never a per-row loop.
+# Days, weekdays and hours are the user's local ones (localdates.py).
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import numpy as np
+from sqlalchemy import func, select
+import localdates
+from models import db, Habit, HabitLog
+
+SECONDS_PER_DAY = 86400
+# Zone names that are plain UTC (the default timezone), skipped without any lookup
+UTC_NAMES = {'UTC', 'Etc/UTC', 'Etc/GMT', 'GMT'}
+# Upper bound for the day x habit completion grid (1 byte per cell)
+MAX_GRID_CELLS = 50_000_000
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+@dataclass
+class LogColumns:
+    """HabitLog as parallel arrays: epoch seconds, habit id, mood (NaN if unset)."""
+    ts: np.ndarray
+    habit_id: np.ndarray
+    mood: np.ndarray
+
+    def __len__(self):
+        return len(self.ts)
+
+
+def load_columns(user_id, since=None):
+    """Fetch (timestamp, habit_id, mood_score) for every log of one user in a single query."""
+    stmt = select(
+        func.cast(func.strftime('%s', HabitLog.timestamp), db.Integer),
+        HabitLog.habit_id,
+        func.coalesce(HabitLog.mood_score, -1),
+    ).where(HabitLog.user_id == user_id, HabitLog.habit_id.not_in(Habit.deleted_ids(user_id)))
+    if since is not None:
+        stmt = stmt.where(HabitLog.timestamp >= since)
+    rows = db.session.execute(stmt).all()
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return LogColumns(empty, empty.copy(), np.empty(0, dtype=np.float64))
+    data = np.array(rows, dtype=np.int64)
+    mood = data[:, 2].astype(np.float64)
+    mood[mood < 0] = np.nan
+    return LogColumns(data[:, 0], data[:, 1], mood)
+
+
+def rolling_mean(values, window):
+    """Trailing mean over `window` entries (shorter at the start of the series)."""
+    csum = np.cumsum(np.insert(values, 0, 0.0))
+    idx = np.arange(1, len(values) + 1)
+    lo = np.maximum(idx - window, 0)
+    return (csum[idx] - csum[lo]) / (idx - lo)
+
+
+def local_seconds(ts, zone):
+    """Shift UTC epoch seconds to wall-clock seconds in `zone` (DST-aware)."""
+    if not len(ts) or getattr(zone, 'key', None) in UTC_NAMES:
+        return ts
+    fixed = zone.utcoffset(None)  # set for datetime.timezone, None for zones with rules
+    if fixed is not None:
+        return ts + int(fixed.total_seconds())
+    changes, offsets = offset_changes(int(ts.min()), int(ts.max()), zone)
+    return ts + offsets[np.searchsorted(changes, ts, side='right')]
+
+
+def _offset(second, zone):
+    return int(datetime.fromtimestamp(second, zone).utcoffset().total_seconds())
+
+
+def offset_changes(start, end, zone):
+    """
+    Instants (epoch seconds) in [start, end] where `zone`'s UTC offset
+    changes, and the offsets before the first and after each of them.
+    The offset is sampled at every UTC midnight (one lookup per day, not
+    per row) and each change found is bisected to the second; zones change
+    at most once a day.
+    """
+    bounds = range(start - start % SECONDS_PER_DAY, end + SECONDS_PER_DAY + 1, SECONDS_PER_DAY)
+    samples = [_offset(b, zone) for b in bounds]
+    changes, offsets = [], [samples[0]]
+    for lo, before, after in zip(bounds, samples, samples[1:]):
+        if before != after:
+            hi = lo + SECONDS_PER_DAY
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                lo, hi = (mid, hi) if _offset(mid, zone) == before else (lo, mid)
+            changes.append(hi)
+            offsets.append(after)
+    return np.array(changes, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+
+def compute(cols, habit_count, today=None, zone=timezone.utc):
+    """
+    Derive the dashboard metrics from LogColumns. Days and hours are local to
+    `zone`, and completion rate is the share of habits with at least one log that day.
+    """
+    today = today or datetime.now(zone).date()
+    last_day = (datetime(today.year, today.month, today.day, tzinfo=timezone.utc).timestamp()) // SECONDS_PER_DAY
+    result = {
+        'habit_count': habit_count,
+        'log_count': len(cols),
+        'days': np.empty(0, dtype=np.int64),
+        'completion': np.empty(0),
+        'rolling_7': np.empty(0),
+        'rolling_30': np.empty(0),
+        'weekday_hour': np.zeros((7, 24), dtype=np.int64),
+        'mood_correlation': None,
+    }
+    if not len(cols) or not habit_count:
+        return result
+
+    local = local_seconds(cols.ts, zone)
+    day = local // SECONDS_PER_DAY
+    first_day = int(day.min())
+    span = int(max(day.max(), last_day)) - first_day + 1
+
+    # Distinct (day, habit) pairs -> habits completed per day. A day x habit
+    # bitmap is a single O(n) scatter; fall back to sorting for huge grids.
+    # Habit ids grow with the number of tenants, so number this user's densely
+    # (a lookup table over their id range: O(n), where np.unique would sort)
+    low = int(cols.habit_id.min())
+    present = np.zeros(int(cols.habit_id.max()) - low + 1, dtype=bool)
+    present[cols.habit_id - low] = True
+    column = (np.cumsum(present) - 1)[cols.habit_id - low]
+    stride = int(present.sum())
+    offset = day - first_day
+    if span * stride <= MAX_GRID_CELLS:
+        grid = np.zeros((span, stride), dtype=bool)
+        grid[offset, column] = True
+        done = grid.sum(axis=1)
+    else:
+        pairs = np.unique(offset * stride + column)
+        done = np.bincount(pairs // stride, minlength=span)
+    completion = done / habit_count
+
+    # 1970-01-01 was a Thursday, so (day + 3) % 7 puts Monday at 0
+    weekday = (day + 3) % 7
+    hour = (local % SECONDS_PER_DAY) // 3600
+    heat = np.bincount(weekday * 24 + hour, minlength=7 * 24).reshape(7, 24)
+
+    # Mood vs completion: mean mood per day against that day's completion rate
+    has_mood = ~np.isnan(cols.mood)
+    correlation = None
+    if has_mood.any():
+        mood_day = offset[has_mood]
+        mood_sum = np.bincount(mood_day, weights=cols.mood[has_mood], minlength=span)
+        mood_n = np.bincount(mood_day, minlength=span)
+        with_mood = mood_n > 0
+        if with_mood.sum() >= 3:
+            x, y = mood_sum[with_mood] / mood_n[with_mood], completion[with_mood]
+            if x.std() > 0 and y.std() > 0:
+                correlation = float(np.corrcoef(x, y)[0, 1])
+
+    result.update({
+        'days': np.arange(first_day, first_day + span),
+        'completion': completion,
+        'rolling_7': rolling_mean(completion, 7),
+        'rolling_30': rolling_mean(completion, 30),
+        'weekday_hour': heat,
+        'mood_correlation': correlation,
+    })
+    return result
+
+
+def summary(user_id, today=None):
+    """Load a user's logs and compute the metrics in one call (used by the pages)."""
+    habit_count = db.session.query(func.count(Habit.id)).filter(Habit.user_id == user_id, Habit.deleted_at.is_(None)).scalar()
+    zone = localdates.user_timezone(user_id)
+    return compute(load_columns(user_id), habit_count, today=today or localdates.today(user_id), zone=zone)
+
+
+def sparkline(values, width=100, height=30):
+    """SVG polyline points for a series of 0..1 values."""
+    if len(values) == 0:
+        return ''
+    xs = np.linspace(0, width, len(values)) if len(values) > 1 else np.array([0.0])
+    ys = height - np.clip(values, 0, 1) * height
+    return ' '.join(f'{x:.1f},{y:.1f}' for x, y in zip(xs, ys))
+
+
+def insights(stats):
+    """Turn computed metrics into short insight cards."""
+    cards = []
+    if not stats['log_count']:
+        return cards
+
+    by_weekday = stats['weekday_hour'].sum(axis=1)
+    by_hour = stats['weekday_hour'].sum(axis=0)
+    best_day, best_hour = int(by_weekday.argmax()), int(by_hour.argmax())
+    cards.append({'title': f'{WEEKDAYS[best_day]}s are your strongest day',
+                  'body': f'{int(by_weekday[best_day])} of your {stats["log_count"]} check-ins happened on a {WEEKDAYS[best_day]}.'})
+    cards.append({'title': f'You check in most around {best_hour:02d}:00',
+                  'body': 'Schedule new habits near this time to ride the existing routine.'})
+
+    if len(stats['rolling_7']):
+        week, month = stats['rolling_7'][-1], stats['rolling_30'][-1]
+        trend = 'up' if week > month else 'down' if week < month else 'flat'
+        cards.append({'title': f'7-day completion is {week:.0%}',
+                      'body': f'Your 30-day average is {month:.0%}, so the recent trend is {trend}.'})
+
+    corr = stats['mood_correlation']
+    if corr is not None:
+        strength = 'strongly' if abs(corr) >= 0.5 else 'mildly' if abs(corr) >= 0.2 else 'barely'
+        direction = 'better' if corr >= 0 else 'worse'
+        cards.append({'title': f'Mood and completion: r = {corr:.2f}',
+                      'body': f'Days you complete more habits are {strength} linked with {direction} mood.'})
+    return cards
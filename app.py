@@ -1,49 +1,119 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, render_template_string, flash, session
-from models import db, Habit, HabitLog, User  # Import models
-from datetime import datetime, timedelta, timezone
+from flask import Flask, Response, abort, current_app, send_from_directory, render_template, request, redirect, url_for, jsonify, render_template_string, flash, session, stream_with_context
+from models import db, Habit, HabitDaily, HabitLog, HabitStreak, User  # Import models
+import rollups
+import cache
+import dbtuning
+import migrations
+import writequeue
+import instrumentation
+from cache import cached_view
+import streaks as streak_engine
+import analytics
+import click
+import assets
+import avatars
+import bitmaps
+import localdates
+import auth
+import events
+import sync
+from datetime import date, datetime, timedelta, timezone
+import base64
+import binascii
 import calendar
+import functools
+import csv
+import io
+import json
 import re
 import os
-from pathlib import Path
+import zlib
+from sqlalchemy import extract, func, insert, tuple_
 from sqlalchemy.exc import OperationalError
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from markupsafe import Markup
 
 def init_extensions(app):
     # Default Database Configuration (can be overridden by test_config)
     app.config.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite:///habits.db')
     app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
+    # 'production' enables the tuned SQLite profile in dbtuning.py
+    app.config.setdefault('DATABASE_PROFILE', os.environ.get('DATABASE_PROFILE', 'default'))
+    app.config.setdefault('DB_POOL_SIZE', 10)
+    app.config.setdefault('DB_MAX_OVERFLOW', 20)
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    app.config.setdefault('WRITE_RETRIES', 5)
+    # 'queued' makes POST /logs enqueue for the group-commit writer (writequeue.py)
+    app.config.setdefault('WRITE_MODE', 'sync')
+    app.config.setdefault('GROUP_COMMIT_MAX_ROWS', 500)
+    app.config.setdefault('GROUP_COMMIT_MAX_DELAY_MS', 20)
+    app.config.setdefault('WRITE_QUEUE_SIZE', 10000)
+    app.config.setdefault('WRITE_QUEUE_TIMEOUT', 1.0)
+    # Longest a calendar/day read waits for the user's own queued check-ins
+    app.config.setdefault('READ_YOUR_WRITES_TIMEOUT', 2.0)
+    # How queued data backfills run: 'thread' (background), 'inline' or 'manual' (flask backfill)
+    app.config.setdefault('BACKFILL_MODE', 'inline' if app.config.get('TESTING') else 'thread')
+    app.config.setdefault('BACKFILL_CHUNK_SIZE', 1000)
+    app.config.setdefault('BACKFILL_PAUSE', 0.05)
+    dbtuning.configure_engine_options(app)
+    # Rows per transaction for POST /logs/bulk
+    app.config.setdefault('BULK_CHUNK_SIZE', 1000)
+    # POST /sync: queued changes accepted per request, changed rows returned per page
+    app.config.setdefault('SYNC_MAX_CHANGES', 1000)
+    app.config.setdefault('SYNC_PAGE_SIZE', 500)
+    # Keyset pagination for habit/log listings
+    app.config.setdefault('PAGE_SIZE', 50)
+    app.config.setdefault('MAX_PAGE_SIZE', 500)
+    # Response cache for index/calendar/day; set RESPONSE_CACHE to a
+    # cache.CacheBackend instance (e.g. RedisCache) to replace the LRU
+    # Profile pictures: resized variants are rendered off the request thread
+    app.config.setdefault('AVATAR_DIR', os.path.join(app.static_folder, 'uploads', 'profile_pictures'))
+    app.config.setdefault('AVATAR_MODE', 'inline' if app.config.get('TESTING') else 'thread')
+    # Static files: hashed names, precompressed, immutable (assets.py)
+    app.config.setdefault('ASSETS_FINGERPRINT', True)
+    app.config.setdefault('RESPONSE_CACHE_SIZE', 1024)
+    app.config.setdefault('RESPONSE_CACHE_TTL', 300)
+    app.extensions['response_cache'] = app.config.get('RESPONSE_CACHE') or cache.LRUCache(
+        max_entries=app.config['RESPONSE_CACHE_SIZE'], default_ttl=app.config['RESPONSE_CACHE_TTL'])
 
     db.init_app(app)
     with app.app_context():
-        db.create_all()
-        # Simple schema migration for local SQLite DBs: ensure 'timestamp' column exists
+        dbtuning.install_pragmas(app)
+        # Schema migrations only run when PRAGMA user_version is behind
         try:
-            from sqlalchemy import text
-
-            # Use PRAGMA to inspect columns for sqlite; if missing, add column and populate from date
-            res = db.session.execute(text("PRAGMA table_info('habit_log')")).fetchall()
-            cols = [r[1] for r in res]
-            if 'timestamp' not in cols:
-                db.session.execute(text("ALTER TABLE habit_log ADD COLUMN timestamp DATETIME"))
-                # Populate existing rows with the date at midnight UTC (no timezone info)
-                db.session.execute(text("UPDATE habit_log SET timestamp = date || ' 00:00:00' WHERE timestamp IS NULL"))
-                db.session.commit()
-                print('Migration: added habit_log.timestamp column')
-            
-            # Ensure 'profile_picture' column exists on user table
-            res = db.session.execute(text("PRAGMA table_info('user')")).fetchall()
-            cols = [r[1] for r in res]
-            if 'profile_picture' not in cols:
-                db.session.execute(text("ALTER TABLE user ADD COLUMN profile_picture VARCHAR(255)"))
-                db.session.commit()
-                print('Migration: added user.profile_picture column')
+            migrations.upgrade()
+            pending = migrations.pending_backfills()
         except Exception as exc:
             # Fail silently but print to console for debugging (permission / non-sqlite DB)
+            db.session.rollback()
             print('Migration check skipped:', exc)
+            pending = []
+        # Row rewrites (e.g. after upgrading an old database) stay off the startup path
+        if pending:
+            dispatch_backfills(app)
+
+    if app.config['WRITE_MODE'] == 'queued':
+        app.extensions['log_writer'] = writequeue.GroupCommitWriter(
+            app,
+            max_rows=app.config['GROUP_COMMIT_MAX_ROWS'],
+            max_delay_ms=app.config['GROUP_COMMIT_MAX_DELAY_MS'],
+            max_queue=app.config['WRITE_QUEUE_SIZE'],
+            enqueue_timeout=app.config['WRITE_QUEUE_TIMEOUT'],
+            retries=app.config['WRITE_RETRIES'],
+        ).start()
+
+
+def dispatch_backfills(app):
+    """Run queued backfills as BACKFILL_MODE says: now, in the background thread, or not at all."""
+    if app.config['BACKFILL_MODE'] == 'inline':
+        migrations.run_backfills(app.config['BACKFILL_CHUNK_SIZE'])
+    elif app.config['BACKFILL_MODE'] == 'thread':
+        migrations.start_backfill_thread(app)
 
 
 # Validation Functions
+
 def validate_display_name(name):
     """Validate display name. Returns error message or empty string if valid."""
     if not name or not name.strip():
@@ -107,40 +177,390 @@ def validate_profile_picture(file):
     if file_size > max_size:
         return "Image size should be less than 300kb"
     
-    return ""
+    # Header-only check that it really is an image; decoding happens later
+    return avatars.sniff(file)
 
 
 def save_profile_picture(file, user_id):
-    """Save profile picture to disk. Returns filename or None if save failed."""
+    """
+    Hand a validated upload to the avatar pipeline (avatars.py), which sets
+    user.profile_picture once the resized variants exist. Returns False if
+    the upload could not be read.
+    """
     if not file or file.filename == '':
-        return None
-    
-    # Create upload directory if it doesn't exist
-    upload_dir = Path('static/uploads/profile_pictures')
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Generate secure filename with user_id
-    file_ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else 'jpg'
-    filename = f"user_{user_id}.{file_ext}"
-    filepath = upload_dir / filename
-    
+        return False
     try:
-        file.save(str(filepath))
-        return filename
+        data = file.read()
     except Exception as e:
-        print(f"Error saving profile picture: {e}")
+        print(f"Error reading profile picture: {e}")
+        return False
+    avatars.submit(current_app._get_current_object(), user_id, data)
+    return True
+
+
+def log_rows(user_id):
+    """
+    Query for one user's log listings: plain (id, habit_id, habit_name,
+    timestamp) rows fetched with a single JOIN, so callers never touch the
+    lazy log.habit relationship (which would issue one SELECT per log).
+    Filtering on HabitLog.user_id keeps every listing on a (user_id, ...) index.
+    """
+    return (
+        db.session.query(HabitLog.id, HabitLog.habit_id, Habit.name.label('habit_name'), HabitLog.timestamp)
+        .join(Habit, Habit.id == HabitLog.habit_id)
+        .filter(HabitLog.user_id == user_id, Habit.deleted_at.is_(None))
+    )
+
+
+def log_event(log_id, habit, timestamp, local_date):
+    """Payload of a log_added event (see events.py)."""
+    return {'id': log_id, 'habit_id': habit.id, 'habit_name': habit.name,
+            'timestamp': timestamp.isoformat(), 'local_date': local_date.isoformat()}
+
+
+def cached_fragment(name):
+    """Template helper: a fragment's cached HTML for the current user and data version, or None."""
+    entry = cache.peek_fragment(name, auth.current_user_id())
+    return Markup(entry['html']) if entry else None
+
+
+def parse_timestamp(value):
+    """Parse an optional ISO8601 timestamp (naive means UTC) into aware UTC. Raises ValueError."""
+    if not value:
+        return datetime.now(timezone.utc)
+    try:
+        ts = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid timestamp')
+    # If naive, assume UTC
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc)
+
+
+def export_bound(value):
+    """An export start/end: a date for a plain YYYY-MM-DD, else a timestamp as parse_timestamp reads it. Raises ValueError."""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return parse_timestamp(value)
+
+
+def iter_bulk_rows():
+    """
+    Yield raw log dicts from the request body: a JSON array, or NDJSON
+    (one object per line) read incrementally from the request stream.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        for line in iter(request.stream.readline, b''):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+        return
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, list):
+        raise ValueError('Expected a JSON array or NDJSON body')
+    yield from payload
+
+
+def is_int(value):
+    # bool is a subclass of int, but true/false are never ids or scores
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def is_row_id(value):
+    # SQLite integers are 64-bit; binding a larger one raises OverflowError
+    return is_int(value) and 0 < value < 2 ** 63
+
+
+def client_id_error(client_id):
+    """Error message for a client-generated log id that is not a 1-CLIENT_ID_MAX character string."""
+    if not isinstance(client_id, str) or not 0 < len(client_id) <= sync.CLIENT_ID_MAX:
+        return f'client_id must be a string of 1-{sync.CLIENT_ID_MAX} characters'
+    return ''
+
+
+def log_row_error(raw):
+    """Validate one raw log row's fields and types (not whether its habit exists). Returns an error or ''."""
+    if not isinstance(raw, dict):
+        return 'Invalid row'
+    if not raw.get('habit_id'):
+        return 'habit_id required'
+    if not is_row_id(raw['habit_id']):
+        return 'habit_id must be a positive 64-bit integer'
+    try:
+        parse_timestamp(raw.get('timestamp'))
+    except ValueError:
+        return 'Invalid timestamp'
+    mood = raw.get('mood_score')
+    if mood is not None and (not is_int(mood) or not 1 <= mood <= 10):
+        return 'mood_score must be an integer 1-10'
+    if raw.get('client_id') is not None:
+        return client_id_error(raw['client_id'])
+    return ''
+
+
+def insert_log_chunk(chunk, user_id):
+    """
+    Validate and insert one chunk of (index, raw) rows for `user_id` in a
+    single transaction. Habit ids are checked with one IN query (only the
+    user's own habits count) and valid rows go to the database as a single
+    executemany INSERT. A row whose optional client_id the user already
+    logged is not inserted again. Returns (results, errors); results holds
+    {'index', 'id', 'status'} with status 'created' or 'duplicate'.
+    """
+    # Check every row's shape first, so only well-typed values reach sets and IN lists
+    valid, errors = [], []
+    for index, raw in chunk:
+        error = log_row_error(raw)
+        if error:
+            errors.append({'index': index, 'error': error})
+        else:
+            valid.append((index, raw))
+    wanted = {raw['habit_id'] for _, raw in valid}
+    known = {hid for (hid,) in db.session.query(Habit.id).filter(
+        Habit.id.in_(wanted), Habit.user_id == user_id, Habit.deleted_at.is_(None))} if wanted else set()
+    client_ids = {raw['client_id'] for _, raw in valid if raw.get('client_id') is not None}
+    seen = dict(db.session.query(HabitLog.client_id, HabitLog.id).filter(
+        HabitLog.user_id == user_id, HabitLog.client_id.in_(client_ids))) if client_ids else {}
+
+    zone = localdates.user_timezone(user_id)
+    rows, indexes, duplicates = [], [], []
+    for index, raw in valid:
+        habit_id, client_id = raw['habit_id'], raw.get('client_id')
+        if habit_id not in known:
+            errors.append({'index': index, 'error': 'habit not found'})
+            continue
+        ts = parse_timestamp(raw.get('timestamp'))
+        mood = raw.get('mood_score')
+        if client_id in seen:
+            duplicates.append((index, client_id))
+            continue
+        if client_id is not None:
+            seen[client_id] = None  # a repeat within this chunk resolves to the row inserted below
+        rows.append({'habit_id': habit_id, 'user_id': user_id, 'timestamp': ts, 'date': ts.date(),
+                     'local_date': localdates.local_date(ts, zone), 'mood_score': mood, 'client_id': client_id})
+        indexes.append(index)
+
+    results = []
+    if rows:
+        first = sync.reserve(len(rows))
+        for n, row in enumerate(rows):
+            row['change_seq'] = first + n
+        ids = db.session.execute(
+            insert(HabitLog).returning(HabitLog.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+        rollups.refresh((r['habit_id'], r['local_date']) for r in rows)
+        rollups.mark_applied(min(ids), max(ids))
+        # Imports are usually backdated, so recompute each touched habit once
+        for habit_id in {r['habit_id'] for r in rows}:
+            streak_engine.rebuild_habit(habit_id)
+        for index, row, log_id in zip(indexes, rows, ids):
+            results.append({'index': index, 'id': log_id, 'status': 'created'})
+            if row['client_id'] is not None:
+                seen[row['client_id']] = log_id
+    results.extend({'index': index, 'id': seen[client_id], 'status': 'duplicate'} for index, client_id in duplicates)
+    errors.sort(key=lambda e: e['index'])
+    db.session.commit()
+    dates = {r['local_date'] for r in rows}
+    cache.invalidate(cache.keys_for_dates(user_id, dates))
+    if dates:
+        # One event per chunk, not per row: listeners refetch the days named
+        events.publish(user_id, 'logs_imported', {'count': len(rows), 'local_dates': sorted(d.isoformat() for d in dates)})
+    return sorted(results, key=lambda r: r['index']), errors
+
+
+def remove_logs(logs):
+    """
+    Delete the given HabitLog rows, keeping the rollup and streak summaries in
+    step and leaving a sync tombstone for each. The caller commits.
+    """
+    for log in logs:
+        db.session.delete(log)
+        sync.record_deletion(log.user_id, 'log', log.id, log.client_id)
+    rollups.refresh({(log.habit_id, log.local_date) for log in logs})
+    if len(logs) == 1:
+        streak_engine.remove_checkin(logs[0].habit_id, logs[0].local_date)
+    else:
+        for habit_id in {log.habit_id for log in logs}:
+            streak_engine.rebuild_habit(habit_id)
+
+
+def encode_cursor(values):
+    """Opaque, URL-safe keyset cursor from the last row's sort key."""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    """
+    Inverse of encode_cursor for a `size`-column sort key: a datetime, then
+    row ids. Raises ValueError for anything else, since clients send it back.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != size or not all(is_row_id(v) for v in values[1:]):
+            raise ValueError
+        return [datetime.fromisoformat(values[0]), *values[1:]]
+    except (TypeError, ValueError, binascii.Error):
+        raise ValueError('Invalid cursor')
+
+
+def keyset_page(query, order_cols, cursor=None, limit=50):
+    """
+    One page of `query` in descending `order_cols` order, starting after
+    `cursor`. Seeks with a row-value comparison on the index instead of
+    OFFSET, so every page costs the same. Returns (rows, next_cursor).
+    """
+    if cursor:
+        query = query.filter(tuple_(*order_cols) < tuple_(*decode_cursor(cursor, len(order_cols))))
+    rows = query.order_by(*(col.desc() for col in order_cols)).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], col.key) for col in order_cols])
+
+
+def page_limit():
+    """?limit= clamped to the configured page size bounds."""
+    try:
+        limit = int(request.args.get('limit', current_app.config['PAGE_SIZE']))
+    except ValueError:
+        limit = current_app.config['PAGE_SIZE']
+    return max(1, min(limit, current_app.config['MAX_PAGE_SIZE']))
+
+
+def text_fields(*names):
+    """
+    The named fields of a JSON object or form post ('' when absent), or None
+    when the body is not an object or one of them is not a string.
+    """
+    payload = request.get_json(silent=True) or request.form
+    if not isinstance(payload, dict):
         return None
+    values = ['' if payload.get(name) is None else payload.get(name) for name in names]
+    return values if all(isinstance(value, str) for value in values) else None
+
+
+def safe_next(target):
+    """The ?next= path to return to after login, if it stays on this site."""
+    if target and target.startswith('/') and not target.startswith('//') and '\\' not in target:
+        return target
+    return None
+
+
+def gzip_stream(chunks, level=6):
+    """Compress an iterable of byte chunks on the fly as a single gzip member."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(query, fmt, batch_size=1000):
+    """Serialize export rows as NDJSON or CSV, one encoded chunk per batch."""
+    fields = ['id', 'habit_id', 'habit_name', 'timestamp', 'mood_score']
+    buf = io.StringIO()
+    writer = csv.writer(buf) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(fields)
+
+    for i, row in enumerate(query.execution_options(yield_per=batch_size), 1):
+        values = [row.id, row.habit_id, row.habit_name, row.timestamp.isoformat(), row.mood_score]
+        if writer:
+            writer.writerow(values)
+        else:
+            buf.write(json.dumps(dict(zip(fields, values))) + '\n')
+        if i % batch_size == 0:
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+def read_your_writes(dates_for):
+    """
+    In queued write mode, wait for the group-commit writer before serving a
+    view whose dates (dates_for(**view_args)) still have uncommitted logs of
+    this user: only rows queued before the read, for at most READ_YOUR_WRITES_TIMEOUT.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            writer = current_app.extensions.get('log_writer')
+            if writer is not None:
+                try:
+                    dates = dates_for(*args, **kwargs)
+                except ValueError:
+                    dates = []  # invalid date; the view reports it
+                if writer.has_pending(auth.current_user_id(), dates):
+                    writer.wait_for(auth.current_user_id(), dates, current_app.config['READ_YOUR_WRITES_TIMEOUT'])
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_streak(user_id):
+    """Best active streak across a user's habits, read from the streak summaries."""
+    today = localdates.today(user_id)
+    return max((streak_engine.active_streak(r, today) for r, _ in streak_engine.streak_rows(user_id)), default=0)
 
 
 def register_routes(app):
+    app.add_template_global(avatars.variants, 'avatar_variants')
+    app.add_template_global(cached_fragment)
+
     @app.route('/')
+    @cached_view(lambda: cache.index_key(auth.current_user_id(), signed_in='user_id' in session))
     def index():
-        # Fetch habits newest-first
-        habits = Habit.query.order_by(Habit.created_at.desc()).all()
+        # First page of habits newest-first; the rest load from /habits
+        habits, next_cursor = keyset_page(
+            Habit.query.filter(Habit.user_id == auth.current_user_id(), Habit.deleted_at.is_(None)),
+            [Habit.created_at, Habit.id], limit=app.config['PAGE_SIZE'])
         habits_json = [{'id': h.id, 'name': h.name} for h in habits]
-        return render_template('index.html', habits=habits, habits_json=habits_json)
+        return render_template('index.html', habits=habits, habits_json=habits_json, next_cursor=next_cursor)
+
+    @app.route('/habits')
+    def list_habits():
+        # Keyset-paginated habit listing, newest first
+        try:
+            habits, next_cursor = keyset_page(
+                db.session.query(Habit.id, Habit.name, Habit.created_at)
+                .filter(Habit.user_id == auth.current_user_id(), Habit.deleted_at.is_(None)),
+                [Habit.created_at, Habit.id], request.args.get('cursor'), page_limit())
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        return jsonify({
+            'habits': [{'id': h.id, 'name': h.name, 'created_at': h.created_at.isoformat()} for h in habits],
+            'next_cursor': next_cursor,
+        })
+
+    @app.route('/logs', methods=['GET'])
+    def list_logs():
+        # Keyset-paginated log listing, newest first, optionally for one habit
+        query = log_rows(auth.current_user_id())
+        habit_id = request.args.get('habit_id', type=int)
+        if habit_id:
+            query = query.filter(HabitLog.habit_id == habit_id)
+        try:
+            logs, next_cursor = keyset_page(query, [HabitLog.timestamp, HabitLog.id], request.args.get('cursor'), page_limit())
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        return jsonify({
+            'logs': [{'id': l.id, 'habit_id': l.habit_id, 'habit_name': l.habit_name, 'timestamp': l.timestamp.isoformat()} for l in logs],
+            'next_cursor': next_cursor,
+        })
 
     @app.route('/add_habit', methods=['POST'])
+    @dbtuning.retry_on_locked
     def add_habit():
         # Accept form data or JSON
         if request.is_json:
@@ -156,9 +576,12 @@ def register_routes(app):
             return redirect(url_for('index'))
 
         # Create and save
-        new_habit = Habit(name=name)
+        new_habit = Habit(name=name, user_id=auth.current_user_id(), change_seq=sync.reserve())
         db.session.add(new_habit)
         db.session.commit()
+        cache.invalidate(cache.index_keys(new_habit.user_id) | {cache.version_key(new_habit.user_id)})
+        events.publish(new_habit.user_id, 'habit_added',
+                       {'id': new_habit.id, 'name': new_habit.name, 'created_at': new_habit.created_at.isoformat()})
 
         if request.is_json:
             return jsonify({'id': new_habit.id, 'name': new_habit.name, 'created_at': new_habit.created_at.isoformat()}), 201
@@ -166,28 +589,52 @@ def register_routes(app):
         return redirect(url_for('index'))
 
     @app.route('/delete_habit', methods=['POST'])
+    @dbtuning.retry_on_locked
     def delete_habit():
         payload = request.get_json() or {}
         hid = payload.get('id')
         if not hid:
             return jsonify({'error': 'id required'}), 400
         habit = db.session.get(Habit, hid)
-        if not habit:
+        if not habit or habit.deleted_at or habit.user_id != auth.current_user_id():
             return jsonify({'error': 'not found'}), 404
-        db.session.delete(habit)
+        # Soft delete: hide the habit and drop its per-day summaries now (one
+        # row per day at most); its raw logs are purged in committed chunks
+        # by the purge_habits backfill, so no log is loaded or locked here
+        dates = [d for (d,) in db.session.query(HabitDaily.date).filter_by(habit_id=habit.id)]
+        HabitStreak.query.filter_by(habit_id=habit.id).delete()
+        HabitDaily.query.filter_by(habit_id=habit.id).delete()
+        bitmaps.remove(habit.id)
+        habit.deleted_at = datetime.now(timezone.utc)
+        # Synced clients drop the habit and its logs on this one tombstone
+        sync.record_deletion(habit.user_id, 'habit', habit.id)
+        migrations.queue_backfill('purge_habits')
         db.session.commit()
+        cache.invalidate(cache.keys_for_dates(habit.user_id, dates) | cache.index_keys(habit.user_id) | {cache.version_key(habit.user_id)})
+        events.publish(habit.user_id, 'habit_deleted', {'id': habit.id})
+        dispatch_backfills(app)
         return jsonify({'status': 'deleted'})
 
     @app.route('/logs/<int:log_id>', methods=['DELETE'])
+    @dbtuning.retry_on_locked
     def delete_log(log_id):
         log = db.session.get(HabitLog, log_id)
-        if not log:
+        if not log or log.user_id != auth.current_user_id() or db.session.get(Habit, log.habit_id).deleted_at:
             return jsonify({'error': 'not found'}), 404
-        db.session.delete(log)
+        habit_id, day, user_id = log.habit_id, log.local_date, log.user_id
+        remove_logs([log])
+        daily = db.session.get(HabitDaily, (habit_id, day))
+        remaining = daily.count if daily else 0
         db.session.commit()
+        cache.invalidate(cache.keys_for_dates(user_id, [day]))
+        # The habit's check-ins left that day, so calendars can clear it without a refetch
+        events.publish(user_id, 'log_deleted', {'id': log_id, 'habit_id': habit_id, 'local_date': day.isoformat(),
+                                                'day_count': remaining})
         return jsonify({'status': 'deleted'})
 
     @app.route('/calendar/<int:year>/<int:month>')
+    @read_your_writes(lambda year, month: [date(year, month, d) for d in range(1, calendar.monthrange(year, month)[1] + 1)])
+    @cached_view(lambda year, month: cache.calendar_key(auth.current_user_id(), year, month, request.args.get('counts') in ('1', 'true', 'yes')))
     def calendar_month(year, month):
         # Return list of days in the month which have any HabitLog entries
         try:
@@ -197,25 +644,51 @@ def register_routes(app):
         _, days_in_month = calendar.monthrange(year, month)
         end = start + timedelta(days=days_in_month)
 
+        # Read the daily rollup: at most one row per habit per day of the month,
+        # reached through the user's habits, then each habit's (habit_id, date) range
+        in_month = (Habit.user_id == auth.current_user_id(), HabitDaily.date >= start.date(), HabitDaily.date < end.date())
+        day_col = extract('day', HabitDaily.date).label('day')
+        want_counts = request.args.get('counts') in ('1', 'true', 'yes')
+
         try:
-            logs = HabitLog.query.filter(HabitLog.timestamp >= start, HabitLog.timestamp < end).all()
+            if not want_counts:
+                rows = (
+                    db.session.query(day_col).join(Habit, Habit.id == HabitDaily.habit_id)
+                    .filter(*in_month).distinct().order_by(day_col).all()
+                )
+                return jsonify({'days_with_logs': [int(r.day) for r in rows]})
+
+            rows = (
+                db.session.query(day_col, HabitDaily.habit_id, Habit.name, HabitDaily.count)
+                .join(Habit, Habit.id == HabitDaily.habit_id)
+                .filter(*in_month)
+                .order_by(day_col, HabitDaily.habit_id)
+                .all()
+            )
         except OperationalError:
             # If DB schema is older and timestamp column is missing, return empty list instead of 500
             return jsonify({'days_with_logs': []})
 
-        days = sorted({log.timestamp.astimezone(timezone.utc).day for log in logs})
-        return jsonify({'days_with_logs': days})
+        # At most (days x habits) rows, so folding them in Python is cheap
+        per_day = {}
+        for r in rows:
+            entry = per_day.setdefault(int(r.day), {'day': int(r.day), 'count': 0, 'habits': []})
+            entry['count'] += r.count
+            entry['habits'].append({'habit_id': r.habit_id, 'habit_name': r.name, 'count': r.count})
+        return jsonify({'days_with_logs': sorted(per_day), 'days': [per_day[d] for d in sorted(per_day)]})
 
     @app.route('/day/<int:year>/<int:month>/<int:day>')
+    @read_your_writes(lambda year, month, day: [date(year, month, day)])
+    @cached_view(lambda year, month, day: cache.day_key(auth.current_user_id(), year, month, day))
     def day_details(year, month, day):
         try:
-            day_start = datetime(year, month, day, tzinfo=timezone.utc)
+            wanted = date(year, month, day)
         except ValueError:
             return jsonify({'error': 'Invalid date'}), 400
-        day_end = day_start + timedelta(days=1)
 
         try:
-            logs = HabitLog.query.filter(HabitLog.timestamp >= day_start, HabitLog.timestamp < day_end).order_by(HabitLog.timestamp.asc()).all()
+            # Days are the user's local days: one range on (user_id, local_date, timestamp)
+            logs = log_rows(auth.current_user_id()).filter(HabitLog.local_date == wanted).order_by(HabitLog.timestamp.asc()).all()
         except OperationalError:
             # Old DB schema without timestamp -> return empty list
             return jsonify({'logs': []})
@@ -225,12 +698,13 @@ def register_routes(app):
             out.append({
                 'id': log.id,
                 'habit_id': log.habit_id,
-                'habit_name': log.habit.name,
+                'habit_name': log.habit_name,
                 'timestamp': log.timestamp.isoformat()
             })
         return jsonify({'logs': out})
 
     @app.route('/logs', methods=['POST'])
+    @dbtuning.retry_on_locked
     def add_log():
         payload = request.get_json() or {}
         habit_id = payload.get('habit_id')
@@ -241,36 +715,228 @@ def register_routes(app):
 
         # Use session.get for SQLAlchemy 2.x compatibility
         habit = db.session.get(Habit, habit_id)
-        if not habit:
+        if not habit or habit.deleted_at or habit.user_id != auth.current_user_id():
             return jsonify({'error': 'habit not found'}), 404
 
-        if timestamp:
+        try:
+            ts = parse_timestamp(timestamp)
+        except ValueError:
+            return jsonify({'error': 'Invalid timestamp'}), 400
+
+        local_date = localdates.local_date(ts, localdates.user_timezone(habit.user_id))
+        writer = app.extensions.get('log_writer')
+        if writer is not None:
+            # Queued mode: ack now, the group-commit writer persists it shortly
             try:
-                ts = datetime.fromisoformat(timestamp)
-                # If naive, assume UTC
-                if ts.tzinfo is None:
-                    ts = ts.replace(tzinfo=timezone.utc)
-            except Exception:
-                return jsonify({'error': 'Invalid timestamp'}), 400
-        else:
-            ts = datetime.now(timezone.utc)
+                token = writer.submit({'habit_id': habit.id, 'user_id': habit.user_id, 'timestamp': ts, 'date': ts.date(),
+                                       'local_date': local_date, 'mood_score': None})
+            except writequeue.QueueFull:
+                return jsonify({'error': 'write queue full, retry shortly'}), 503, {'Retry-After': '1'}
+            return jsonify({'token': token, 'status': 'queued', 'habit_id': habit.id, 'habit_name': habit.name, 'timestamp': ts.isoformat()}), 202
 
         # Create HabitLog
-        log = HabitLog(habit_id=habit_id, timestamp=ts, date=ts.date())
+        log = HabitLog(habit_id=habit_id, user_id=habit.user_id, timestamp=ts, date=ts.date(), local_date=local_date,
+                       change_seq=sync.reserve())
         db.session.add(log)
+        db.session.flush()
+        rollups.record_log(log)
+        rollups.mark_applied(log.id, log.id)
+        streak_engine.record_checkin(habit_id, log.local_date)
         db.session.commit()
+        cache.invalidate(cache.keys_for_dates(log.user_id, [log.local_date]))
+        events.publish(log.user_id, 'log_added', log_event(log.id, habit, log.timestamp, log.local_date))
 
         return jsonify({'id': log.id, 'habit_id': log.habit_id, 'habit_name': habit.name, 'timestamp': log.timestamp.isoformat()}), 201
 
+    @app.route('/logs/ack/<token>')
+    def log_ack(token):
+        # Status of a check-in accepted in queued write mode
+        writer = app.extensions.get('log_writer')
+        state = writer.ack(token) if writer else None
+        if state is None:
+            return jsonify({'error': 'unknown token'}), 404
+        return jsonify(state)
+
+    @app.route('/export')
+    def export_logs():
+        # Streams every log (optionally filtered) as NDJSON or CSV
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in ('ndjson', 'csv'):
+            return jsonify({'error': 'format must be ndjson or csv'}), 400
+
+        query = log_rows(auth.current_user_id()).add_columns(HabitLog.mood_score)
+        try:
+            # Bounds are inclusive: a date is a day in the user's timezone, as
+            # on the calendar; a timestamp is an instant (naive means UTC)
+            if request.args.get('start'):
+                start = export_bound(request.args['start'])
+                query = query.filter(HabitLog.local_date >= start if type(start) is date else HabitLog.timestamp >= start)
+            if request.args.get('end'):
+                end = export_bound(request.args['end'])
+                query = query.filter(HabitLog.local_date <= end if type(end) is date else HabitLog.timestamp <= end)
+            habit_ids = [int(h) for h in request.args.getlist('habit_id')]
+        except ValueError:
+            return jsonify({'error': 'Invalid filter'}), 400
+        if habit_ids:
+            query = query.filter(HabitLog.habit_id.in_(habit_ids))
+        query = query.order_by(HabitLog.timestamp.asc(), HabitLog.id.asc())
+
+        chunks = export_chunks(query, fmt)
+        headers = {'Content-Disposition': f'attachment; filename=habit_logs.{fmt}', 'Vary': 'Accept-Encoding'}
+        if 'gzip' in request.accept_encodings:
+            chunks = gzip_stream(chunks)
+            headers['Content-Encoding'] = 'gzip'
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+    @app.route('/logs/bulk', methods=['POST'])
+    def add_logs_bulk():
+        # Accepts a JSON array or an NDJSON stream of {habit_id, timestamp, mood_score}
+        chunk_size = app.config['BULK_CHUNK_SIZE']
+        user_id = auth.current_user_id()
+        inserted, errors, chunk = 0, [], []
+        try:
+            for index, raw in enumerate(iter_bulk_rows()):
+                chunk.append((index, raw))
+                if len(chunk) >= chunk_size:
+                    ok, bad = insert_log_chunk(chunk, user_id)
+                    inserted, chunk = inserted + sum(r['status'] == 'created' for r in ok), []
+                    errors.extend(bad)
+        except ValueError as exc:
+            return jsonify({'error': str(exc)}), 400
+        if chunk:
+            ok, bad = insert_log_chunk(chunk, user_id)
+            inserted += sum(r['status'] == 'created' for r in ok)
+            errors.extend(bad)
+
+        return jsonify({'inserted': inserted, 'errors': errors}), 200 if inserted or not errors else 400
+
+    @app.route('/sync', methods=['POST'])
+    @dbtuning.retry_on_locked
+    def sync_changes():
+        # Offline-first sync: apply the client's queued check-ins/deletions,
+        # then answer with everything changed since its cursor (sync.py)
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            return jsonify({'error': 'Expected a JSON object'}), 400
+        cursor, changes = payload.get('cursor') or 0, payload.get('changes') or []
+        if not is_int(cursor) or not 0 <= cursor < 2 ** 63:
+            return jsonify({'error': 'cursor must be a non-negative 64-bit integer'}), 400
+        if not isinstance(changes, list):
+            return jsonify({'error': 'changes must be a list'}), 400
+        if len(changes) > app.config['SYNC_MAX_CHANGES']:
+            return jsonify({'error': f'at most {app.config["SYNC_MAX_CHANGES"]} changes per request'}), 413
+        user_id = auth.current_user_id()
+
+        results = [None] * len(changes)
+        adds, deletes = [], []
+        for index, change in enumerate(changes):
+            op = change.get('op') if isinstance(change, dict) else None
+            client_id = change.get('client_id') if isinstance(change, dict) else None
+            if op in ('add_log', 'delete_log') and client_id is not None and client_id_error(client_id):
+                results[index] = {'status': 'error', 'error': client_id_error(client_id)}
+            elif op == 'add_log' and client_id is None:
+                results[index] = {'status': 'error', 'error': 'client_id required'}
+            elif op == 'add_log':
+                adds.append((index, change))
+            elif op == 'delete_log' and (client_id is not None or is_row_id(change.get('id'))):
+                deletes.append((index, change))
+            else:
+                results[index] = {'status': 'error', 'error': 'op must be add_log (with client_id) or delete_log (with client_id or id)'}
+
+        if adds:
+            created, errors = insert_log_chunk(adds, user_id)
+            for r in created:
+                results[r['index']] = {'status': r['status'], 'id': r['id']}
+            for e in errors:
+                results[e['index']] = {'status': 'error', 'error': e['error']}
+        if deletes:
+            # Deleting a log that is already gone (or never arrived) succeeds: retries are safe
+            by_client = {c['client_id'] for _, c in deletes if c.get('client_id') is not None}
+            by_id = {c['id'] for _, c in deletes if c.get('client_id') is None}
+            found = HabitLog.query.filter(
+                HabitLog.user_id == user_id, db.or_(HabitLog.client_id.in_(by_client), HabitLog.id.in_(by_id)),
+                HabitLog.habit_id.not_in(Habit.deleted_ids(user_id))).all()
+            if found:
+                remove_logs(found)
+                remaining = {(d.habit_id, d.date): d.count for d in HabitDaily.query.filter(
+                    tuple_(HabitDaily.habit_id, HabitDaily.date).in_({(l.habit_id, l.local_date) for l in found}))}
+                db.session.commit()
+                cache.invalidate(cache.keys_for_dates(user_id, {log.local_date for log in found}))
+                for log in found:
+                    events.publish(user_id, 'log_deleted', {'id': log.id, 'habit_id': log.habit_id, 'local_date': log.local_date.isoformat(),
+                                                            'day_count': remaining.get((log.habit_id, log.local_date), 0)})
+            for index, change in deletes:
+                results[index] = {'status': 'deleted'}
+
+        delta = sync.changes_since(user_id, cursor, app.config['SYNC_PAGE_SIZE'])
+        # The client has its own check-ins already; `results` tells it their ids
+        pushed = {c['client_id'] for _, c in adds}
+        delta['logs'] = [l for l in delta['logs'] if l['client_id'] not in pushed]
+        return jsonify({'results': [dict(r, client_id=c['client_id']) if isinstance(c, dict) and isinstance(c.get('client_id'), str) else r
+                                    for r, c in zip(results, changes)], **delta})
+
+    @app.route('/login', methods=['GET', 'POST'])
+    def login():
+        # Session login with the password hash set on the profile page
+        next_url = safe_next(request.args.get('next'))
+        if request.method == 'GET':
+            return render_template('login.html', register=False, next=next_url, email='')
+        email, password = text_fields('email', 'password') or ('', '')
+        email = email.strip()
+        user = User.query.filter_by(email=email).first() if email else None
+        if not user or not user.password or not check_password_hash(user.password, password):
+            if request.is_json:
+                return jsonify({'error': 'Invalid email or password'}), 401
+            flash('Invalid email or password', 'error')
+            return render_template('login.html', register=False, next=next_url, email=email), 401
+        auth.login_user(user)
+        if request.is_json:
+            return jsonify({'id': user.id, 'email': user.email})
+        return redirect(next_url or url_for('index'))
+
+    @app.route('/register', methods=['GET', 'POST'])
+    @dbtuning.retry_on_locked
+    def register():
+        next_url = safe_next(request.args.get('next'))
+        if request.method == 'GET':
+            return render_template('login.html', register=True, next=next_url, email='')
+        fields = text_fields('email', 'password', 'display_name')
+        email, password, display_name = fields or ('', '', '')
+        email, display_name = email.strip(), display_name.strip()
+        error = (
+            ("Email, password and display name must be text" if fields is None else "")
+            or ("Email is required" if not email else validate_email(email))
+            or ("Password is required" if not password.strip() else validate_password(password))
+            or validate_display_name(display_name)
+        )
+        if not error and db.session.query(User.id).filter_by(email=email).first():
+            error = "Email is already registered"
+        if error:
+            if request.is_json:
+                return jsonify({'error': error}), 400
+            flash(error, 'error')
+            return render_template('login.html', register=True, next=next_url, email=email), 400
+        user = User(email=email, display_name=display_name or None, password=generate_password_hash(password))
+        db.session.add(user)
+        db.session.commit()
+        auth.login_user(user)
+        if request.is_json:
+            return jsonify({'id': user.id, 'email': user.email}), 201
+        return redirect(next_url or url_for('index'))
+
+    @app.route('/logout', methods=['POST'])
+    def logout():
+        auth.logout_user()
+        if request.is_json:
+            return jsonify({'status': 'logged out'})
+        return redirect(url_for('login'))
+
     # Minimal placeholder pages for UI navigation links
     @app.route('/profile', methods=['GET', 'POST'])
     def profile():
-        # Get or create default user (ID=1 for demo)
-        user = User.query.first()
-        if not user:
-            user = User(email='user@example.com', display_name='Your Name')
-            db.session.add(user)
-            db.session.commit()
+        # The signed-in user (or the default account while no account has a password)
+        user = auth.current_user()
         
         # Handle form submission
         if request.method == 'POST':
@@ -299,6 +965,8 @@ def register_routes(app):
                 email_error = validate_email(email)
                 if email_error:
                     errors['email'] = email_error
+                elif db.session.query(User.id).filter(User.email == email, User.id != user.id).first():
+                    errors['email'] = "Email is already registered"
             
             # Validate password (only if provided)
             if password:
@@ -316,10 +984,7 @@ def register_routes(app):
             if errors:
                 for field, error in errors.items():
                     flash(error, 'error')
-                habits = Habit.query.order_by(Habit.created_at.desc()).all()
-                recent_logs = HabitLog.query.order_by(HabitLog.timestamp.desc()).limit(5).all()
-                streak = 0
-                return render_template('profile.html', user=user, habits=habits, recent=recent_logs, streak=streak, errors=errors)
+                return render_template('profile.html', user=user, errors=errors)
             
             # Update user data if all validations pass
             user.display_name = display_name
@@ -327,94 +992,239 @@ def register_routes(app):
             if password:
                 user.password = generate_password_hash(password)
             
-            # Save profile picture if provided
+            # Save profile picture if provided (processed in the background)
             if profile_picture and profile_picture.filename:
-                filename = save_profile_picture(profile_picture, user.id)
-                if filename:
-                    user.profile_picture = filename
+                save_profile_picture(profile_picture, user.id)
             
             user.updated_at = datetime.now(timezone.utc)
             db.session.commit()
+            if password:
+                # A password turns on login for everyone (auth.login_required); keep this visitor signed in
+                auth.login_user(user)
             flash('Profile updated successfully!', 'success')
             return redirect(url_for('profile'))
         
-        # Compute lightweight context for display
-        habits = Habit.query.order_by(Habit.created_at.desc()).all()
-        recent_logs = HabitLog.query.order_by(HabitLog.timestamp.desc()).limit(5).all()
-        # Simple streak calculation: longest consecutive days for now is placeholder
-        streak = 0
-        return render_template('profile.html', user=user, habits=habits, recent=recent_logs, streak=streak)
+        # Only the account itself is read here; the progress and activity
+        # cards come from the fragment cache or load from the endpoints below
+        return render_template('profile.html', user=user)
+
+    @app.route('/profile/habits')
+    def profile_habits():
+        # "Your Progress": habit count and streak, built once per data version
+        user_id = auth.current_user_id()
+
+        def build():
+            habit_count = db.session.query(func.count(Habit.id)).filter(Habit.user_id == user_id, Habit.deleted_at.is_(None)).scalar()
+            recent_count = len(log_rows(user_id).with_entities(HabitLog.id).order_by(HabitLog.timestamp.desc()).limit(5).all())
+            streak = current_streak(user_id)
+            return {'habit_count': habit_count, 'streak': streak, 'recent_count': recent_count,
+                    'html': render_template('_profile_progress.html', habit_count=habit_count, streak=streak, recent_count=recent_count)}
+        return jsonify(cache.fragment('profile-habits', user_id, build))
+
+    @app.route('/profile/recent')
+    def profile_recent():
+        # "Recent Activity": the five newest check-ins, built once per data version
+        user_id = auth.current_user_id()
+
+        def build():
+            recent = log_rows(user_id).order_by(HabitLog.timestamp.desc()).limit(5).all()
+            return {'logs': [{'id': l.id, 'habit_id': l.habit_id, 'habit_name': l.habit_name, 'timestamp': l.timestamp.isoformat()} for l in recent],
+                    'html': render_template('_profile_recent.html', recent=recent)}
+        return jsonify(cache.fragment('profile-recent', user_id, build))
 
     @app.route('/profile/picture', methods=['DELETE'])
     def delete_profile_picture():
         """Delete the current user's profile picture"""
-        user = User.query.first()
+        user = auth.current_user()
         if not user or not user.profile_picture:
             return jsonify({'error': 'No profile picture to delete'}), 400
         
         try:
-            # Delete the file from disk
-            upload_dir = Path('static/uploads/profile_pictures')
-            file_path = upload_dir / user.profile_picture
-            if file_path.exists():
-                file_path.unlink()  # Delete the file
-            
-            # Update the database
+            # Update the database, then delete the files (every variant, or a
+            # legacy upload) unless another account still uses them
+            old = user.profile_picture
             user.profile_picture = None
             user.updated_at = datetime.now(timezone.utc)
             db.session.commit()
+            avatars.release(old, app.config['AVATAR_DIR'])
             
             return jsonify({'status': 'deleted', 'message': 'Profile picture deleted successfully'})
         except Exception as e:
             print(f"Error deleting profile picture: {e}")
             return jsonify({'error': 'Failed to delete profile picture'}), 500
 
+    @app.route('/avatars/<name>')
+    def avatar(name):
+        # Content-hashed names never change meaning, so clients may cache forever
+        if not avatars.NAME_RE.match(name):
+            abort(404)
+        resp = send_from_directory(app.config['AVATAR_DIR'], name, max_age=31536000)
+        resp.headers['Cache-Control'] = avatars.IMMUTABLE
+        return resp
+
     @app.route('/streaks')
     def streaks():
-        # Provide simple items for UI cards
-        # In future, replace with real analytics
+        # One read of the materialized summaries (one row per habit)
+        user_id = auth.current_user_id()
+        rows = streak_engine.streak_rows(user_id)
+        best = max(rows, key=lambda r: (r[0].longest_streak, r[0].total_count), default=None)
+        today = localdates.today(user_id)
         streak_items = [
-            {'title': 'Longest Streak', 'value': '0', 'note': 'Long term best'},
-            {'title': 'Current Streak', 'value': '0', 'note': 'Active days'},
-            {'title': 'Best Habit', 'value': '—', 'note': 'Most consistent'}
+            {'title': 'Longest Streak', 'value': str(max((r[0].longest_streak for r in rows), default=0)), 'note': 'Long term best'},
+            {'title': 'Current Streak', 'value': str(max((streak_engine.active_streak(r[0], today) for r in rows), default=0)), 'note': 'Active days'},
+            {'title': 'Best Habit', 'value': best[1] if best else '—', 'note': 'Most consistent'}
         ]
-        return render_template('streaks.html', streak_items=streak_items)
+        # Per-habit year figures are bit operations on one bitmap row each
+        year = bitmaps.heatmap(user_id, today.year, today)
+        return render_template('streaks.html', streak_items=streak_items, year=year)
 
     @app.route('/graph')
     def graph():
-        return render_template('graph.html')
+        # Read from the year bitmaps (one 46-byte row per habit and year), not raw logs
+        user_id = auth.current_user_id()
+        window = 30
+        today = localdates.today(user_id)
+        habit_count = db.session.query(func.count(Habit.id)).filter(Habit.user_id == user_id, Habit.deleted_at.is_(None)).scalar()
+        # Six extra days so the first rolling 7-day value covers a full week
+        done = bitmaps.completed_per_day(user_id, today - timedelta(days=window + 5), today)
+        completion = done / habit_count if habit_count else done.astype(float)
+        rolling = analytics.rolling_mean(completion, 7)[-window:]
+        by_weekday = bitmaps.weekday_totals(user_id)
+        peak = max(int(by_weekday.max()), 1)
+        return render_template(
+            'graph.html',
+            window=window,
+            daily_points=analytics.sparkline(completion[-window:]) if by_weekday.any() else '',
+            rolling_points=analytics.sparkline(rolling),
+            latest=rolling[-1],
+            weekdays=[(name[:3], int(n), int(n) * 100 // peak) for name, n in zip(analytics.WEEKDAYS, by_weekday)],
+        )
+
+    @app.route('/heatmap/<int:year>')
+    def heatmap(year):
+        # Every habit's year as a base64 366-bit bitmap (bit n = day n + 1)
+        # with streak and consistency figures: one small payload per year
+        if not 1 <= year <= 9999:
+            return jsonify({'error': 'Invalid year'}), 400
+        user_id = auth.current_user_id()
+        return jsonify(bitmaps.heatmap(user_id, year, localdates.today(user_id)))
 
     @app.route('/insights')
     def insights():
-        # Placeholder insights - replace with analytic engine later
-        insights = [
-            {'title': 'Try a 7-day streak', 'body': 'Set a small daily goal to build momentum.'},
-            {'title': 'Wear a reminder', 'body': 'Set a phone alarm or calendar reminder.'}
-        ]
+        insights = analytics.insights(analytics.summary(auth.current_user_id()))
+        if not insights:
+            # Starter tips until there is activity to analyse
+            insights = [
+                {'title': 'Try a 7-day streak', 'body': 'Set a small daily goal to build momentum.'},
+                {'title': 'Wear a reminder', 'body': 'Set a phone alarm or calendar reminder.'}
+            ]
         return render_template('insights.html', insights=insights)
 
     @app.route('/settings', methods=['GET', 'POST'])
+    @dbtuning.retry_on_locked
     def settings():
-        # No persistent save yet; UI shows form that can be wired later
-        return render_template('settings.html')
+        # Only the timezone is persisted so far; the other fields are placeholders
+        if request.method == 'POST':
+            name = (text_fields('timezone') or [''])[0].strip()
+            if not localdates.is_valid_timezone(name):
+                if request.is_json:
+                    return jsonify({'error': 'Unknown timezone'}), 400
+                flash('Unknown timezone', 'error')
+                return redirect(url_for('settings'))
+
+            user = auth.current_user()
+            changed = name != user.timezone
+            if changed:
+                user.timezone = name
+                # Every one of this user's logs may move to another local day:
+                # recompute them in batches (evicting the cached days that
+                # move), then the streaks that are built on those days
+                migrations.queue_backfill('local_dates', restart=True, user_id=user.id)
+                migrations.queue_backfill('streaks', restart=True, user_id=user.id)
+            db.session.commit()
+            if changed:
+                dispatch_backfills(app)
+            if request.is_json:
+                return jsonify({'timezone': name, 'recomputing': changed})
+            flash('Settings saved', 'success')
+            return redirect(url_for('settings'))
+
+        return render_template('settings.html', timezone=localdates.timezone_name(auth.current_user_id()),
+                               common_timezones=localdates.COMMON_TIMEZONES)
 
     @app.route('/help')
     def help_page():
         return render_template('help.html')
 
+    @app.route('/events')
+    def event_stream():
+        # Server-Sent Events: the user's deltas as they commit. Resolve the
+        # user now; the generator runs after the request context (and its
+        # database session) is gone, so an idle stream holds no connection.
+        broker = events.get_broker(app)
+        # The browser sends Last-Event-ID on its own reconnects; pages that
+        # reconnect by hand after a refusal pass it as ?last_event_id=
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        if last_event_id is None:
+            last_event_id = request.args.get('last_event_id', type=int)
+        sub = broker.subscribe(auth.current_user_id(), last_event_id)
+        if sub is None:
+            # Every stream holds a worker thread; past the user's share, refuse rather than starve other
+            # requests. A closed tab's slot frees at its next heartbeat, so suggest retrying after one
+            retry = str(int(app.config['EVENTS_HEARTBEAT']) + 1)
+            return jsonify({'error': 'too many open event streams, retry shortly'}), 503, {'Retry-After': retry}
+        return Response(events.stream(broker, sub, app.config['EVENTS_HEARTBEAT']), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
     @app.route('/calendar')
     def calendar_page():
-        now = datetime.now(timezone.utc)
-        return render_template('calendar_page.html', url=url_for('calendar_month', year=now.year, month=now.month))
+        now = localdates.today(auth.current_user_id())
+        return render_template('calendar_page.html', url=url_for('calendar_month', year=now.year, month=now.month),
+                               year=now.year, month=now.month, month_name=calendar.month_name[now.month])
+
+
+def register_commands(app):
+    @app.cli.command('rebuild-streaks')
+    def rebuild_streaks():
+        """Recompute every habit's streak summary from HabitLog."""
+        count = streak_engine.rebuild_all()
+        print(f'Rebuilt streaks for {count} habits')
+
+    @app.cli.command('rollup-catch-up')
+    def rollup_catch_up():
+        """Fold HabitLog rows newer than the rollup watermark into habit_daily."""
+        scanned = rollups.catch_up()
+        print(f'Rolled up {scanned} habit logs (watermark {rollups.get_watermark()})')
+
+    @app.cli.command('backfill')
+    def backfill():
+        """Run queued data backfills to completion in committed chunks."""
+        done = migrations.run_backfills(app.config['BACKFILL_CHUNK_SIZE'])
+        print(f'Backfills complete: {done or "nothing pending"}')
+
+    @app.cli.command('assets-build')
+    @click.option('--out', default=None, help='Output directory (default: static/dist)')
+    def assets_build(out):
+        """Write fingerprinted assets with .gz/.br siblings and a manifest, for a front proxy."""
+        manifest, files = assets.build(app.static_folder)
+        out = out or os.path.join(app.static_folder, 'dist')
+        assets.write(manifest, files, out)
+        print(f'Wrote {len(files)} assets to {out}')
 
 
 def create_app(test_config=None):
     app = Flask(__name__)
-    app.secret_key = app.config.get('SECRET_KEY', 'dev-secret-key-change-in-production')
     if test_config:
         app.config.update(test_config)
+    # Flask pre-seeds SECRET_KEY with None, so fall back explicitly
+    app.secret_key = app.config.get('SECRET_KEY') or os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     init_extensions(app)
+    auth.init_app(app)
+    events.init_app(app)
     register_routes(app)
+    register_commands(app)
+    assets.init_app(app)
+    instrumentation.init_app(app)
     return app
 
 # The instance of our app for local running
@@ -0,0 +1,130 @@
+# assets.py — fingerprinted, precompressed static assets
+# At startup every CSS/JS/SVG file under static/ is read once, renamed with a
+# hash of its content (css/style.<hash>.css) and compressed with gzip (and
+# Brotli when the `brotli` package is installed). url_for('static', ...) is
+# rewritten to the hashed name, and those names are served from memory with
+# an immutable Cache-Control plus Vary: Accept-Encoding, so repeat page views
+# fetch no assets at all. `flask assets-build` writes the same files to disk
+# for a front proxy (e.g. nginx gzip_static/brotli_static).
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+EXTENSIONS = {'.css', '.js', '.svg'}
+SKIP_DIRS = {'uploads', 'dist'}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class Asset:
+    """One fingerprinted file: its mimetype and body per content-coding."""
+
+    def __init__(self, name, data):
+        self.name = name
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.etag = name.rsplit('.', 2)[-2]
+        self.bodies = {'identity': data}
+        compressed = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressed['br'] = brotli.compress(data, quality=11)
+        # Keep only encodings that actually save bytes
+        for coding, body in compressed.items():
+            if len(body) < len(data):
+                self.bodies[coding] = body
+
+    def negotiate(self, accept_encodings):
+        for coding in ('br', 'gzip'):
+            if coding in self.bodies and accept_encodings[coding]:
+                return coding
+        return 'identity'
+
+
+def fingerprint(path, data):
+    stem, ext = os.path.splitext(path)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def _sources(static_folder):
+    for root, dirs, names in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS)
+        for name in sorted(names):
+            if os.path.splitext(name)[1] in EXTENSIONS:
+                full = os.path.join(root, name)
+                yield os.path.relpath(full, static_folder).replace(os.sep, '/'), full
+
+
+_built = {}
+
+
+def build(static_folder):
+    """
+    Read and fingerprint every asset. Returns (manifest {path: hashed},
+    {hashed: Asset}). Reused while no file's size or mtime has changed, so
+    several apps in one process compress each asset only once.
+    """
+    sources = list(_sources(static_folder))
+    signature = tuple((path, os.stat(full).st_mtime_ns, os.stat(full).st_size) for path, full in sources)
+    cached = _built.get(static_folder)
+    if cached and cached[0] == signature:
+        return cached[1]
+    manifest, files = {}, {}
+    for path, full in sources:
+        with open(full, 'rb') as fh:
+            data = fh.read()
+        hashed = fingerprint(path, data)
+        manifest[path] = hashed
+        files[hashed] = Asset(hashed, data)
+    _built[static_folder] = (signature, (manifest, files))
+    return manifest, files
+
+
+def write(manifest, files, out_dir):
+    """Write hashed files plus .gz/.br siblings and manifest.json under `out_dir`."""
+    suffixes = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+    for hashed, asset in files.items():
+        target = os.path.join(out_dir, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        for coding, body in asset.bodies.items():
+            with open(target + suffixes[coding], 'wb') as fh:
+                fh.write(body)
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+
+
+def serve(asset):
+    coding = asset.negotiate(request.accept_encodings)
+    resp = Response(asset.bodies[coding], mimetype=asset.mimetype)
+    if coding != 'identity':
+        resp.headers['Content-Encoding'] = coding
+    resp.headers['Cache-Control'] = IMMUTABLE
+    resp.headers['Vary'] = 'Accept-Encoding'
+    resp.set_etag(f'{asset.etag}-{coding}')
+    return resp.make_conditional(request)
+
+
+def init_app(app):
+    """Fingerprint static/ and route url_for('static') through the hashed names (ASSETS_FINGERPRINT)."""
+    if not app.config.get('ASSETS_FINGERPRINT', True) or not app.static_folder:
+        return
+    manifest, files = build(app.static_folder)
+    app.extensions['assets'] = (manifest, files)
+    plain_static = app.view_functions['static']
+
+    @app.url_defaults
+    def hashed_static_url(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    def static(filename):
+        asset = files.get(filename)
+        return serve(asset) if asset is not None else plain_static(filename=filename)
+
+    app.view_functions['static'] = static
@@ -0,0 +1,76 @@
+# auth.py — session login and the current user
+# Every route scopes its queries with current_user_id(). A signed-in user is
+# read from the session (one primary-key lookup per request, kept on g).
+# With AUTH_REQUIRED off (the default, matching the original single-user
+# app) anonymous requests act as the first account, created on demand, but
+# only until some account has a password: from then on anyone could take that
+# account over, so login is required as if AUTH_REQUIRED were set.
+# The login/register/logout routes live in app.py.
+from flask import current_app, g, jsonify, redirect, request, session, url_for
+
+from models import db, User
+
+# Endpoints reachable without signing in when AUTH_REQUIRED is set
+PUBLIC_ENDPOINTS = {'login', 'logout', 'register', 'static', 'avatar', 'help_page', 'metrics'}
+
+
+def default_user():
+    """The single-user account: the first profile, created on first use."""
+    user = User.query.order_by(User.id).first()
+    if not user:
+        user = User(email='user@example.com', display_name='Your Name')
+        db.session.add(user)
+        db.session.commit()
+    return user
+
+
+def login_required():
+    """AUTH_REQUIRED, or implied once any account has a password (never unset, so remembered per process)."""
+    if current_app.config['AUTH_REQUIRED'] or current_app.extensions.get('auth_passwords_set'):
+        return True
+    if db.session.query(User.id).filter(User.password.isnot(None)).first() is None:
+        return False
+    current_app.extensions['auth_passwords_set'] = True
+    return True
+
+
+def current_user():
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        user = db.session.get(User, user_id) if user_id else None
+        if user is None and not login_required():
+            user = default_user()
+        g.current_user = user
+    return g.current_user
+
+
+def current_user_id():
+    user = current_user()
+    return user.id if user else None
+
+
+def login_user(user):
+    # Fresh session on login, so a pre-login session cannot be reused
+    session.clear()
+    session['user_id'] = user.id
+    g.current_user = user
+
+
+def logout_user():
+    session.clear()
+    g.pop('current_user', None)
+
+
+def init_app(app):
+    app.config.setdefault('AUTH_REQUIRED', False)
+    app.config.setdefault('SESSION_COOKIE_SAMESITE', 'Lax')
+
+    @app.before_request
+    def require_login():
+        if request.endpoint in PUBLIC_ENDPOINTS or not login_required():
+            return None
+        if current_user() is None:
+            if request.method != 'GET' or request.is_json or request.accept_mimetypes.best == 'application/json':
+                return jsonify({'error': 'login required'}), 401
+            return redirect(url_for('login', next=request.path))
+        return None
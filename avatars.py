@@ -0,0 +1,132 @@
+# avatars.py — profile picture pipeline
+# An upload is decoded once and written as small square variants (64px and
+# 256px, WebP plus a JPEG fallback) named after a hash of the owner's id and
+# the source bytes, so two users uploading the same image never share files.
+# Names change whenever the picture does, so /avatars/<name> can be served
+# with an immutable, year-long Cache-Control. User.profile_picture holds the
+# hash key; older rows hold a plain filename of an unprocessed upload.
+import hashlib
+import io
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from models import db, User
+
+SIZES = (64, 256)
+# extension -> (Pillow format, save options)
+FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 4}), 'jpg': ('JPEG', {'quality': 85, 'optimize': True})}
+KEY_RE = re.compile(r'^[0-9a-f]{16}$')
+NAME_RE = re.compile(r'^[0-9a-f]{16}-(?:%s)\.(?:%s)$' % ('|'.join(map(str, SIZES)), '|'.join(FORMATS)))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+_executor_lock = threading.Lock()
+
+
+def sniff(file):
+    """Error message if the upload is not an image Pillow can read ('' if fine). Reads the header only."""
+    try:
+        with Image.open(file) as img:
+            img.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        return "Only image files are allowed"
+    finally:
+        file.seek(0)
+    return ""
+
+
+def is_processed(value):
+    return bool(value) and bool(KEY_RE.match(value))
+
+
+def filename(key, size, ext):
+    return f'{key}-{size}.{ext}'
+
+
+def variants(value, size=max(SIZES)):
+    """{ext: filename} of one size for a processed picture, or None (template helper)."""
+    if not is_processed(value):
+        return None
+    return {ext: filename(value, size, ext) for ext in FORMATS}
+
+
+def render(data, directory, user_id):
+    """Decode `data` once and write every variant into `directory`. Returns the key."""
+    key = hashlib.sha256(f'{user_id}:'.encode() + data).hexdigest()[:16]
+    with Image.open(io.BytesIO(data)) as img:
+        # JPEGs can be decoded at a reduced scale straight away
+        img.draft('RGB', (max(SIZES), max(SIZES)))
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        square = ImageOps.fit(img, (max(SIZES), max(SIZES)), Image.LANCZOS)
+    os.makedirs(directory, exist_ok=True)
+    for size in SIZES:
+        variant = square if size == max(SIZES) else square.resize((size, size), Image.LANCZOS)
+        for ext, (fmt, options) in FORMATS.items():
+            path = os.path.join(directory, filename(key, size, ext))
+            if os.path.exists(path):
+                continue  # same source, same bytes
+            tmp = f'{path}.{threading.get_ident()}.tmp'
+            variant.save(tmp, fmt, **options)
+            os.replace(tmp, path)
+    return key
+
+
+def remove(value, directory):
+    """Delete the files behind a stored profile_picture value (key or legacy filename)."""
+    if not value:
+        return
+    names = [filename(value, s, e) for s in SIZES for e in FORMATS] if is_processed(value) else [os.path.basename(value)]
+    for name in names:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+def release(value, directory):
+    """
+    Remove a picture's files once no user refers to them any more (call after
+    the owner's profile_picture changed); keys shared before they were
+    per user stay while someone still uses them.
+    """
+    if value and db.session.query(User.id).filter(User.profile_picture == value).first() is None:
+        remove(value, directory)
+
+
+def apply_upload(user_id, data, directory):
+    """Render the variants, point the user at them and drop the previous picture's files."""
+    try:
+        key = render(data, directory, user_id)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as exc:
+        print(f"Error processing profile picture: {exc}")
+        return None
+    user = db.session.get(User, user_id)
+    old = user.profile_picture
+    user.profile_picture = key
+    db.session.commit()
+    if old != key:
+        release(old, directory)
+    return key
+
+
+def submit(app, user_id, data):
+    """Process an upload as AVATAR_MODE says: 'inline' or on the worker thread."""
+    directory = app.config['AVATAR_DIR']
+    if app.config['AVATAR_MODE'] == 'inline':
+        return apply_upload(user_id, data, directory)
+
+    def job():
+        with app.app_context():
+            try:
+                apply_upload(user_id, data, directory)
+            finally:
+                db.session.remove()
+
+    with _executor_lock:
+        executor = app.extensions.get('avatar_worker')
+        if executor is None:
+            executor = app.extensions['avatar_worker'] = ThreadPoolExecutor(max_workers=1, thread_name_prefix='avatars')
+    return executor.submit(job)
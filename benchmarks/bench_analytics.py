@@ -0,0 +1,49 @@
+"""
+Time the vectorized analytics over synthetic log columns.
+
+    python benchmarks/bench_analytics.py --logs 1000000 --habits 50 --timezone Europe/Berlin
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics  # noqa: E402
+
+
+def synthetic_columns(logs, habits, years, seed=0):
+    rng = np.random.default_rng(seed)
+    end = int(np.datetime64('2026-01-01', 's').astype(np.int64))
+    ts = end - rng.integers(0, years * 365 * analytics.SECONDS_PER_DAY, logs)
+    mood = rng.integers(1, 11, logs).astype(np.float64)
+    mood[rng.random(logs) < 0.3] = np.nan
+    return analytics.LogColumns(np.sort(ts), rng.integers(1, habits + 1, logs), mood)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--logs', type=int, default=1_000_000)
+    parser.add_argument('--habits', type=int, default=50)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--timezone', default='UTC', help='IANA zone the days and hours are bucketed in')
+    args = parser.parse_args()
+
+    cols = synthetic_columns(args.logs, args.habits, args.years)
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        analytics.compute(cols, args.habits, today=date(2026, 1, 1), zone=ZoneInfo(args.timezone))
+        timings.append(time.perf_counter() - started)
+    best, median = min(timings), sorted(timings)[len(timings) // 2]
+    print(f'compute() over {args.logs:,} logs ({args.timezone}): best {best * 1000:.1f} ms, median {median * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
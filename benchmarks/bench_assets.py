@@ -0,0 +1,76 @@
+"""
+Bytes and requests per page view, plain static files versus fingerprinted assets.
+
+A "cold" view fetches the page and every asset it links; a "warm" view
+repeats it the way a browser would, revalidating assets that are not marked
+immutable (If-None-Match / If-Modified-Since) and skipping those that are.
+
+    python benchmarks/bench_assets.py --pages / /profile /streaks
+"""
+import argparse
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+
+ASSET_RE = re.compile(r'(?:href|src)="(/static/[^"]+)"')
+ACCEPT = {'Accept-Encoding': 'br, gzip'}
+
+
+def wire_bytes(resp):
+    """Body plus header bytes, as an approximation of what crosses the wire."""
+    return len(resp.data) + sum(len(k) + len(v) + 4 for k, v in resp.headers.items())
+
+
+def page_view(client, path, cache):
+    """Fetch `path` and its assets through a tiny browser cache. Returns (bytes, requests)."""
+    resp = client.get(path, headers=ACCEPT)
+    total, requests = wire_bytes(resp), 1
+    for url in ASSET_RE.findall(resp.get_data(as_text=True)):
+        cached = cache.get(url)
+        if cached is not None and 'immutable' in cached.headers.get('Cache-Control', ''):
+            continue  # served from the browser cache, no request at all
+        headers = dict(ACCEPT)
+        if cached is not None:
+            if cached.headers.get('ETag'):
+                headers['If-None-Match'] = cached.headers['ETag']
+            if cached.headers.get('Last-Modified'):
+                headers['If-Modified-Since'] = cached.headers['Last-Modified']
+        asset = client.get(url, headers=headers)
+        total += wire_bytes(asset)
+        requests += 1
+        if asset.status_code == 200:
+            cache[url] = asset
+    return total, requests
+
+
+def measure(fingerprint, pages):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+                      'ASSETS_FINGERPRINT': fingerprint})
+    client = app.test_client()
+    cache = {}
+    results = {}
+    for path in pages:
+        results[path] = (page_view(client, path, cache), page_view(client, path, cache))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--pages', nargs='+', default=['/', '/profile', '/streaks'])
+    args = parser.parse_args()
+
+    # Later pages reuse the cache filled by earlier ones, like a browsing session
+    before, after = measure(False, args.pages), measure(True, args.pages)
+    print(f'{"page":12s} {"":6s} {"before bytes/reqs":>20s} {"after bytes/reqs":>20s}')
+    for path in args.pages:
+        for label, index in (('cold', 0), ('warm', 1)):
+            (b_bytes, b_reqs), (a_bytes, a_reqs) = before[path][index], after[path][index]
+            print(f'{path:12s} {label:6s} {b_bytes:>14,d} / {b_reqs:<3d} {a_bytes:>14,d} / {a_reqs:<3d}')
+
+
+if __name__ == '__main__':
+    main()
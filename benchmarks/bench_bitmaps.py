@@ -0,0 +1,62 @@
+"""
+Streaks/Graph/heatmap cost with many habits: year bitmaps versus raw logs.
+
+Builds a synthetic history with benchmarks/suite.py, then times the pages
+that read the 46-byte HabitYear rows against analytics.summary(), the
+full log scan the Graph page used before, and reports the payload size of
+GET /heatmap/<year>.
+
+    python benchmarks/bench_bitmaps.py --habits 300 --years 2
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+import analytics  # noqa: E402
+import cache  # noqa: E402
+from suite import END_DATE, build_database  # noqa: E402
+
+
+def timed(fn, repeat=10):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--habits', type=int, default=300)
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--per-day', type=int, default=1, help='check-ins per habit per day')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'bitmaps.db')
+        started = time.perf_counter()
+        info = build_database(path, args.habits, args.years, args.per_day)
+        print(f'built {info["logs"]:,} logs for {args.habits} habits in {time.perf_counter() - started:.1f}s')
+        app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+                          'RESPONSE_CACHE': cache.LRUCache(max_entries=0)})
+        client = app.test_client()
+        year = END_DATE.year - 1
+        heatmap = client.get(f'/heatmap/{year}')
+        print(f'GET /heatmap/{year}: {len(heatmap.data):,} bytes for {len(heatmap.get_json()["habits"])} habits')
+
+        with app.app_context():
+            log_scan = timed(lambda: analytics.summary(1))
+        print(f'{"graph page (bitmaps)":>28s} {timed(lambda: client.get("/graph")):>9.2f} ms')
+        print(f'{"analytics.summary (logs)":>28s} {log_scan:>9.2f} ms')
+        print(f'{"streaks page":>28s} {timed(lambda: client.get("/streaks")):>9.2f} ms')
+        print(f'{"heatmap api":>28s} {timed(lambda: client.get(f"/heatmap/{year}")):>9.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
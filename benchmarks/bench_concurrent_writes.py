@@ -0,0 +1,82 @@
+"""
+Concurrent check-in load test: commits/sec, p99 latency and lock errors for
+the default SQLite setup, DATABASE_PROFILE='production', and production with
+WRITE_MODE='queued' (group commit).
+
+    python benchmarks/bench_concurrent_writes.py --threads 16 --requests 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+SETUPS = {
+    'default': {'DATABASE_PROFILE': 'default'},
+    'production': {'DATABASE_PROFILE': 'production'},
+    'queued': {'DATABASE_PROFILE': 'production', 'WRITE_MODE': 'queued'},
+}
+
+
+def run(name, threads, requests, tmpdir):
+    app = create_app({
+        'TESTING': False,
+        'PROPAGATE_EXCEPTIONS': False,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(tmpdir, name)}.db',
+        **SETUPS[name],
+    })
+    hid = app.test_client().post('/add_habit', json={'name': 'Load'}).get_json()['id']
+    latencies, errors, lock = [], [0], threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        client = app.test_client()
+        mine, failed = [], 0
+        barrier.wait()
+        for _ in range(requests):
+            started = time.perf_counter()
+            resp = client.post('/logs', json={'habit_id': hid})
+            mine.append(time.perf_counter() - started)
+            failed += resp.status_code not in (201, 202)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    writer = app.extensions.get('log_writer')
+    if writer:
+        writer.flush()  # count only durable commits
+    elapsed = time.perf_counter() - started
+    ok = len(latencies) - errors[0]
+    print(f'{name:11s} {ok / elapsed:10.0f} commits/s  p50 {percentile(latencies, 50) * 1000:7.1f} ms  '
+          f'p99 {percentile(latencies, 99) * 1000:7.1f} ms  errors {errors[0]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=100, help='requests per thread')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name in SETUPS:
+            run(name, args.threads, args.requests, tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Compare check-in ingestion throughput: one POST /logs per row versus
+POST /logs/bulk with JSON and NDJSON bodies.
+
+    python benchmarks/bench_ingest.py --rows 5000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+
+
+def make_client(tmpdir, name):
+    # File-backed DB so each commit pays a real fsync, like production
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(tmpdir, name)}.db'})
+    client = app.test_client()
+    hid = client.post('/add_habit', json={'name': 'Bench'}).get_json()['id']
+    return client, hid
+
+
+def make_rows(hid, count):
+    start = datetime(2020, 1, 1, 7, tzinfo=timezone.utc)
+    return [{'habit_id': hid, 'timestamp': (start + timedelta(hours=6 * i)).isoformat()} for i in range(count)]
+
+
+def bench_single(client, rows):
+    for row in rows:
+        assert client.post('/logs', json=row).status_code == 201
+
+
+def bench_bulk_json(client, rows):
+    assert client.post('/logs/bulk', json=rows).get_json()['inserted'] == len(rows)
+
+
+def bench_bulk_ndjson(client, rows):
+    body = '\n'.join(json.dumps(r) for r in rows)
+    resp = client.post('/logs/bulk', data=body, content_type='application/x-ndjson')
+    assert resp.get_json()['inserted'] == len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, fn in (('single', bench_single), ('bulk_json', bench_bulk_json), ('bulk_ndjson', bench_bulk_ndjson)):
+            client, hid = make_client(tmpdir, name)
+            rows = make_rows(hid, args.rows)
+            started = time.perf_counter()
+            fn(client, rows)
+            elapsed = time.perf_counter() - started
+            print(f'{name:12s} {args.rows:8d} rows  {elapsed:8.3f}s  {args.rows / elapsed:10.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
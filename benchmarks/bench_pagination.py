@@ -0,0 +1,77 @@
+"""
+Page latency of GET /habits at increasing depth, keyset cursor versus OFFSET.
+
+    python benchmarks/bench_pagination.py --habits 200000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert  # noqa: E402
+
+from app import create_app, keyset_page  # noqa: E402
+from models import db, Habit  # noqa: E402
+import auth  # noqa: E402
+
+
+def seed(app, count):
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    with app.app_context():
+        user_id = auth.default_user().id
+        for lo in range(0, count, 10000):
+            rows = [{'name': f'Habit {i}', 'user_id': user_id, 'created_at': start + timedelta(seconds=i)}
+                    for i in range(lo, min(lo + 10000, count))]
+            db.session.execute(insert(Habit), rows)
+        db.session.commit()
+
+
+def timed(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--habits', type=int, default=100000)
+    parser.add_argument('--page-size', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(tmpdir, "pages.db")}'})
+        seed(app, args.habits)
+        client = app.test_client()
+
+        # Walk the cursor chain once, remembering the cursor at each depth
+        depths = [0, args.habits // 100, args.habits // 10, args.habits // 2, args.habits - args.page_size]
+        cursors, cursor, position = {0: None}, None, 0
+        while position < depths[-1]:
+            data = client.get(f'/habits?limit={args.page_size}' + (f'&cursor={cursor}' if cursor else '')).get_json()
+            cursor, position = data['next_cursor'], position + args.page_size
+            for depth in depths:
+                if position <= depth < position + args.page_size:
+                    cursors[depth] = cursor
+
+        print(f'{"depth":>10s} {"http ms":>10s} {"keyset ms":>10s} {"offset ms":>10s}')
+        with app.app_context():
+            for depth in depths:
+                cursor = cursors.get(depth)
+                url = f'/habits?limit={args.page_size}' + (f'&cursor={cursor}' if cursor else '')
+                http = timed(lambda: client.get(url))
+                mine = Habit.query.filter(Habit.user_id == auth.default_user().id)
+                keyset = timed(lambda: keyset_page(mine, [Habit.created_at, Habit.id], cursor, args.page_size))
+                offset = timed(lambda: mine.order_by(Habit.created_at.desc(), Habit.id.desc())
+                               .offset(depth).limit(args.page_size).all())
+                print(f'{depth:>10d} {http:>10.2f} {keyset:>10.2f} {offset:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
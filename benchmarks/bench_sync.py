@@ -0,0 +1,84 @@
+"""
+Catching up after offline check-ins: one POST /sync versus the per-request flow.
+
+A client comes back online with `--checkins` queued check-ins spread over
+`--days` days. The old flow posts each one to POST /logs and then refetches
+the touched months (calendar_month with counts) and days (day_details); the
+sync flow sends the whole queue in one POST /sync and gets back only what
+changed since its cursor. Reports requests, response bytes and wall time.
+
+    python benchmarks/bench_sync.py --checkins 200 --days 14
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+
+START = datetime(2026, 3, 1, 7, 0)
+
+
+def make_app(path):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    client = app.test_client()
+    habits = [client.post('/add_habit', json={'name': f'Habit {n}'}).get_json()['id'] for n in range(5)]
+    return client, habits
+
+
+def queued_checkins(habits, count, days, seed=0):
+    rng = random.Random(seed)
+    return [{'client_id': uuid.UUID(int=rng.getrandbits(128)).hex, 'habit_id': rng.choice(habits),
+             'timestamp': (START + timedelta(days=rng.randrange(days), minutes=rng.randrange(900))).isoformat()}
+            for _ in range(count)]
+
+
+def per_request_flow(client, checkins):
+    requests, received = 0, 0
+    for checkin in checkins:
+        resp = client.post('/logs', json={'habit_id': checkin['habit_id'], 'timestamp': checkin['timestamp']})
+        requests, received = requests + 1, received + len(resp.data)
+    days = sorted({c['timestamp'][:10] for c in checkins})
+    for month in sorted({d[:7] for d in days}):
+        year, mon = month.split('-')
+        resp = client.get(f'/calendar/{int(year)}/{int(mon)}?counts=1')
+        requests, received = requests + 1, received + len(resp.data)
+    for day in days:
+        year, mon, dom = (int(p) for p in day.split('-'))
+        resp = client.get(f'/day/{year}/{mon}/{dom}')
+        requests, received = requests + 1, received + len(resp.data)
+    return requests, received
+
+
+def sync_flow(client, checkins):
+    cursor = client.post('/sync', json={}).get_json()['cursor']
+    resp = client.post('/sync', json={'cursor': cursor, 'changes': [dict(c, op='add_log') for c in checkins]})
+    return 1, len(resp.data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--checkins', type=int, default=200)
+    parser.add_argument('--days', type=int, default=14)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        print(f'{args.checkins} queued check-ins over {args.days} days')
+        print(f'{"flow":>14s} {"requests":>9s} {"bytes":>9s} {"ms":>9s}')
+        for name, flow in (('per-request', per_request_flow), ('sync', sync_flow)):
+            client, habits = make_app(os.path.join(tmpdir, f'{name}.db'))
+            checkins = queued_checkins(habits, args.checkins, args.days)
+            started = time.perf_counter()
+            requests, received = flow(client, checkins)
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f'{name:>14s} {requests:>9d} {received:>9,d} {elapsed:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Per-user route latency as the number of tenants grows.
+
+Builds one database per tenant count, every tenant with the same synthetic
+history, then signs in as one of them and times the user-scoped routes with
+the response cache disabled. With every query on a (user_id, ...) index the
+p50 columns should stay flat while the table grows by orders of magnitude.
+
+    python benchmarks/bench_tenants.py --tenants 1 10 100 1000 --habits 5 --days 120
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+import cache  # noqa: E402
+import rollups  # noqa: E402
+import streaks  # noqa: E402
+from suite import percentile  # noqa: E402
+
+END_DATE = date(2026, 1, 1)
+
+
+def build_database(path, tenants, habits, days, per_day, seed=0):
+    """Schema through the app, then `tenants` users with identical histories via executemany."""
+    create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    rng = random.Random(seed)
+    start = END_DATE - timedelta(days=days)
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO user (id, email, timezone) VALUES (?, ?, 'UTC')",
+                     [(u, f'user{u}@example.com') for u in range(1, tenants + 1)])
+    conn.executemany('INSERT INTO habit (id, user_id, name, created_at) VALUES (?, ?, ?, ?)',
+                     [((u - 1) * habits + h, u, f'Habit {h}', f'{start.isoformat()} 00:00:00.000000')
+                      for u in range(1, tenants + 1) for h in range(1, habits + 1)])
+
+    def rows():
+        for u in range(1, tenants + 1):
+            for offset in range(days):
+                day = (start + timedelta(days=offset)).isoformat()
+                for h in range(1, habits + 1):
+                    for _ in range(per_day):
+                        ts = f'{day} {rng.randrange(6, 23):02d}:{rng.randrange(60):02d}:00.000000'
+                        yield (u - 1) * habits + h, u, day, day, ts, rng.randint(1, 10)
+
+    conn.executemany('INSERT INTO habit_log (habit_id, user_id, date, local_date, timestamp, mood_score) '
+                     'VALUES (?, ?, ?, ?, ?, ?)', rows())
+    conn.commit()
+    conn.close()
+    return start
+
+
+def routes(start, days, rng):
+    def random_day():
+        return start + timedelta(days=rng.randrange(days))
+
+    return {
+        'calendar_month': lambda: '/calendar/{0.year}/{0.month}?counts=1'.format(random_day()),
+        'day_details': lambda: '/day/{0.year}/{0.month}/{0.day}'.format(random_day()),
+        'logs': lambda: '/logs?limit=50',
+        'habits': lambda: '/habits',
+        'profile': lambda: '/profile',
+        'streaks': lambda: '/streaks',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tenants', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--habits', type=int, default=5, help='habits per tenant')
+    parser.add_argument('--days', type=int, default=120, help='days of history per tenant')
+    parser.add_argument('--per-day', type=int, default=1, help='check-ins per habit per day')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for tenants in args.tenants:
+            path = os.path.join(tmpdir, f'tenants_{tenants}.db')
+            started = time.perf_counter()
+            start = build_database(path, tenants, args.habits, args.days, args.per_day)
+            app = create_app({
+                'TESTING': True,
+                'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+                'AUTH_REQUIRED': True,
+                # Measure the queries, not cache hits
+                'RESPONSE_CACHE': cache.LRUCache(max_entries=0),
+            })
+            with app.app_context():
+                rollups.catch_up()
+                streaks.rebuild_all()
+            logs = tenants * args.habits * args.days * args.per_day
+            print(f'[{tenants} tenants] built {logs:,} logs in {time.perf_counter() - started:.1f}s')
+
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['user_id'] = (tenants + 1) // 2  # a tenant in the middle of the id range
+            rng = random.Random(1)
+            results[tenants] = {}
+            for name, next_path in routes(start, args.days, rng).items():
+                latencies = []
+                for _ in range(args.requests):
+                    path_ = next_path()
+                    t0 = time.perf_counter()
+                    resp = client.get(path_)
+                    latencies.append(time.perf_counter() - t0)
+                    assert resp.status_code == 200, (path_, resp.status_code)
+                results[tenants][name] = percentile(latencies, 50) * 1000
+
+    names = list(next(iter(results.values())))
+    print(f'\n{"p50 ms":>16s}' + ''.join(f'{t:>10d}' for t in results))
+    for name in names:
+        print(f'{name:>16s}' + ''.join(f'{results[t][name]:>10.2f}' for t in results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+Repeatable load/benchmark suite for the main routes.
+
+Builds a synthetic database (habits x years x check-ins/day, with mood
+scores) using bulk inserts, then drives calendar_month, day_details,
+add_log, profile, index and delete_habit through the Flask test client
+and/or a multi-threaded WSGI server. Results (throughput, p50/p95/p99,
+SQL statements per request) are written to JSON; --baseline compares them
+with a stored run and exits non-zero on regressions.
+
+    python benchmarks/suite.py --habits 20 --years 2 --per-day 3 --out bench.json
+    python benchmarks/suite.py --baseline bench.json --threshold 0.25
+"""
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import db  # noqa: E402
+import rollups  # noqa: E402
+import streaks  # noqa: E402
+
+END_DATE = date(2026, 1, 1)
+
+
+def build_database(path, habits, years, per_day, seed=0):
+    """Create the schema through the app, then bulk-insert synthetic history."""
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    rng = random.Random(seed)
+    days = years * 365
+    start = END_DATE - timedelta(days=days)
+
+    conn = sqlite3.connect(path)
+    # Everything belongs to user 1, the account anonymous requests act as
+    conn.execute("INSERT INTO user (id, email, timezone) VALUES (1, 'bench@example.com', 'UTC')")
+    conn.executemany('INSERT INTO habit (id, user_id, name, created_at) VALUES (?, 1, ?, ?)',
+                     [(h, f'Habit {h}', f'{start.isoformat()} 00:00:{h % 60:02d}.000000') for h in range(1, habits + 1)])
+
+    def rows():
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            for habit_id in range(1, habits + 1):
+                for _ in range(per_day):
+                    ts = f'{day.isoformat()} {rng.randrange(6, 23):02d}:{rng.randrange(60):02d}:00.000000'
+                    # The default user timezone is UTC, so the local date is the UTC date
+                    yield habit_id, day.isoformat(), day.isoformat(), ts, rng.randint(1, 10)
+
+    conn.executemany('INSERT INTO habit_log (habit_id, user_id, date, local_date, timestamp, mood_score) VALUES (?, 1, ?, ?, ?, ?)', rows())
+    conn.commit()
+    conn.close()
+
+    with app.app_context():
+        rollups.catch_up()
+        streaks.rebuild_all()
+    return {'habits': habits, 'years': years, 'per_day': per_day, 'logs': habits * days * per_day, 'start': start}
+
+
+def scenarios(info, rng):
+    """name -> callable returning the next (method, path, json_body)."""
+    span = (END_DATE - info['start']).days
+    # delete_habit consumes habits from the top id down, one per request
+    deletable = itertools.count(info['habits'], -1)
+
+    def random_day():
+        return info['start'] + timedelta(days=rng.randrange(span))
+
+    return {
+        'calendar_month': lambda: ('GET', '/calendar/{0.year}/{0.month}'.format(random_day()), None),
+        'day_details': lambda: ('GET', '/day/{0.year}/{0.month}/{0.day}'.format(random_day()), None),
+        'add_log': lambda: ('POST', '/logs', {'habit_id': rng.randint(1, max(1, info['habits'] // 2)),
+                                              'timestamp': datetime.now(timezone.utc).isoformat()}),
+        'profile': lambda: ('GET', '/profile', None),
+        'index': lambda: ('GET', '/', None),
+        'delete_habit': lambda: ('POST', '/delete_habit', {'id': next(deletable)}),
+    }
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def summarize(latencies, elapsed, statements, errors):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'sql_per_request': round(statements / len(latencies), 2) if latencies else 0.0,
+    }
+
+
+class SqlCounter:
+    """Counts statements on the app's engine while active."""
+
+    def __init__(self, app):
+        self.count = 0
+        self._lock = threading.Lock()
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def run_client(app, counter, next_request, requests):
+    client = app.test_client()
+    latencies, errors = [], 0
+    counter.count = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        method, path, body = next_request()
+        t0 = time.perf_counter()
+        resp = client.open(path, method=method, json=body)
+        latencies.append(time.perf_counter() - t0)
+        errors += resp.status_code >= 400
+    return summarize(latencies, time.perf_counter() - started, counter.count, errors)
+
+
+def run_server(app, counter, next_request, requests, threads):
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    serving = threading.Thread(target=server.serve_forever, daemon=True)
+    serving.start()
+    latencies, errors, lock = [], [0], threading.Lock()
+    per_thread = max(1, requests // threads)
+
+    def worker():
+        mine, failed = [], 0
+        for _ in range(per_thread):
+            with lock:
+                method, path, body = next_request()
+            conn = http.client.HTTPConnection('127.0.0.1', server.server_port)
+            payload = json.dumps(body) if body is not None else None
+            t0 = time.perf_counter()
+            conn.request(method, path, body=payload, headers={'Content-Type': 'application/json'} if payload else {})
+            resp = conn.getresponse()
+            resp.read()
+            mine.append(time.perf_counter() - t0)
+            failed += resp.status >= 400
+            conn.close()
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    counter.count = 0
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    return summarize(latencies, elapsed, counter.count, errors[0])
+
+
+def compare(results, baseline, threshold):
+    """List regressions of `results` against `baseline` beyond `threshold` (a fraction)."""
+    regressions = []
+    for mode, routes in results['runs'].items():
+        for route, cur in routes.items():
+            old = baseline.get('runs', {}).get(mode, {}).get(route)
+            if not old:
+                continue
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+                if old[metric] and cur[metric] > old[metric] * (1 + threshold):
+                    regressions.append(f'{mode}/{route}: {metric} {old[metric]} -> {cur[metric]}')
+            if old['throughput_rps'] and cur['throughput_rps'] < old['throughput_rps'] * (1 - threshold):
+                regressions.append(f"{mode}/{route}: throughput_rps {old['throughput_rps']} -> {cur['throughput_rps']}")
+            # Cache hits make the average fractional under load; flag a whole extra query per request
+            if cur['sql_per_request'] >= old['sql_per_request'] + 1:
+                regressions.append(f"{mode}/{route}: sql_per_request {old['sql_per_request']} -> {cur['sql_per_request']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--habits', type=int, default=20)
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--per-day', type=int, default=2, help='check-ins per habit per day')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route and mode')
+    parser.add_argument('--threads', type=int, default=8, help='client threads in server mode')
+    parser.add_argument('--mode', choices=('client', 'server', 'both'), default='both')
+    parser.add_argument('--routes', nargs='*', help='subset of routes to run')
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--baseline', help='earlier results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown fraction')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    modes = ['client', 'server'] if args.mode == 'both' else [args.mode]
+    results = {'config': {k: v for k, v in vars(args).items() if k not in ('out', 'baseline')}, 'runs': {}}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for mode in modes:
+            # Fresh database per mode, since add_log/delete_habit mutate it
+            path = os.path.join(tmpdir, f'{mode}.db')
+            started = time.perf_counter()
+            info = build_database(path, args.habits, args.years, args.per_day, args.seed)
+            print(f'[{mode}] built {info["logs"]:,} logs in {time.perf_counter() - started:.1f}s')
+            app = create_app({'TESTING': False, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+            counter = SqlCounter(app)
+            rng = random.Random(args.seed)
+            routes = scenarios(info, rng)
+            # Enough habits must remain for delete_habit to keep hitting real rows
+            requests = {name: min(args.requests, info['habits'] // 2) if name == 'delete_habit' else args.requests
+                        for name in routes}
+            results['runs'][mode] = {}
+            for name, next_request in routes.items():
+                if args.routes and name not in args.routes:
+                    continue
+                if mode == 'client':
+                    stats = run_client(app, counter, next_request, requests[name])
+                else:
+                    stats = run_server(app, counter, next_request, requests[name], min(args.threads, requests[name]))
+                results['runs'][mode][name] = stats
+                print(f'[{mode}] {name:15s} {stats["throughput_rps"]:9.1f} req/s  p50 {stats["p50_ms"]:8.2f}  '
+                      f'p95 {stats["p95_ms"]:8.2f}  p99 {stats["p99_ms"]:8.2f} ms  sql/req {stats["sql_per_request"]:5.1f}  '
+                      f'errors {stats["errors"]}')
+
+    with open(args.out, 'w') as fh:
+        json.dump(results, fh, indent=2, default=str)
+    print(f'Results written to {args.out}')
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            regressions = compare(results, json.load(fh), args.threshold)
+        for line in regressions:
+            print('REGRESSION', line)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+# bitmaps.py — per-habit, per-year completion bitmaps (see models.HabitYear)
+# A habit's year is 366 bits, one per day-of-year, stored as 46 bytes. The
+# rollup writers (rollups.py) keep them in step with HabitDaily: set_day()
+# for a single new check-in, sync() after groups are recomputed. Heatmaps,
+# year streaks and consistency are then popcounts and shifts on Python ints,
+# and whole-page series are one numpy unpackbits over every habit at once.
+import base64
+import calendar
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import delete, insert, select, tuple_
+
+from models import db, Habit, HabitDaily, HabitYear
+
+BYTES = 46  # ceil(366 / 8)
+
+
+def day_index(day):
+    return day.timetuple().tm_yday - 1
+
+
+def to_int(bits):
+    return int.from_bytes(bits or b'', 'little')
+
+
+def to_bytes(value):
+    return value.to_bytes(BYTES, 'little')
+
+
+def set_day(habit_id, day):
+    """Mark one completed day in O(1) (the check-in path)."""
+    row = db.session.get(HabitYear, (habit_id, day.year))
+    if row is None:
+        row = HabitYear(habit_id=habit_id, year=day.year, bits=to_bytes(0))
+        db.session.add(row)
+    row.bits = to_bytes(to_int(row.bits) | 1 << day_index(day))
+    return row
+
+
+def sync(keys):
+    """
+    Make the bits of the (habit_id, date) groups in `keys` (a list or
+    subquery, as for rollups._replace) match HabitDaily; call after those
+    rollup groups were recomputed. Empty years are dropped.
+    """
+    pairs = set(keys) if isinstance(keys, list) else set(db.session.execute(keys).all())
+    if not pairs:
+        return
+    done = set(db.session.execute(
+        select(HabitDaily.habit_id, HabitDaily.date)
+        .where(tuple_(HabitDaily.habit_id, HabitDaily.date).in_(keys if not isinstance(keys, list) else list(pairs)))
+        .where(HabitDaily.count > 0)
+    ).all())
+    years = {(habit_id, day.year) for habit_id, day in pairs}
+    rows = {(r.habit_id, r.year): r for r in HabitYear.query.filter(tuple_(HabitYear.habit_id, HabitYear.year).in_(list(years)))}
+    values = {key: to_int(row.bits) for key, row in rows.items()}
+    for habit_id, day in pairs:
+        key, bit = (habit_id, day.year), 1 << day_index(day)
+        values[key] = values.get(key, 0) | bit if (habit_id, day) in done else values.get(key, 0) & ~bit
+    for (habit_id, year), value in values.items():
+        row = rows.get((habit_id, year))
+        if not value:
+            if row is not None:
+                db.session.delete(row)
+        elif row is None:
+            db.session.add(HabitYear(habit_id=habit_id, year=year, bits=to_bytes(value)))
+        else:
+            row.bits = to_bytes(value)
+
+
+def rebuild(habit_ids):
+    """Recompute every year of the given habits from HabitDaily."""
+    habit_ids = list(habit_ids)
+    if not habit_ids:
+        return 0
+    db.session.flush()
+    values = {}
+    for habit_id, day in db.session.execute(
+        select(HabitDaily.habit_id, HabitDaily.date).where(HabitDaily.habit_id.in_(habit_ids), HabitDaily.count > 0)
+    ):
+        values[habit_id, day.year] = values.get((habit_id, day.year), 0) | 1 << day_index(day)
+    db.session.execute(delete(HabitYear).where(HabitYear.habit_id.in_(habit_ids)))
+    if values:
+        db.session.execute(insert(HabitYear), [
+            {'habit_id': habit_id, 'year': year, 'bits': to_bytes(value)} for (habit_id, year), value in values.items()
+        ])
+    _expunge()
+    return len(values)
+
+
+def remove(habit_id):
+    """Drop every year of a habit (it is being deleted)."""
+    db.session.flush()
+    db.session.execute(delete(HabitYear).where(HabitYear.habit_id == habit_id))
+    _expunge()
+
+
+def _expunge():
+    # Core statements bypass the identity map; drop stale HabitYear objects
+    for obj in [o for o in db.session.identity_map.values() if isinstance(o, HabitYear)]:
+        db.session.expunge(obj)
+
+
+# --- Bit arithmetic on one year (a Python int) ---
+
+def longest_run(value):
+    """Longest run of consecutive set bits: x & (x >> 1) shortens every run by one."""
+    length = 0
+    while value:
+        value &= value >> 1
+        length += 1
+    return length
+
+
+def run_ending_at(value, index):
+    """Consecutive set bits ending at bit `index` (0 if that bit is clear)."""
+    zeros = ~value & ((1 << (index + 1)) - 1)
+    return index + 1 - zeros.bit_length()
+
+
+def run_back(bits_of, day):
+    """Completed days in a row ending at `day`, following the run back across New Year."""
+    total = 0
+    while True:
+        index = day_index(day)
+        run = run_ending_at(bits_of(day.year), index)
+        total += run
+        if run <= index:
+            return total
+        day = date(day.year - 1, 12, 31)
+
+
+def year_stats(value, year, today, earlier=None):
+    """
+    Check-ins, longest and current streak and consistency (share of days
+    done so far) of one year's bits as of `today`, or the year's last day for
+    past years. `earlier(year)` returns an older year's bits, so a current
+    streak can run back past January 1st.
+    """
+    last = min(today, date(year, 12, 31))
+    if last.year < year:
+        return {'count': 0, 'longest_streak': 0, 'current_streak': 0, 'consistency': 0.0}
+    index = day_index(last)
+    elapsed = value & ((1 << (index + 1)) - 1)
+
+    def bits_of(y):
+        return value if y == year else earlier(y) if earlier else 0
+
+    # Like HabitStreak: a streak stays current until a whole day is missed
+    end = last if value >> index & 1 else last - timedelta(days=1)
+    return {
+        'count': elapsed.bit_count(),
+        'longest_streak': longest_run(value),
+        'current_streak': run_back(bits_of, end),
+        'consistency': round(elapsed.bit_count() / (index + 1), 3),
+    }
+
+
+def heatmap(user_id, year, today):
+    """
+    Year-at-a-glance for every habit of a user: base64 bitmaps plus stats, from
+    two indexed reads (the habits, then their HabitYear rows for `year` and the year before).
+    """
+    habits = db.session.execute(
+        select(Habit.id, Habit.name).where(Habit.user_id == user_id, Habit.deleted_at.is_(None)).order_by(Habit.created_at, Habit.id)
+    ).all()
+    bits = {(habit_id, y): raw for habit_id, y, raw in db.session.execute(
+        select(HabitYear.habit_id, HabitYear.year, HabitYear.bits)
+        .join(Habit, Habit.id == HabitYear.habit_id)
+        .where(Habit.user_id == user_id, Habit.deleted_at.is_(None), HabitYear.year.in_([year - 1, year]))
+    )}
+
+    def earlier_years(habit_id):
+        def earlier(y):
+            # Only a streak covering all of last year needs an older row
+            if y < year - 1 and (habit_id, y) not in bits:
+                bits[habit_id, y] = db.session.scalar(select(HabitYear.bits).filter_by(habit_id=habit_id, year=y))
+            return to_int(bits.get((habit_id, y)))
+        return earlier
+
+    out = []
+    for habit_id, name in habits:
+        raw = bits.get((habit_id, year)) or to_bytes(0)
+        out.append({'habit_id': habit_id, 'name': name, 'bits': base64.b64encode(raw).decode(),
+                    **year_stats(to_int(raw), year, today, earlier_years(habit_id))})
+    return {'year': year, 'days': 366 if calendar.isleap(year) else 365, 'habits': out}
+
+
+def _user_years(user_id, *where):
+    return db.session.execute(
+        select(HabitYear.year, HabitYear.bits)
+        .join(Habit, Habit.id == HabitYear.habit_id)
+        .where(Habit.user_id == user_id, Habit.deleted_at.is_(None), *where)
+    ).all()
+
+
+def _habits_per_day(rows, year):
+    """Habits done on each day-of-year: every bitmap of `year` unpacked and summed at once."""
+    packed = np.frombuffer(b''.join(bits for y, bits in rows if y == year) or to_bytes(0), dtype=np.uint8)
+    return np.unpackbits(packed.reshape(-1, BYTES), axis=1, bitorder='little').sum(axis=0)
+
+
+def completed_per_day(user_id, start, end):
+    """Number of the user's habits completed on each day from `start` to `end` inclusive (numpy array)."""
+    rows = _user_years(user_id, HabitYear.year.between(start.year, end.year))
+    series = []
+    for year in range(start.year, end.year + 1):
+        per_day = _habits_per_day(rows, year)
+        first = day_index(start) if year == start.year else 0
+        last = day_index(end) if year == end.year else day_index(date(year, 12, 31))
+        series.append(per_day[first:last + 1])
+    return np.concatenate(series).astype(np.int64)
+
+
+def weekday_totals(user_id):
+    """Completed habit-days per weekday (Monday first) over a user's whole history."""
+    totals = np.zeros(7, dtype=np.int64)
+    rows = _user_years(user_id)
+    for year in {y for y, _ in rows}:
+        per_day = _habits_per_day(rows, year)
+        weekday = (date(year, 1, 1).weekday() + np.arange(len(per_day))) % 7
+        totals += np.bincount(weekday, weights=per_day, minlength=7).astype(np.int64)
+    return totals
@@ -0,0 +1,217 @@
+# cache.py — pluggable response cache for the read endpoints
+# Backends store small JSON-serializable dicts by string key. The in-process
+# LRU is the default; RedisCache adapts any redis-py compatible client so
+# several workers can share one cache (and one set of invalidations).
+import functools
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from flask import Response, current_app, request
+
+
+class CacheBackend:
+    """Interface every cache backend implements."""
+
+    def get(self, key):
+        """Return the stored value, or None if missing or expired."""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """Store `value` under `key`, expiring after `ttl` seconds if given."""
+        raise NotImplementedError
+
+    def delete(self, *keys):
+        """Remove the given keys; missing keys are ignored."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """Thread-safe in-process LRU with a per-entry TTL and a size bound."""
+
+    def __init__(self, max_entries=1024, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)  # evict least recently used
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCache(CacheBackend):
+    """Backend over a redis-py compatible client (get/set/delete/scan_iter)."""
+
+    def __init__(self, client, default_ttl=300, prefix='habits:'):
+        self.client = client
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, json.dumps(value), ex=ttl or None)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + k for k in keys))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+# Cache keys, one per (user, route, year, month/day)
+def index_key(user_id, signed_in=False):
+    # The page chrome differs with a session (log-out button), so each state has its own entry
+    return f'index:{user_id}' + (':session' if signed_in else '')
+
+
+def index_keys(user_id):
+    """Both variants of a user's dashboard, for invalidation."""
+    return {index_key(user_id), index_key(user_id, True)}
+
+
+def calendar_key(user_id, year, month, counts=False):
+    return f'calendar:{user_id}:{year}:{month}' + (':counts' if counts else '')
+
+
+def day_key(user_id, year, month, day):
+    return f'day:{user_id}:{year}:{month}:{day}'
+
+
+def version_key(user_id):
+    return f'version:{user_id}'
+
+
+def fragment_key(name, user_id, version):
+    return f'fragment:{name}:{user_id}:{version}'
+
+
+def keys_for_dates(user_id, dates):
+    """Every key of `user_id` whose response depends on logs from the given dates."""
+    keys = set()
+    for d in dates:
+        keys.update((calendar_key(user_id, d.year, d.month), calendar_key(user_id, d.year, d.month, True),
+                     day_key(user_id, d.year, d.month, d.day), version_key(user_id)))
+    return keys
+
+
+def get_cache():
+    return current_app.extensions['response_cache']
+
+
+def invalidate(keys):
+    """Evict exactly the given keys after a write."""
+    keys = list(keys)
+    if keys:
+        get_cache().delete(*keys)
+
+
+def data_version(user_id):
+    """
+    Opaque token for the current state of a user's habits and logs. Writes
+    evict version_key(user_id) like any other key; the next read mints a new
+    token, so fragments stored under the old one are simply never read again
+    (and age out of the LRU/TTL). A lost version can only cause a miss.
+    """
+    cache = get_cache()
+    version = cache.get(version_key(user_id))
+    if version is None:
+        version = uuid.uuid4().hex[:12]
+        cache.set(version_key(user_id), version, ttl=0)
+    return version
+
+
+def fragment(name, user_id, build):
+    """
+    The dict build() returns (typically data plus its rendered 'html'),
+    computed once per data version of `user_id` and cached until the next write.
+    """
+    cache = get_cache()
+    key = fragment_key(name, user_id, data_version(user_id))
+    entry = cache.get(key)
+    if entry is None:
+        entry = build()
+        cache.set(key, entry)
+    return entry
+
+
+def peek_fragment(name, user_id):
+    """The cached fragment for the current data version, or None; never builds it."""
+    return get_cache().get(fragment_key(name, user_id, data_version(user_id)))
+
+
+def cached_view(make_key):
+    """
+    Cache a view's 200 responses under make_key(**view_args) and serve them
+    with ETag / Last-Modified, answering 304 when the client already has them.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            key = make_key(*args, **kwargs)
+            entry = cache.get(key)
+            if entry is None:
+                resp = current_app.make_response(view(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+                body = resp.get_data(as_text=True)
+                entry = {
+                    'body': body,
+                    'mimetype': resp.mimetype,
+                    'etag': hashlib.sha1(body.encode()).hexdigest(),
+                    'last_modified': int(time.time()),
+                }
+                cache.set(key, entry)
+            resp = Response(entry['body'], mimetype=entry['mimetype'])
+            resp.set_etag(entry['etag'])
+            resp.last_modified = datetime.fromtimestamp(entry['last_modified'], timezone.utc)
+            # Let the browser (never a shared proxy: every entry is per user) keep a
+            # copy but revalidate it on every use
+            resp.cache_control.no_cache = True
+            resp.cache_control.private = True
+            return resp.make_conditional(request)
+        return wrapper
+    return decorator
@@ -0,0 +1,151 @@
+# events.py — in-process pub/sub behind the /events Server-Sent Events stream
+# Write routes publish small deltas (log/habit added or deleted) after they
+# commit; every open /events stream of that user receives them and the page
+# patches itself instead of refetching. Each subscriber has a bounded buffer:
+# one that falls behind by more than EVENTS_BUFFER events is dropped and
+# told to resync, so a slow client never holds memory or slows publishers.
+# A short per-user history lets a reconnecting client (Last-Event-ID) catch
+# up without a resync. Only streams served by this process see its events.
+# Each open stream occupies one server worker thread for as long as it lasts,
+# so a user may hold at most EVENTS_STREAMS_PER_USER of them; the server needs
+# more threads than its concurrent users times that.
+import itertools
+import json
+import queue
+import threading
+from collections import deque
+
+from flask import current_app
+
+_RESYNC = object()
+
+
+class Subscriber:
+    """One open stream: a bounded queue of (id, event, data) tuples."""
+
+    def __init__(self, user_id, buffer):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=buffer)
+        self.dropped = False
+
+    def get(self, timeout):
+        """Next event, _RESYNC once dropped, or None after `timeout` seconds of quiet."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broker:
+    """Thread-safe fan-out of per-user events to subscribers."""
+
+    def __init__(self, buffer=100, history=256, per_user=0):
+        self.buffer = buffer
+        self.history = history
+        self.per_user = per_user  # streams one user may hold open; 0 = unlimited
+        self._subscribers = {}  # user_id -> set of Subscriber
+        self._recent = {}  # user_id -> deque of (id, event, data)
+        self._trimmed = {}  # user_id -> id of the newest event pushed out of its history
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id, last_event_id=None):
+        """
+        Register a stream. With the id of the last event a client saw, the
+        events since then are queued first, or a resync if they are gone.
+        Returns None when the user already has per_user streams open.
+        """
+        sub = Subscriber(user_id, self.buffer)
+        with self._lock:
+            if self.per_user and len(self._subscribers.get(user_id, ())) >= self.per_user:
+                return None
+            self._subscribers.setdefault(user_id, set()).add(sub)
+            if last_event_id is not None:
+                missed = [e for e in self._recent.get(user_id, ()) if e[0] > last_event_id]
+                if last_event_id < self._trimmed.get(user_id, 0) or len(missed) >= self.buffer:
+                    self._drop(sub)
+                else:
+                    for item in missed:
+                        sub.queue.put_nowait(item)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.user_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.user_id]
+
+    def publish(self, user_id, event, data):
+        """Queue an event for every stream of `user_id`; returns its id."""
+        with self._lock:
+            item = (next(self._ids), event, data)
+            recent = self._recent.setdefault(user_id, deque(maxlen=self.history))
+            if len(recent) == recent.maxlen:
+                self._trimmed[user_id] = recent[0][0]
+            recent.append(item)
+            for sub in list(self._subscribers.get(user_id, ())):
+                try:
+                    sub.queue.put_nowait(item)
+                except queue.Full:
+                    self._drop(sub)
+        return item[0]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    def _drop(self, sub):
+        # Slow consumer: discard its backlog and leave only the resync marker
+        subs = self._subscribers.get(sub.user_id)
+        if subs is not None:
+            subs.discard(sub)
+        sub.dropped = True
+        with sub.queue.mutex:
+            sub.queue.queue.clear()
+        sub.queue.put_nowait(_RESYNC)
+
+
+def format_event(event_id, event, data):
+    return f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+def stream(broker, sub, heartbeat=15.0, retry_ms=3000):
+    """
+    Yield SSE text for one subscriber: queued events as they arrive and a
+    comment line every `heartbeat` seconds so dead connections are noticed.
+    Ends after a resync notice; always unsubscribes when the client goes away.
+    """
+    try:
+        yield f'retry: {retry_ms}\n\n'
+        while True:
+            item = sub.get(heartbeat)
+            if item is None:
+                yield ': keepalive\n\n'
+            elif item is _RESYNC:
+                yield 'event: resync\ndata: {}\n\n'
+                return
+            else:
+                yield format_event(*item)
+    finally:
+        broker.unsubscribe(sub)
+
+
+def get_broker(app):
+    return app.extensions['events']
+
+
+def publish(user_id, event, data):
+    """Publish on the current app's broker; call only after the change committed."""
+    return get_broker(current_app).publish(user_id, event, data)
+
+
+def init_app(app):
+    app.config.setdefault('EVENTS_BUFFER', 100)
+    app.config.setdefault('EVENTS_HISTORY', 256)
+    app.config.setdefault('EVENTS_HEARTBEAT', 15.0)
+    # A dashboard and a calendar tab; one user alone still leaves waitress's default four threads two
+    app.config.setdefault('EVENTS_STREAMS_PER_USER', 2)
+    app.extensions['events'] = Broker(app.config['EVENTS_BUFFER'], app.config['EVENTS_HISTORY'],
+                                      app.config['EVENTS_STREAMS_PER_USER'])
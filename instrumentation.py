@@ -0,0 +1,241 @@
+# instrumentation.py — opt-in request metrics and slow-request profiling
+# METRICS_ENABLED=True records, per route: a latency histogram, SQL statement
+# count and time (SQLAlchemy engine events), template render time and ORM
+# rows hydrated, served in Prometheus text format at /metrics.
+# PROFILE_SLOW_MS=<ms> profiles a PROFILE_SAMPLE_RATE share of requests and,
+# when one exceeds the threshold, writes a cProfile dump (.prof) and folded
+# stacks (.folded, flamegraph.pl / speedscope ready) to PROFILE_DIR.
+# One request is profiled at a time: since Python 3.12 cProfile is a
+# process-wide sys.monitoring tool, and a second enable() raises ValueError.
+import cProfile
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from flask import Response, g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class RouteStats:
+    __slots__ = ('count', 'duration_sum', 'buckets', 'sql_statements', 'sql_seconds', 'template_seconds', 'rows_hydrated')
+
+    def __init__(self):
+        self.count = 0
+        self.duration_sum = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.rows_hydrated = 0
+
+
+class Metrics:
+    """Thread-safe per-(route, method, status) aggregates."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(RouteStats)
+
+    def observe(self, route, method, status, duration, sql_statements, sql_seconds, template_seconds, rows_hydrated):
+        with self._lock:
+            stats = self._stats[(route, method, str(status))]
+            stats.count += 1
+            stats.duration_sum += duration
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    stats.buckets[i] += 1
+            stats.sql_statements += sql_statements
+            stats.sql_seconds += sql_seconds
+            stats.template_seconds += template_seconds
+            stats.rows_hydrated += rows_hydrated
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            items = sorted(self._stats.items())
+        lines = [
+            '# HELP habits_request_duration_seconds Request latency by route.',
+            '# TYPE habits_request_duration_seconds histogram',
+        ]
+        for (route, method, status), s in items:
+            labels = f'route="{route}",method="{method}",status="{status}"'
+            for bound, count in zip(LATENCY_BUCKETS, s.buckets):
+                lines.append(f'habits_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'habits_request_duration_seconds_bucket{{{labels},le="+Inf"}} {s.count}')
+            lines.append(f'habits_request_duration_seconds_sum{{{labels}}} {s.duration_sum:.6f}')
+            lines.append(f'habits_request_duration_seconds_count{{{labels}}} {s.count}')
+        for name, attr, kind, help_text in (
+            ('habits_sql_statements_total', 'sql_statements', 'counter', 'SQL statements executed while serving the route.'),
+            ('habits_sql_seconds_total', 'sql_seconds', 'counter', 'Time spent in SQL while serving the route.'),
+            ('habits_template_seconds_total', 'template_seconds', 'counter', 'Time spent rendering templates.'),
+            ('habits_rows_hydrated_total', 'rows_hydrated', 'counter', 'ORM objects loaded from query results.'),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (route, method, status), s in items:
+                value = getattr(s, attr)
+                value = f'{value:.6f}' if isinstance(value, float) else value
+                lines.append(f'{name}{{route="{route}",method="{method}",status="{status}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _current():
+    """The per-request metrics dict, or None outside an instrumented request."""
+    return g.get('_metrics') if has_request_context() else None
+
+
+def _hydrated(session, instance):
+    current = _current()
+    if current is not None:
+        current['rows_hydrated'] += 1
+
+
+_profiling = threading.Lock()
+
+
+class RequestProfiler:
+    """cProfile plus a stack sampler for the calling thread, for one request."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.profile = cProfile.Profile()
+        self.stacks = Counter()
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name='request-sampler', daemon=True)
+
+    def start(self):
+        """Begin profiling; False (and nothing started) while another request is being profiled."""
+        if not _profiling.acquire(blocking=False):
+            return False
+        try:
+            self.profile.enable()
+        except ValueError:
+            # Another profiler (a debugger, a test harness) owns the hook
+            _profiling.release()
+            return False
+        self._sampler.start()
+        return True
+
+    def stop(self):
+        self.profile.disable()
+        _profiling.release()
+        self._stop.set()
+        self._sampler.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, directory, name):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        base = directory / f'{time.strftime("%Y%m%d-%H%M%S")}-{re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_") or "root"}'
+        self.profile.dump_stats(f'{base}.prof')
+        with open(f'{base}.folded', 'w') as fh:
+            for stack, count in self.stacks.most_common():
+                fh.write(f'{stack} {count}\n')
+        return base
+
+
+def init_app(app):
+    """Register hooks and /metrics when METRICS_ENABLED or PROFILE_SLOW_MS is set."""
+    app.config.setdefault('METRICS_ENABLED', False)
+    app.config.setdefault('PROFILE_SLOW_MS', None)
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 1.0)
+    app.config.setdefault('PROFILE_DIR', 'profiles')
+    metrics_on = app.config['METRICS_ENABLED']
+    slow_ms = app.config['PROFILE_SLOW_MS']
+    if not metrics_on and slow_ms is None:
+        return None
+
+    metrics = Metrics()
+    app.extensions['metrics'] = metrics
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _sql_start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _sql_end(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['_metrics_started'].pop()
+        current = _current()
+        if current is not None:
+            current['sql_statements'] += 1
+            current['sql_seconds'] += time.perf_counter() - started
+
+    if not event.contains(Session, 'loaded_as_persistent', _hydrated):
+        # Session-class hook is process-wide, so install it once
+        event.listen(Session, 'loaded_as_persistent', _hydrated)
+
+    def _template_start(sender, template, context, **extra):
+        current = _current()
+        if current is not None:
+            current['template_started'] = time.perf_counter()
+
+    def _template_end(sender, template, context, **extra):
+        current = _current()
+        if current is not None and 'template_started' in current:
+            current['template_seconds'] += time.perf_counter() - current.pop('template_started')
+
+    before_render_template.connect(_template_start, app, weak=False)
+    template_rendered.connect(_template_end, app, weak=False)
+
+    @app.before_request
+    def _start_request():
+        g._metrics = {'started': time.perf_counter(), 'sql_statements': 0, 'sql_seconds': 0.0,
+                      'template_seconds': 0.0, 'rows_hydrated': 0}
+        if slow_ms is not None and random.random() < app.config['PROFILE_SAMPLE_RATE']:
+            profiler = RequestProfiler()
+            if profiler.start():
+                g._profiler = profiler
+
+    @app.after_request
+    def _finish_request(response):
+        current = g.pop('_metrics', None)
+        if current is None:
+            return response
+        duration = time.perf_counter() - current['started']
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.stop()
+            if duration * 1000 >= slow_ms:
+                base = profiler.dump(app.config['PROFILE_DIR'], f'{request.method}-{route}')
+                app.logger.warning('Slow request %s %s took %.1f ms; profile written to %s.prof/.folded',
+                                   request.method, request.path, duration * 1000, base)
+        if metrics_on and route != '/metrics':
+            metrics.observe(route, request.method, response.status_code, duration, current['sql_statements'],
+                            current['sql_seconds'], current['template_seconds'], current['rows_hydrated'])
+        return response
+
+    @app.teardown_request
+    def _stop_profiler(exc):
+        # after_request is skipped when a view raises; never leave a profiler running
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.stop()
+
+    if metrics_on:
+        @app.route('/metrics')
+        def metrics_endpoint():
+            return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    return metrics
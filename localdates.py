@@ -0,0 +1,76 @@
+# localdates.py — each user's timezone and the local calendar day of a log
+# Timestamps are stored as naive UTC; HabitLog.local_date is the day the
+# check-in falls on in its owner's timezone, computed once at write time so
+# calendar/day views and the daily rollup are plain index lookups on it.
+# Changing a timezone requeues that user's local_dates backfill (migrations.py).
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import or_, select, update
+
+from models import db, Habit, HabitLog, User
+
+DEFAULT_TIMEZONE = 'UTC'
+# Suggestions for the settings form; any IANA name is accepted
+COMMON_TIMEZONES = [
+    'UTC', 'America/Los_Angeles', 'America/Denver', 'America/Chicago', 'America/New_York',
+    'America/Sao_Paulo', 'Europe/London', 'Europe/Berlin', 'Europe/Moscow', 'Africa/Johannesburg',
+    'Asia/Dubai', 'Asia/Kolkata', 'Asia/Singapore', 'Asia/Tokyo', 'Australia/Sydney', 'Pacific/Auckland',
+]
+
+
+def is_valid_timezone(name):
+    if not isinstance(name, str) or not name.strip():
+        return False
+    try:
+        ZoneInfo(name.strip())
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
+
+
+def timezone_name(user_id):
+    """IANA name of a user's timezone."""
+    name = db.session.query(User.timezone).filter(User.id == user_id).scalar()
+    return name if is_valid_timezone(name) else DEFAULT_TIMEZONE
+
+
+def user_timezone(user_id):
+    return ZoneInfo(timezone_name(user_id))
+
+
+def zones(user_ids):
+    """{user_id: ZoneInfo} for several users in one query (unknown ids get the default)."""
+    user_ids = set(user_ids)
+    names = dict(db.session.query(User.id, User.timezone).filter(User.id.in_(user_ids - {None}))) if user_ids - {None} else {}
+    return {uid: ZoneInfo(names[uid] if is_valid_timezone(names.get(uid)) else DEFAULT_TIMEZONE) for uid in user_ids}
+
+
+def local_date(ts, zone):
+    """Calendar day of `ts` in `zone`; naive timestamps are UTC."""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(zone).date()
+
+
+def today(user_id):
+    """The current day in a user's timezone."""
+    return datetime.now(user_timezone(user_id)).date()
+
+
+def fill_missing(*where):
+    """
+    Set local_date and user_id on logs matching `where` that lack either,
+    i.e. rows inserted outside the app, using each habit owner's timezone.
+    """
+    rows = db.session.execute(
+        select(HabitLog.id, HabitLog.timestamp, Habit.user_id)
+        .join(Habit, Habit.id == HabitLog.habit_id)
+        .where(or_(HabitLog.local_date.is_(None), HabitLog.user_id.is_(None)), *where)
+    ).all()
+    if rows:
+        by_user = zones(uid for _, _, uid in rows)
+        db.session.execute(update(HabitLog), [
+            {'id': i, 'user_id': uid, 'local_date': local_date(ts, by_user[uid])} for i, ts, uid in rows
+        ])
+    return len(rows)
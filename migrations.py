@@ -0,0 +1,372 @@
+# migrations.py — versioned schema migrations and resumable data backfills
+# The applied schema version lives in SQLite's PRAGMA user_version, so a
+# current database costs a single pragma read at startup. Migrations only
+# change schema; anything that rewrites rows is queued as a backfill and run
+# in small committed chunks by a background thread or `flask backfill`.
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import delete, inspect, select, text, tuple_, update
+from models import db, AppState, Habit, HabitDaily, HabitLog, HabitStreak, User
+import bitmaps
+import cache
+import localdates
+import rollups
+import streaks
+import sync
+
+BACKFILL_PREFIX = 'backfill:'
+
+
+def get_version():
+    return db.session.execute(text('PRAGMA user_version')).scalar()
+
+
+def set_version(version):
+    # PRAGMA values cannot be bound parameters
+    db.session.execute(text(f'PRAGMA user_version = {int(version)}'))
+
+
+def _columns(table):
+    return {col['name'] for col in inspect(db.session.connection()).get_columns(table)}
+
+
+def queue_backfill(name, restart=False, user_id=None):
+    """
+    Mark a backfill as pending; its AppState value is the resume cursor.
+    `restart` rewinds the cursor of one that is already queued or running.
+    With `user_id` it is queued as '<name>:<user_id>' and only touches that
+    user's rows (backfills that support it: local_dates, streaks).
+    """
+    if user_id is not None:
+        name = f'{name}:{user_id}'
+    state = db.session.get(AppState, BACKFILL_PREFIX + name)
+    if state is None:
+        db.session.add(AppState(key=BACKFILL_PREFIX + name, value=''))
+    elif restart:
+        state.value = ''
+
+
+def _scope(state):
+    """User id a backfill was queued for, or None for every user."""
+    _, _, user_id = state.key[len(BACKFILL_PREFIX):].partition(':')
+    return int(user_id) if user_id else None
+
+
+# --- Migrations: schema only, each runs once in version order ---
+
+def _m001_baseline():
+    """Create missing tables and add columns older databases lack."""
+    db.create_all()
+    if 'timestamp' not in _columns('habit_log'):
+        db.session.execute(text('ALTER TABLE habit_log ADD COLUMN timestamp DATETIME'))
+        queue_backfill('log_timestamps')
+    if 'profile_picture' not in _columns('user'):
+        db.session.execute(text('ALTER TABLE user ADD COLUMN profile_picture VARCHAR(255)'))
+
+
+def _m002_indexes():
+    """create_all() skips indexes on existing tables, so build any missing ones."""
+    _create_indexes()
+
+
+def _create_indexes():
+    # Indexes on columns a later migration adds are left to that migration
+    for table in db.metadata.sorted_tables:
+        columns = _columns(table.name)
+        for index in table.indexes:
+            if all(col.name in columns for col in index.columns):
+                index.create(bind=db.session.connection(), checkfirst=True)
+
+
+def _m003_summaries():
+    """Databases with history need the daily rollup and streak summaries built."""
+    if db.session.query(HabitLog.id).first() is not None:
+        queue_backfill('rollups')
+        queue_backfill('streaks')
+
+
+def _m004_soft_delete():
+    """Habits are soft-deleted first and purged by the purge_habits backfill."""
+    if 'deleted_at' not in _columns('habit'):
+        db.session.execute(text('ALTER TABLE habit ADD COLUMN deleted_at DATETIME'))
+
+
+def _m005_local_dates():
+    """Logs are bucketed by their day in the user's timezone (localdates.py)."""
+    if 'timezone' not in _columns('user'):
+        db.session.execute(text("ALTER TABLE user ADD COLUMN timezone VARCHAR(64) NOT NULL DEFAULT 'UTC'"))
+    if 'local_date' not in _columns('habit_log'):
+        db.session.execute(text('ALTER TABLE habit_log ADD COLUMN local_date DATE'))
+    db.session.execute(text('DROP INDEX IF EXISTS ix_habit_log_habit_id_date'))
+    _create_indexes()
+    if db.session.query(HabitLog.id).filter(HabitLog.local_date.is_(None)).first() is not None:
+        queue_backfill('local_dates')
+
+
+def _m006_tenancy():
+    """
+    Habits and logs get an owner. Existing habits go to the first account
+    (created if there is none); their logs are stamped by the log_owners backfill.
+    """
+    for table in ('habit', 'habit_log'):
+        if 'user_id' not in _columns(table):
+            db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN user_id INTEGER REFERENCES user (id)'))
+    # The current user is now loaded on every request, so older user tables need every column
+    user_columns = _columns('user')
+    for column, ddl in (('display_name', 'VARCHAR(100)'), ('password', 'VARCHAR(255)'),
+                        ('created_at', 'DATETIME'), ('updated_at', 'DATETIME')):
+        if column not in user_columns:
+            db.session.execute(text(f'ALTER TABLE user ADD COLUMN {column} {ddl}'))
+    for name in ('ix_habit_log_timestamp', 'ix_habit_log_local_date_timestamp', 'ix_habit_created_at'):
+        db.session.execute(text(f'DROP INDEX IF EXISTS {name}'))
+    _create_indexes()
+    if db.session.query(Habit.id).filter(Habit.user_id.is_(None)).first() is not None:
+        owner = db.session.query(User.id).order_by(User.id).limit(1).scalar()
+        if owner is None:
+            owner = User(email='user@example.com', display_name='Your Name')
+            db.session.add(owner)
+            db.session.flush()
+            owner = owner.id
+        db.session.execute(update(Habit).where(Habit.user_id.is_(None)).values(user_id=owner))
+    if db.session.query(HabitLog.id).filter(HabitLog.user_id.is_(None)).first() is not None:
+        queue_backfill('log_owners')
+
+
+def _m007_bitmaps():
+    """Per-year completion bitmaps (bitmaps.py), built from the daily rollup."""
+    db.create_all()
+    if db.session.query(HabitDaily.habit_id).first() is not None:
+        queue_backfill('bitmaps')
+
+
+def _m008_sync():
+    """Change numbers and client ids for /sync (sync.py); existing rows are numbered by a backfill."""
+    for table, column, ddl in (('habit', 'change_seq', 'INTEGER'), ('habit_log', 'change_seq', 'INTEGER'),
+                               ('habit_log', 'client_id', 'VARCHAR(64)')):
+        if column not in _columns(table):
+            db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+    db.create_all()
+    _create_indexes()
+    if db.session.get(AppState, sync.SEQ_KEY) is None:
+        db.session.add(AppState(key=sync.SEQ_KEY, value='0'))
+    if db.session.query(Habit.id).first() is not None:
+        queue_backfill('change_seqs')
+
+
+MIGRATIONS = [_m001_baseline, _m002_indexes, _m003_summaries, _m004_soft_delete, _m005_local_dates, _m006_tenancy,
+              _m007_bitmaps, _m008_sync]
+LATEST = len(MIGRATIONS)
+
+
+def upgrade():
+    """Apply pending migrations (each in its own transaction). Returns their names."""
+    version = get_version()
+    applied = []
+    for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+        migration()
+        set_version(number)
+        db.session.commit()
+        applied.append(migration.__name__)
+        print(f'Migration: applied {migration.__name__} (schema version {number})')
+    return applied
+
+
+# --- Backfills: each call processes one chunk and returns rows handled ---
+
+def _bf_log_timestamps(state, chunk_size):
+    """Derive missing habit_log.timestamp values from the legacy date column."""
+    result = db.session.execute(text(
+        "UPDATE habit_log SET timestamp = date || ' 00:00:00.000000' "
+        "WHERE id IN (SELECT id FROM habit_log WHERE timestamp IS NULL LIMIT :n)"
+    ), {'n': chunk_size})
+    return result.rowcount
+
+
+def _bf_log_owners(state, chunk_size):
+    """Copy habit.user_id onto the next chunk of habit_log rows that lack an owner."""
+    result = db.session.execute(text(
+        'UPDATE habit_log SET user_id = (SELECT user_id FROM habit WHERE habit.id = habit_log.habit_id) '
+        'WHERE id IN (SELECT id FROM habit_log WHERE user_id IS NULL LIMIT :n)'
+    ), {'n': chunk_size})
+    return result.rowcount
+
+
+def _bf_local_dates(state, chunk_size):
+    """
+    (Re)compute habit_log.local_date for the next chunk of logs in their
+    owner's current timezone, refreshing the rollup days a log moved between.
+    Queued for every log by id, or for one user (after a timezone change)
+    by (timestamp, id) along that user's index, never reading other tenants' rows.
+    """
+    user_id = _scope(state)
+    query = select(HabitLog.id, HabitLog.habit_id, HabitLog.user_id, HabitLog.timestamp, HabitLog.local_date, HabitLog.date)
+    if user_id is None:
+        query = query.where(HabitLog.id > int(state.value or 0)).order_by(HabitLog.id)
+    else:
+        query = query.where(HabitLog.user_id == user_id).order_by(HabitLog.timestamp, HabitLog.id)
+        if state.value:
+            ts, _, log_id = state.value.rpartition('|')
+            query = query.where(tuple_(HabitLog.timestamp, HabitLog.id) > tuple_(datetime.fromisoformat(ts), int(log_id)))
+    rows = db.session.execute(query.limit(chunk_size)).all()
+    if not rows:
+        return 0
+    by_user = localdates.zones(r.user_id for r in rows)
+    changed, touched = [], {}
+    for log_id, habit_id, owner, ts, old, legacy in rows:
+        new = localdates.local_date(ts, by_user[owner])
+        if new != old:
+            changed.append({'id': log_id, 'local_date': new})
+            # Rows never bucketed by local_date were rolled up by their UTC date
+            touched.setdefault(owner, set()).update({(habit_id, old or legacy), (habit_id, new)})
+    if changed:
+        # A moved log is a change synced clients need to see
+        first = sync.reserve(len(changed))
+        for n, row in enumerate(changed):
+            row['change_seq'] = first + n
+        db.session.execute(update(HabitLog), changed)
+        rollups.refresh(set().union(*touched.values()))
+        for owner, pairs in touched.items():
+            cache.invalidate(cache.keys_for_dates(owner, {day for _, day in pairs}))
+    last = rows[-1]
+    state.value = str(last.id) if user_id is None else f'{last.timestamp.isoformat()}|{last.id}'
+    return len(rows)
+
+
+def _bf_rollups(state, chunk_size):
+    """Fold existing logs into habit_daily (rollups tracks its own watermark)."""
+    return rollups.catch_up(batch_size=chunk_size, max_batches=1)
+
+
+def _bf_streaks(state, chunk_size):
+    """Rebuild streak summaries for the next chunk of habits (of one user if scoped), by id."""
+    after, user_id = int(state.value or 0), _scope(state)
+    query = db.session.query(Habit.id).filter(Habit.id > after)
+    if user_id is not None:
+        query = query.filter(Habit.user_id == user_id)
+    habit_ids = [hid for (hid,) in query.order_by(Habit.id).limit(chunk_size)]
+    for habit_id in habit_ids:
+        streaks.rebuild_habit(habit_id)
+    if habit_ids:
+        state.value = str(habit_ids[-1])
+    return len(habit_ids)
+
+
+def _bf_bitmaps(state, chunk_size):
+    """Rebuild the year bitmaps of the next chunk of habits, by id."""
+    after = int(state.value or 0)
+    habit_ids = [hid for (hid,) in db.session.query(Habit.id).filter(Habit.id > after).order_by(Habit.id).limit(chunk_size)]
+    bitmaps.rebuild(habit_ids)
+    if habit_ids:
+        state.value = str(habit_ids[-1])
+    return len(habit_ids)
+
+
+def _bf_purge_habits(state, chunk_size):
+    """
+    Delete the next chunk of logs of a soft-deleted habit; once none are left,
+    drop its summaries and the habit row itself.
+    """
+    habit_id = db.session.scalar(Habit.deleted_ids().order_by(Habit.id).limit(1))
+    if habit_id is None:
+        return 0
+    purged = db.session.execute(text(
+        'DELETE FROM habit_log WHERE id IN (SELECT id FROM habit_log WHERE habit_id = :h LIMIT :n)'
+    ), {'h': habit_id, 'n': chunk_size}).rowcount
+    if purged < chunk_size:
+        # Check-ins that raced the delete may have recreated summary rows
+        db.session.execute(delete(HabitDaily).where(HabitDaily.habit_id == habit_id))
+        db.session.execute(delete(HabitStreak).where(HabitStreak.habit_id == habit_id))
+        bitmaps.remove(habit_id)
+        db.session.execute(delete(Habit).where(Habit.id == habit_id))
+    return purged + 1
+
+
+def _bf_change_seqs(state, chunk_size):
+    """Number the next chunk of habits, then of logs, that predate change numbers (by id)."""
+    table, _, after = (state.value or 'habit:0').partition(':')
+    model = Habit if table == 'habit' else HabitLog
+    ids = [i for (i,) in db.session.query(model.id).filter(model.id > int(after), model.change_seq.is_(None))
+           .order_by(model.id).limit(chunk_size)]
+    if not ids:
+        if table == 'habit':
+            state.value = 'habit_log:0'
+            return _bf_change_seqs(state, chunk_size)
+        return 0
+    first = sync.reserve(len(ids))
+    db.session.execute(update(model), [{'id': i, 'change_seq': first + n} for n, i in enumerate(ids)])
+    state.value = f'{table}:{ids[-1]}'
+    return len(ids)
+
+
+# Run in this order: bitmaps and streaks read the rollup, which needs local
+# dates, which need timestamps and (for the owner's timezone) log owners
+BACKFILLS = {
+    'log_timestamps': _bf_log_timestamps, 'log_owners': _bf_log_owners, 'local_dates': _bf_local_dates,
+    'rollups': _bf_rollups, 'bitmaps': _bf_bitmaps, 'streaks': _bf_streaks,
+    'purge_habits': _bf_purge_habits, 'change_seqs': _bf_change_seqs,
+}
+
+
+def pending_backfills():
+    """Queued backfill names in BACKFILLS order; per-user ones look like 'local_dates:3'."""
+    names = [k[len(BACKFILL_PREFIX):] for (k,) in db.session.query(AppState.key).filter(AppState.key.startswith(BACKFILL_PREFIX))]
+    order = {name: i for i, name in enumerate(BACKFILLS)}
+    return sorted((n for n in names if n.partition(':')[0] in order), key=lambda n: (order[n.partition(':')[0]], n))
+
+
+def run_backfills(chunk_size=1000, pause=0.0):
+    """
+    Run every pending backfill to completion, committing after each chunk so
+    write locks stay short and an interrupted run resumes where it stopped.
+    Returns {name: rows handled}.
+    """
+    done = {}
+    for name in pending_backfills():
+        total = 0
+        while True:
+            state = db.session.get(AppState, BACKFILL_PREFIX + name)
+            count = BACKFILLS[name.partition(':')[0]](state, chunk_size)
+            if not count:
+                db.session.delete(state)
+                db.session.commit()
+                break
+            db.session.commit()
+            total += count
+            if pause:
+                time.sleep(pause)
+        done[name] = total
+        print(f'Backfill: {name} finished ({total} rows)')
+    return done
+
+
+_runner_lock = threading.Lock()
+
+
+def start_backfill_thread(app):
+    """
+    Run pending backfills off the startup/request path in a daemon thread.
+    At most one runs per app; it keeps going while backfills are queued, so
+    work queued during a run is picked up without starting another thread.
+    """
+    with _runner_lock:
+        if app.extensions.get('backfill_running'):
+            return None
+        app.extensions['backfill_running'] = True
+
+    def worker():
+        with app.app_context():
+            try:
+                while True:
+                    run_backfills(app.config['BACKFILL_CHUNK_SIZE'], pause=app.config['BACKFILL_PAUSE'])
+                    with _runner_lock:
+                        if not pending_backfills():
+                            app.extensions['backfill_running'] = False
+                            return
+            finally:
+                app.extensions['backfill_running'] = False
+                db.session.remove()
+
+    thread = threading.Thread(target=worker, name='backfill', daemon=True)
+    thread.start()
+    return thread
@@ -17,11 +17,28 @@ class Habit(db.Model):
     id = db.Column(db.Integer, primary_key=True) # Unique ID for every habit
     name = db.Column(db.String(100), nullable=False) # The habit name
     created_at = db.Column(db.DateTime, default=_now_utc) # When you started it (timezone-aware)
+    # Owner; every listing is per user, newest first, hence (user_id, created_at)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    # Set by delete_habit; the habit is hidden at once and its logs are purged in the background
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    # Position in the change sequence (sync.py), bumped when the habit is written
+    change_seq = db.Column(db.Integer, nullable=True)
     
     # Relationship: This links the Habit to its Daily Logs
     # It tells Flask: "One habit can have many logs"
     logs = db.relationship('HabitLog', backref='habit', lazy=True, cascade="all, delete")
 
+    __table_args__ = (
+        db.Index('ix_habit_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_habit_user_id_change_seq', 'user_id', 'change_seq'),
+    )
+
+    @classmethod
+    def deleted_ids(cls, user_id=None):
+        """SELECT of soft-deleted habit ids (of one user if given), for excluding their not-yet-purged logs."""
+        query = db.select(cls.id).where(cls.deleted_at.is_not(None))
+        return query.where(cls.user_id == user_id) if user_id is not None else query
+
 class HabitLog(db.Model):
     """
     This table stores every time you 'Check In' to a habit.
@@ -30,19 +47,118 @@ class HabitLog(db.Model):
     # Keep a date-only column for legacy compatibility
     date = db.Column(db.Date, default=lambda: _now_utc().date(), nullable=False)
 
-    # Timestamp for the exact time of the log (used for calendar/times)
+    # Timestamp for the exact time of the log, stored as naive UTC
     timestamp = db.Column(db.DateTime, default=_now_utc, nullable=False)
 
+    # Day of the log in the user's timezone (see localdates.py); calendar,
+    # day views and the daily rollup bucket on this. NULL until backfilled.
+    local_date = db.Column(db.Date, nullable=True)
+
     # Advanced Feature: Mood tracking (1-10)
     mood_score = db.Column(db.Integer, nullable=True) 
     
     # Foreign Key: This links this log to a specific Habit ID
     habit_id = db.Column(db.Integer, db.ForeignKey('habit.id'), nullable=False)
 
+    # Owner, copied from the habit so per-user listings need no join
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+
+    # Id the client gave an offline check-in, so a resent /sync batch is not logged twice
+    client_id = db.Column(db.String(64), nullable=True)
+
+    # Position in the change sequence (sync.py); /sync returns rows past a client's cursor
+    change_seq = db.Column(db.Integer, nullable=True)
+
+    # Every user-facing read is scoped to one user: recent/exported logs by
+    # (user_id, timestamp), day views by (user_id, local_date, timestamp).
+    # (habit_id, timestamp) also serves plain habit_id lookups via its prefix.
+    __table_args__ = (
+        db.Index('ix_habit_log_user_id_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_habit_log_user_id_local_date_timestamp', 'user_id', 'local_date', 'timestamp'),
+        db.Index('ix_habit_log_habit_id_timestamp', 'habit_id', 'timestamp'),
+        db.Index('ix_habit_log_habit_id_local_date', 'habit_id', 'local_date'),
+        db.Index('ix_habit_log_user_id_change_seq', 'user_id', 'change_seq'),
+        db.Index('ix_habit_log_user_id_client_id', 'user_id', 'client_id', unique=True),
+    )
+
     def __repr__(self):
         return f"<HabitLog {self.id} habit={self.habit_id} ts={self.timestamp}>"
 
 
+class HabitDaily(db.Model):
+    """
+    Per-habit, per-day rollup of HabitLog (at most one row per habit per day).
+    Kept current by rollups.py so time-series views never read raw logs.
+    """
+    habit_id = db.Column(db.Integer, db.ForeignKey('habit.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    first_ts = db.Column(db.DateTime, nullable=True)
+    last_ts = db.Column(db.DateTime, nullable=True)
+    mood_sum = db.Column(db.Integer, default=0, nullable=False)
+    # Logs that carried a mood score, so mood_sum can be averaged
+    mood_count = db.Column(db.Integer, default=0, nullable=False)
+
+    # Month/year views filter on date across all habits
+    __table_args__ = (db.Index('ix_habit_daily_date', 'date'),)
+
+    def __repr__(self):
+        return f"<HabitDaily habit={self.habit_id} date={self.date} count={self.count}>"
+
+
+class HabitYear(db.Model):
+    """
+    A habit's completed days in one calendar year as a 366-bit bitmap
+    (bit n, least significant first, is day-of-year n + 1). Derived from
+    HabitDaily by bitmaps.py; heatmaps and year streaks are bit operations on it.
+    """
+    habit_id = db.Column(db.Integer, db.ForeignKey('habit.id'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    bits = db.Column(db.LargeBinary(46), nullable=False)
+
+    def __repr__(self):
+        return f"<HabitYear habit={self.habit_id} year={self.year}>"
+
+
+class SyncDeletion(db.Model):
+    """
+    Tombstone for a deleted log or habit, so clients syncing from an older
+    cursor learn about rows that no longer exist (see sync.py).
+    """
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(8), nullable=False)  # 'log' or 'habit'
+    row_id = db.Column(db.Integer, nullable=False)
+    client_id = db.Column(db.String(64), nullable=True)
+
+    __table_args__ = (db.Index('ix_sync_deletion_user_id_seq', 'user_id', 'seq'),)
+
+    def __repr__(self):
+        return f"<SyncDeletion {self.seq} {self.kind} {self.row_id}>"
+
+
+class AppState(db.Model):
+    """Small key/value store for bookkeeping such as job watermarks."""
+    key = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.String(255), nullable=True)
+
+
+class HabitStreak(db.Model):
+    """
+    Materialized streak summary, one row per habit with at least one log.
+    Kept in step with HabitLog by streaks.py so pages never rescan history.
+    """
+    habit_id = db.Column(db.Integer, db.ForeignKey('habit.id'), primary_key=True)
+    # Length of the run of consecutive days ending at last_date
+    current_streak = db.Column(db.Integer, default=0, nullable=False)
+    longest_streak = db.Column(db.Integer, default=0, nullable=False)
+    last_date = db.Column(db.Date, nullable=True)
+    total_count = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<HabitStreak habit={self.habit_id} current={self.current_streak} longest={self.longest_streak}>"
+
+
 class User(db.Model):
     """
     This table stores user profile information.
@@ -52,6 +168,8 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=True)
     profile_picture = db.Column(db.String(255), nullable=True)
+    # IANA zone name, e.g. 'Europe/Berlin'; decides which day a check-in counts for
+    timezone = db.Column(db.String(64), default='UTC', nullable=False)
     created_at = db.Column(db.DateTime, default=_now_utc)
     updated_at = db.Column(db.DateTime, default=_now_utc, onupdate=_now_utc)
 
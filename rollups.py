@@ -0,0 +1,126 @@
+# rollups.py — daily pre-aggregation of HabitLog (see models.HabitDaily)
+# Writers keep the rollup current in their own transaction: record_log() for
+# a single new log, refresh() for anything else (deletes, bulk inserts).
+# Both also keep the per-year completion bitmaps (bitmaps.py) in step.
+# catch_up() folds in rows written behind the app's back, tracked by a
+# HabitLog.id watermark stored in AppState.
+from datetime import timezone
+from sqlalchemy import delete, func, insert, select, tuple_
+from models import db, AppState, Habit, HabitDaily, HabitLog
+import bitmaps
+import localdates
+
+WATERMARK_KEY = 'rollup_watermark'
+
+
+def _naive_utc(ts):
+    """Match how SQLite hands DateTime values back (naive UTC)."""
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo is not None else ts
+
+
+def record_log(log):
+    """Add one new log to its (habit_id, local_date) rollup row in O(1)."""
+    ts = _naive_utc(log.timestamp)
+    row = db.session.get(HabitDaily, (log.habit_id, log.local_date))
+    if row is None:
+        row = HabitDaily(habit_id=log.habit_id, date=log.local_date, count=0, first_ts=ts, last_ts=ts, mood_sum=0, mood_count=0)
+        db.session.add(row)
+    row.count += 1
+    row.first_ts = min(row.first_ts, ts)
+    row.last_ts = max(row.last_ts, ts)
+    if log.mood_score is not None:
+        row.mood_sum += log.mood_score
+        row.mood_count += 1
+    bitmaps.set_day(log.habit_id, log.local_date)
+    return row
+
+
+def _grouped(where):
+    """SELECT producing HabitDaily rows from HabitLog rows matching `where`."""
+    return (
+        select(
+            HabitLog.habit_id,
+            HabitLog.local_date,
+            func.count(),
+            func.min(HabitLog.timestamp),
+            func.max(HabitLog.timestamp),
+            func.coalesce(func.sum(HabitLog.mood_score), 0),
+            func.count(HabitLog.mood_score),
+        )
+        .where(where)
+        .group_by(HabitLog.habit_id, HabitLog.local_date)
+    )
+
+
+def _replace(keys):
+    """Recompute the rollup rows (and their bitmap bits) whose (habit_id, date) is in `keys` (a list or subquery)."""
+    key = tuple_(HabitDaily.habit_id, HabitDaily.date)
+    db.session.execute(delete(HabitDaily).where(key.in_(keys)))
+    db.session.execute(
+        insert(HabitDaily).from_select(
+            ['habit_id', 'date', 'count', 'first_ts', 'last_ts', 'mood_sum', 'mood_count'],
+            _grouped(tuple_(HabitLog.habit_id, HabitLog.local_date).in_(keys)),
+        )
+    )
+    bitmaps.sync(keys)
+
+
+def refresh(pairs):
+    """Recompute the given (habit_id, date) groups from raw logs (set-based)."""
+    pairs = list(set(pairs))
+    if pairs:
+        db.session.flush()
+        _replace(pairs)
+        # Core statements bypass the identity map; drop stale HabitDaily objects
+        for obj in [o for o in db.session.identity_map.values() if isinstance(o, HabitDaily)]:
+            db.session.expunge(obj)
+
+
+def get_watermark():
+    state = db.session.get(AppState, WATERMARK_KEY)
+    return int(state.value) if state and state.value else 0
+
+
+def set_watermark(value):
+    state = db.session.get(AppState, WATERMARK_KEY) or AppState(key=WATERMARK_KEY)
+    state.value = str(value)
+    db.session.add(state)
+
+
+def mark_applied(first_id, last_id):
+    """
+    Advance the watermark past ids a writer just rolled up itself, provided
+    nothing before them is still pending, so catch_up() only sees stragglers.
+    """
+    if get_watermark() >= first_id - 1:
+        set_watermark(last_id)
+
+
+def catch_up(batch_size=5000, max_batches=None):
+    """
+    Fold HabitLog rows newer than the watermark into the rollup, one committed
+    batch of ids at a time (at most `max_batches` if given). Groups are
+    recomputed rather than incremented, so rows the writers already accounted
+    for are harmless. Returns rows scanned.
+    """
+    scanned = batches = 0
+    while max_batches is None or batches < max_batches:
+        batches += 1
+        low = get_watermark()
+        ids = select(HabitLog.id).where(HabitLog.id > low).order_by(HabitLog.id).limit(batch_size).subquery()
+        high, count = db.session.execute(select(func.max(ids.c.id), func.count()).select_from(ids)).one()
+        if not count:
+            return scanned
+        # Rows inserted behind the app's back have no local date or owner yet
+        localdates.fill_missing(HabitLog.id > low, HabitLog.id <= high)
+        keys = (
+            select(HabitLog.habit_id, HabitLog.local_date)
+            .where(HabitLog.id > low, HabitLog.id <= high)
+            .where(HabitLog.habit_id.not_in(Habit.deleted_ids()))
+            .distinct()
+        )
+        _replace(keys)
+        set_watermark(high)
+        db.session.commit()
+        scanned += count
+    return scanned
@@ -0,0 +1,126 @@
+# streaks.py — materialized streak summaries (see models.HabitStreak)
+# add_log/delete_log call record_checkin/remove_checkin inside their own
+# transaction, after the daily rollup (rollups.py) has been updated;
+# rebuild_all() recomputes everything in one pass over raw HabitLog.
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, insert
+from models import db, Habit, HabitDaily, HabitLog, HabitStreak
+
+
+def active_streak(row, today=None):
+    """Current streak as shown to users: 0 once a full day has been missed."""
+    if row is None or row.last_date is None:
+        return 0
+    today = today or datetime.now(timezone.utc).date()
+    return row.current_streak if row.last_date >= today - timedelta(days=1) else 0
+
+
+def _summarize(day_counts):
+    """Fold an ascending iterable of (date, count) into HabitStreak column values."""
+    current = longest = total = 0
+    last = None
+    for day, count in day_counts:
+        total += count
+        current = current + 1 if last is not None and day == last + timedelta(days=1) else 1
+        longest = max(longest, current)
+        last = day
+    return {'current_streak': current, 'longest_streak': longest, 'last_date': last, 'total_count': total}
+
+
+def rebuild_habit(habit_id):
+    """Recompute one habit's summary from its daily rollup rows."""
+    day_counts = (
+        db.session.query(HabitDaily.date, HabitDaily.count)
+        .filter(HabitDaily.habit_id == habit_id)
+        .order_by(HabitDaily.date)
+        .all()
+    )
+    row = db.session.get(HabitStreak, habit_id)
+    if not day_counts:
+        if row:
+            db.session.delete(row)
+        return None
+    if row is None:
+        row = HabitStreak(habit_id=habit_id)
+        db.session.add(row)
+    for key, value in _summarize(day_counts).items():
+        setattr(row, key, value)
+    return row
+
+
+def record_checkin(habit_id, day):
+    """Account for a new log on `day`. O(1) unless the log is backdated."""
+    row = db.session.get(HabitStreak, habit_id)
+    if row is None or row.last_date is None or day < row.last_date:
+        # First summary for this habit, or a backdated log that can join or
+        # bridge older runs; recompute from the habit's own index entries
+        return rebuild_habit(habit_id)
+
+    row.total_count += 1
+    if day == row.last_date + timedelta(days=1):
+        row.current_streak += 1
+    elif day > row.last_date:
+        row.current_streak = 1
+    row.last_date = day
+    row.longest_streak = max(row.longest_streak, row.current_streak)
+    return row
+
+
+def remove_checkin(habit_id, day):
+    """Account for a deleted log on `day` (call after the rollup is refreshed)."""
+    row = db.session.get(HabitStreak, habit_id)
+    if row is None:
+        return None
+    same_day = db.session.query(HabitDaily.count).filter(HabitDaily.habit_id == habit_id, HabitDaily.date == day).scalar()
+    if same_day:
+        # Other logs still cover this day, so only the total changes
+        row.total_count -= 1
+        return row
+    if day == row.last_date and row.current_streak > 1 and row.longest_streak > row.current_streak:
+        # Trimming the tail of a run that isn't the longest one
+        row.total_count -= 1
+        row.current_streak -= 1
+        row.last_date = day - timedelta(days=1)
+        return row
+    # Removing a day elsewhere can split any run; recompute this habit
+    return rebuild_habit(habit_id)
+
+
+def rebuild_all(batch_size=1000):
+    """
+    Recompute every summary in one linear pass over HabitLog ordered by
+    (habit_id, local_date), streamed in batches. Returns the number of habits written.
+    """
+    day_counts = (
+        db.session.query(HabitLog.habit_id, HabitLog.local_date, func.count())
+        .filter(HabitLog.habit_id.not_in(Habit.deleted_ids()), HabitLog.local_date.is_not(None))
+        .group_by(HabitLog.habit_id, HabitLog.local_date)
+        .order_by(HabitLog.habit_id, HabitLog.local_date)
+        .execution_options(yield_per=batch_size)
+    )
+    rows = []
+    current_habit, days = None, []
+    for habit_id, day, count in day_counts:
+        if habit_id != current_habit and days:
+            rows.append({'habit_id': current_habit, **_summarize(days)})
+            days = []
+        current_habit = habit_id
+        days.append((day, count))
+    if days:
+        rows.append({'habit_id': current_habit, **_summarize(days)})
+
+    db.session.query(HabitStreak).delete()
+    if rows:
+        db.session.execute(insert(HabitStreak), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def streak_rows(user_id):
+    """(HabitStreak, habit name) pairs for every habit of `user_id` that has a summary."""
+    return (
+        db.session.query(HabitStreak, Habit.name)
+        .join(Habit, Habit.id == HabitStreak.habit_id)
+        .filter(Habit.user_id == user_id)
+        .all()
+    )
@@ -0,0 +1,74 @@
+# sync.py — change sequence and deltas for the offline-first POST /sync API
+# Every write to a habit or log takes the next number(s) from one counter in
+# AppState and stores it in the row's change_seq; deletions leave a
+# SyncDeletion tombstone numbered the same way. A client keeps the highest
+# number it has seen as its cursor and asks only for what came after it.
+# Numbers are taken inside the write transaction, and SQLite allows one
+# writer at a time, so they become visible in order and a cursor never skips.
+from sqlalchemy import insert, select, update
+
+from models import db, AppState, Habit, HabitLog, SyncDeletion
+
+SEQ_KEY = 'change_seq'
+CLIENT_ID_MAX = 64
+
+
+def reserve(count=1):
+    """Take `count` consecutive change numbers in the current transaction; returns the first."""
+    last = db.session.execute(
+        update(AppState).where(AppState.key == SEQ_KEY)
+        .values(value=db.cast(db.cast(AppState.value, db.Integer) + count, db.String))
+        .returning(AppState.value)
+    ).scalar()
+    if last is None:
+        db.session.execute(insert(AppState).values(key=SEQ_KEY, value=str(count)))
+        last = count
+    return int(last) - count + 1
+
+
+def record_deletion(user_id, kind, row_id, client_id=None):
+    """Leave a tombstone for a deleted 'log' or 'habit' (caller commits)."""
+    db.session.add(SyncDeletion(seq=reserve(), user_id=user_id, kind=kind, row_id=row_id, client_id=client_id))
+
+
+def changes_since(user_id, cursor, limit):
+    """
+    The user's habits, logs and deletions numbered after `cursor`, oldest
+    first, at most `limit` in total, plus the cursor to send next time.
+    Each kind is one range read on its (user_id, seq) index.
+    """
+    habits = db.session.execute(
+        select(Habit.change_seq, Habit.id, Habit.name, Habit.created_at)
+        .where(Habit.user_id == user_id, Habit.change_seq > cursor, Habit.deleted_at.is_(None))
+        .order_by(Habit.change_seq).limit(limit)
+    ).all()
+    logs = db.session.execute(
+        select(HabitLog.change_seq, HabitLog.id, HabitLog.client_id, HabitLog.habit_id, HabitLog.timestamp,
+               HabitLog.local_date, HabitLog.mood_score)
+        .where(HabitLog.user_id == user_id, HabitLog.change_seq > cursor,
+               HabitLog.habit_id.not_in(Habit.deleted_ids(user_id)))
+        .order_by(HabitLog.change_seq).limit(limit)
+    ).all()
+    deletions = db.session.execute(
+        select(SyncDeletion.seq, SyncDeletion.kind, SyncDeletion.row_id, SyncDeletion.client_id)
+        .where(SyncDeletion.user_id == user_id, SyncDeletion.seq > cursor)
+        .order_by(SyncDeletion.seq).limit(limit)
+    ).all()
+
+    # The `limit` lowest numbers overall are all among the first `limit` of each kind
+    merged = sorted([('habit', r) for r in habits] + [('log', r) for r in logs] + [('deleted', r) for r in deletions],
+                    key=lambda item: item[1][0])
+    page = merged[:limit]
+    out = {'habits': [], 'logs': [], 'deleted': [],
+           'cursor': page[-1][1][0] if page else cursor,
+           'has_more': len(merged) > limit or limit in (len(habits), len(logs), len(deletions))}
+    for kind, r in page:
+        if kind == 'habit':
+            out['habits'].append({'id': r.id, 'name': r.name, 'created_at': r.created_at.isoformat() if r.created_at else None})
+        elif kind == 'log':
+            out['logs'].append({'id': r.id, 'client_id': r.client_id, 'habit_id': r.habit_id,
+                                'timestamp': r.timestamp.isoformat(), 'local_date': r.local_date.isoformat() if r.local_date else None,
+                                'mood_score': r.mood_score})
+        else:
+            out['deleted'].append({'type': r.kind, 'id': r.row_id, 'client_id': r.client_id})
+    return out
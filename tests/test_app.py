@@ -139,3 +139,1221 @@ def test_nav_pages():
         assert resp.status_code == 200
         assert (text.encode() in resp.data) or (text in resp.get_data(as_text=True))
 
+
+
+def _capture_sql(app):
+    """Attach a listener that records every (statement, params) the engine runs."""
+    from sqlalchemy import event
+    statements = []
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before)
+    return statements
+
+
+def _full_scans(app, statements, table='habit_log', bounded_sorts=()):
+    """
+    Return EXPLAIN QUERY PLAN rows that scan `table` without an index or sort
+    without one. Statements containing a `bounded_sorts` fragment may use a
+    temp B-tree (their input is already bounded by an index range).
+    """
+    bad = []
+    with app.app_context():
+        conn = db.session.connection()
+        for statement, params in statements:
+            if not statement.lstrip().upper().startswith('SELECT') or table not in statement:
+                continue
+            plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, params).fetchall()
+            for row in plan:
+                detail = row[-1]
+                # A bare SCAN (no index named) reads every row of the table, and a
+                # temp B-tree is a sort or DISTINCT no index serves
+                if detail == f'SCAN {table}' or (detail.startswith('USE TEMP B-TREE')
+                                                 and not any(f in statement for f in bounded_sorts)):
+                    bad.append((statement, detail))
+    return bad
+
+
+def test_habit_log_queries_use_indexes():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    client = app.test_client()
+    hid = client.post('/add_habit', json={'name': 'Indexed'}).get_json()['id']
+    client.post('/logs', json={'habit_id': hid, 'timestamp': '2026-01-21T10:00:00'})
+
+    statements = _capture_sql(app)
+    assert client.get('/calendar/2026/1').status_code == 200
+    assert client.get('/calendar/2026/1?counts=1').status_code == 200
+    assert client.get('/day/2026/1/21').status_code == 200
+    assert client.get('/profile').status_code == 200
+
+    assert statements
+    assert _full_scans(app, statements) == []
+    # The month view orders by day-of-month, which no index holds; it sorts at
+    # most one rollup row per habit per day, read from the user's (habit_id, date) ranges
+    assert _full_scans(app, statements, table='habit_daily', bounded_sorts=("STRFTIME('%d', habit_daily.date)",)) == []
+
+
+def test_indexes_built_on_existing_database(tmp_path):
+    import sqlite3
+    db_path = tmp_path / 'legacy.db'
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE habit (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, created_at DATETIME);
+        CREATE TABLE habit_log (id INTEGER PRIMARY KEY, date DATE NOT NULL, mood_score INTEGER,
+                                habit_id INTEGER NOT NULL REFERENCES habit(id));
+    """)
+    conn.close()
+
+    create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}'})
+
+    conn = sqlite3.connect(db_path)
+    names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    conn.close()
+    assert {'ix_habit_log_user_id_timestamp', 'ix_habit_log_habit_id_timestamp', 'ix_habit_user_id_created_at'} <= names
+
+
+def test_calendar_month_counts():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    client = app.test_client()
+    run = client.post('/add_habit', json={'name': 'Run'}).get_json()['id']
+    read = client.post('/add_habit', json={'name': 'Read'}).get_json()['id']
+    for hid, ts in [(run, '2026-01-03T07:00:00'), (run, '2026-01-03T19:00:00'),
+                    (read, '2026-01-03T21:00:00'), (read, '2026-01-31T22:00:00'),
+                    (run, '2026-02-01T00:00:00')]:
+        assert client.post('/logs', json={'habit_id': hid, 'timestamp': ts}).status_code == 201
+
+    data = client.get('/calendar/2026/1').get_json()
+    assert data == {'days_with_logs': [3, 31]}
+
+    data = client.get('/calendar/2026/1?counts=1').get_json()
+    assert data['days_with_logs'] == [3, 31]
+    day3, day31 = data['days']
+    assert day3['count'] == 3
+    assert {h['habit_name']: h['count'] for h in day3['habits']} == {'Run': 2, 'Read': 1}
+    assert day31 == {'day': 31, 'count': 1, 'habits': [{'habit_id': read, 'habit_name': 'Read', 'count': 1}]}
+
+
+def test_log_listings_run_fixed_query_count():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    client = app.test_client()
+
+    def count_queries(path):
+        statements = _capture_sql(app)
+        resp = client.get(path)
+        assert resp.status_code == 200
+        return len([s for s, _ in statements if s.lstrip().upper().startswith('SELECT')])
+
+    hid = client.post('/add_habit', json={'name': 'Habit 0'}).get_json()['id']
+    client.post('/logs', json={'habit_id': hid, 'timestamp': '2026-05-02T08:00:00'})
+    client.get('/profile')  # creates the default user
+    baseline = {path: count_queries(path) for path in ('/day/2026/5/2', '/profile/recent')}
+
+    # Many logs spread over many habits must not add per-log queries
+    for i in range(1, 10):
+        hid = client.post('/add_habit', json={'name': f'Habit {i}'}).get_json()['id']
+        client.post('/logs', json={'habit_id': hid, 'timestamp': f'2026-05-02T{8 + i:02d}:00:00'})
+
+    for path, expected in baseline.items():
+        assert count_queries(path) == expected, path
+    assert len(client.get('/day/2026/5/2').get_json()['logs']) == 10
+    assert 'Habit 9' in client.get('/profile/recent').get_json()['html']
+
+
+def test_streak_summaries_track_logs():
+    import random
+    import streaks
+    from datetime import date, timedelta
+    from models import HabitStreak
+
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    client = app.test_client()
+    hids = [client.post('/add_habit', json={'name': f'S{i}'}).get_json()['id'] for i in range(3)]
+
+    def snapshot():
+        with app.app_context():
+            return {r.habit_id: (r.current_streak, r.longest_streak, r.last_date, r.total_count)
+                    for r in HabitStreak.query.all()}
+
+    # In-order check-ins on 3 consecutive days, a gap, then 2 more
+    start = date(2026, 3, 1)
+    for offset in (0, 1, 1, 2, 5, 6):
+        day = start + timedelta(days=offset)
+        client.post('/logs', json={'habit_id': hids[0], 'timestamp': f'{day.isoformat()}T09:00:00'})
+    assert snapshot()[hids[0]] == (2, 3, date(2026, 3, 7), 6)
+
+    # Random backdated adds and deletes must agree with a full rebuild
+    rng = random.Random(4)
+    log_ids = []
+    for _ in range(60):
+        if log_ids and rng.random() < 0.35:
+            client.delete(f'/logs/{log_ids.pop(rng.randrange(len(log_ids)))}')
+            continue
+        day = start + timedelta(days=rng.randrange(20))
+        resp = client.post('/logs', json={'habit_id': rng.choice(hids), 'timestamp': f'{day.isoformat()}T12:00:00'})
+        log_ids.append(resp.get_json()['id'])
+
+    incremental = snapshot()
+    with app.app_context():
+        streaks.rebuild_all()
+    assert snapshot() == incremental
+
+    result = app.test_cli_runner().invoke(args=['rebuild-streaks'])
+    assert 'Rebuilt streaks for' in result.output
+    assert snapshot() == incremental
+
+
+def test_streaks_page_shows_summaries():
+    from datetime import datetime, timedelta, timezone
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    client = app.test_client()
+    hid = client.post('/add_habit', json={'name': 'Meditate'}).get_json()['id']
+    today = datetime.now(timezone.utc).replace(hour=6, minute=0, second=0, microsecond=0)
+    for back in range(4):
+        client.post('/logs', json={'habit_id': hid, 'timestamp': (today - timedelta(days=back)).isoformat()})
+
+    html = client.get('/streaks').get_data(as_text=True)
+    assert '<p class="big">4</p>' in html
+    assert 'Meditate' in html
+
+
+def test_bulk_log_ingestion():
+    import json
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'BULK_CHUNK_SIZE': 3
+    })
+    client = app.test_client()
+    hid = client.post('/add_habit', json={'name': 'Imported'}).get_json()['id']
+
+    rows = [
+        {'habit_id': hid, 'timestamp': '2025-12-30T08:00:00', 'mood_score': 7},
+        {'habit_id': hid, 'timestamp': '2025-12-31T08:00:00'},
+        {'habit_id': 999, 'timestamp': '2025-12-31T09:00:00'},
+        {'habit_id': hid, 'timestamp': 'not-a-date'},
+        {'habit_id': hid, 'timestamp': '2026-01-01T08:00:00', 'mood_score': 11},
+        {'habit_id': hid, 'timestamp': '2026-01-01T08:00:00'},
+    ]
+    resp = client.post('/logs/bulk', json=rows)
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data['inserted'] == 3
+    assert [e['index'] for e in data['errors']] == [2, 3, 4]
+
+    ndjson = '\n'.join(json.dumps({'habit_id': hid, 'timestamp': f'2026-01-0{d}T08:00:00'}) for d in (2, 3))
+    resp = client.post('/logs/bulk', data=ndjson + '\n{bad json\n', content_type='application/x-ndjson')
+    assert resp.get_json() == {'inserted': 2, 'errors': [{'index': 2, 'error': 'Invalid row'}]}
+
+    assert client.get('/calendar/2025/12').get_json()['days_with_logs'] == [30, 31]
+    assert '<p class="big">5</p>' in client.get('/streaks').get_data(as_text=True)
+    assert client.post('/logs/bulk', json={'habit_id': hid}).status_code == 400
+
+    # Wrongly typed fields are per-row errors, never a 500 after earlier chunks committed
+    resp = client.post('/logs/bulk', json=[{'habit_id': [hid]}, {'habit_id': True}, {'habit_id': hid, 'client_id': {}},
+                                           {'habit_id': hid, 'mood_score': True}, {'habit_id': hid, 'timestamp': 5}])
+    assert resp.status_code == 400 and [e['index'] for e in resp.get_json()['errors']] == [0, 1, 2, 3, 4]
+    # ...including ids SQLite cannot bind, after an earlier single-row chunk committed
+    app.config['BULK_CHUNK_SIZE'] = 1
+    resp = client.post('/logs/bulk', json=[{'habit_id': hid, 'timestamp': '2026-01-05T08:00:00'},
+                                           {'habit_id': 2 ** 63}, {'habit_id': -1}])
+    assert resp.status_code == 200 and resp.get_json()['inserted'] == 1
+    assert [e['index'] for e in resp.get_json()['errors']] == [1, 2]
+
+
+def test_streaming_export():
+    import csv
+    import gzip
+    import io
+    import json
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    client = app.test_client()
+    walk = client.post('/add_habit', json={'name': 'Walk'}).get_json()['id']
+    swim = client.post('/add_habit', json={'name': 'Swim'}).get_json()['id']
+    rows = [{'habit_id': walk if i % 2 else swim, 'timestamp': f'2026-02-{d:02d}T07:00:00', 'mood_score': 5}
+            for i, d in enumerate(range(1, 29))]
+    client.post('/logs/bulk', json=rows)
+
+    resp = client.get('/export')
+    assert resp.is_streamed
+    lines = [json.loads(l) for l in resp.get_data(as_text=True).splitlines()]
+    assert len(lines) == 28
+    assert lines[0]['habit_name'] == 'Swim' and lines[0]['mood_score'] == 5
+
+    resp = client.get(f'/export?format=csv&start=2026-02-10&end=2026-02-12&habit_id={walk}')
+    reader = list(csv.DictReader(io.StringIO(resp.get_data(as_text=True))))
+    assert [r['timestamp'][:10] for r in reader] == ['2026-02-10', '2026-02-12']
+    assert {r['habit_name'] for r in reader} == {'Walk'}
+    # Timestamps keep their offset (07:00+05:00 is 02:00Z); dates are the user's local days
+    resp = client.get('/export', query_string={'start': '2026-02-10T07:00:00+05:00', 'end': '2026-02-11T02:00:00Z'})
+    assert [json.loads(l)['timestamp'] for l in resp.get_data(as_text=True).splitlines()] == ['2026-02-10T07:00:00']
+    client.post('/settings', json={'timezone': 'America/Los_Angeles'})
+    resp = client.get('/export?start=2026-02-10&end=2026-02-10')
+    assert [json.loads(l)['timestamp'] for l in resp.get_data(as_text=True).splitlines()] == ['2026-02-11T07:00:00']
+    assert client.get('/export?start=yesterday').status_code == 400
+
+    resp = client.get('/export', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert len(gzip.decompress(resp.data).splitlines()) == 28
+
+    assert client.get('/export?format=xml').status_code == 400
+
+
+def test_analytics_metrics_and_pages():
+    from datetime import date
+    import analytics
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    client = app.test_client()
+    a = client.post('/add_habit', json={'name': 'A'}).get_json()['id']
+    b = client.post('/add_habit', json={'name': 'B'}).get_json()['id']
+    # Mon 2026-03-02: both habits (twice for A), Tue: A only, Wed: nothing, Thu: B only
+    client.post('/logs/bulk', json=[
+        {'habit_id': a, 'timestamp': '2026-03-02T07:00:00', 'mood_score': 9},
+        {'habit_id': a, 'timestamp': '2026-03-02T08:00:00', 'mood_score': 9},
+        {'habit_id': b, 'timestamp': '2026-03-02T07:30:00'},
+        {'habit_id': a, 'timestamp': '2026-03-03T07:00:00', 'mood_score': 5},
+        {'habit_id': b, 'timestamp': '2026-03-05T21:00:00', 'mood_score': 4},
+    ])
+
+    with app.app_context():
+        stats = analytics.summary(1, today=date(2026, 3, 5))
+    assert stats['completion'].tolist() == [1.0, 0.5, 0.0, 0.5]
+    assert stats['rolling_7'].tolist() == [1.0, 0.75, 0.5, 0.5]
+    assert stats['weekday_hour'][0].sum() == 3 and stats['weekday_hour'][3, 21] == 1
+    assert stats['mood_correlation'] > 0.9
+
+    assert b'Rolling 7-day completion' in client.get('/graph').data
+    assert b'Mondays are your strongest day' in client.get('/insights').data
+
+
+def test_daily_rollup_maintenance_and_catch_up():
+    from datetime import date
+    from sqlalchemy import text
+    import rollups
+    from models import HabitDaily
+
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    client = app.test_client()
+    hid = client.post('/add_habit', json={'name': 'Rolled'}).get_json()['id']
+
+    def rollup():
+        with app.app_context():
+            return {(r.date, r.count, r.first_ts.hour, r.last_ts.hour, r.mood_sum, r.mood_count)
+                    for r in HabitDaily.query.filter_by(habit_id=hid)}
+
+    first = client.post('/logs', json={'habit_id': hid, 'timestamp': '2026-06-01T09:00:00'}).get_json()['id']
+    client.post('/logs', json={'habit_id': hid, 'timestamp': '2026-06-01T07:00:00'})
+    client.post('/logs/bulk', json=[{'habit_id': hid, 'timestamp': '2026-06-01T20:00:00', 'mood_score': 6},
+                                    {'habit_id': hid, 'timestamp': '2026-06-02T08:00:00', 'mood_score': 3}])
+    assert rollup() == {(date(2026, 6, 1), 3, 7, 20, 6, 1), (date(2026, 6, 2), 1, 8, 8, 3, 1)}
+
+    client.delete(f'/logs/{first}')
+    assert rollup() == {(date(2026, 6, 1), 2, 7, 20, 6, 1), (date(2026, 6, 2), 1, 8, 8, 3, 1)}
+
+    with app.app_context():
+        # Writers advanced the watermark themselves, so nothing is pending
+        assert rollups.catch_up() == 0
+        # A row written outside the app is picked up by the catch-up job
+        db.session.execute(text("INSERT INTO habit_log (habit_id, date, timestamp, mood_score) "
+                                "VALUES (:h, '2026-06-03', '2026-06-03 10:00:00.000000', NULL)"), {'h': hid})
+        db.session.commit()
+        assert rollups.catch_up() == 1
+        assert rollups.catch_up() == 0
+    assert (date(2026, 6, 3), 1, 10, 10, 0, 0) in rollup()
+    assert client.get('/calendar/2026/6').get_json() == {'days_with_logs': [1, 2, 3]}
+
+
+def test_response_cache_invalidation_and_revalidation():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    client = app.test_client()
+    lru = app.extensions['response_cache']
+    hid = client.post('/add_habit', json={'name': 'Cached'}).get_json()['id']
+    client.post('/logs', json={'habit_id': hid, 'timestamp': '2026-07-04T09:00:00'})
+
+    resp = client.get('/calendar/2026/7')
+    etag = resp.headers['ETag']
+    assert resp.headers['Last-Modified']
+    assert client.get('/calendar/2026/7', headers={'If-None-Match': etag}).status_code == 304
+    client.get('/calendar/2026/8')
+    client.get('/day/2026/7/4')
+    client.get('/')
+    assert {'calendar:1:2026:7', 'calendar:1:2026:8', 'day:1:2026:7:4', 'index:1'} <= set(lru._data)
+
+    # A July check-in evicts only the July keys
+    client.post('/logs', json={'habit_id': hid, 'timestamp': '2026-07-05T09:00:00'})
+    assert 'calendar:1:2026:7' not in lru._data and 'calendar:1:2026:8' in lru._data and 'index:1' in lru._data
+    resp = client.get('/calendar/2026/7', headers={'If-None-Match': etag})
+    assert resp.status_code == 200 and resp.get_json()['days_with_logs'] == [4, 5]
+
+    # Deleting the habit evicts every day it touched and the habit list
+    client.post('/delete_habit', json={'id': hid})
+    assert 'day:1:2026:7:4' not in lru._data and 'index:1' not in lru._data
+    assert client.get('/day/2026/7/4').get_json() == {'logs': []}
+    assert b'Cached' not in client.get('/').data
+
+
+def test_lru_cache_eviction_and_ttl():
+    import time
+    from cache import LRUCache
+    lru = LRUCache(max_entries=2, default_ttl=60)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.get('a')
+    lru.set('c', 3)  # 'b' is least recently used
+    assert lru.get('b') is None and lru.get('a') == 1 and lru.get('c') == 3
+    lru.set('short', 4, ttl=0.01)
+    time.sleep(0.02)
+    assert lru.get('short') is None
+
+
+def test_keyset_pagination_for_habits_and_logs():
+    import base64
+    import json
+    from app import encode_cursor
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'PAGE_SIZE': 3
+    })
+    client = app.test_client()
+    ids = [client.post('/add_habit', json={'name': f'H{i}'}).get_json()['id'] for i in range(7)]
+    client.post('/logs/bulk', json=[{'habit_id': ids[i % 2], 'timestamp': f'2026-08-{d:02d}T08:00:00'}
+                                    for i, d in enumerate(range(1, 6))])
+
+    seen, cursor = [], None
+    while True:
+        data = client.get('/habits' + (f'?cursor={cursor}' if cursor else '')).get_json()
+        seen += [h['id'] for h in data['habits']]
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+    assert seen == list(reversed(ids))
+
+    page = client.get('/logs?limit=2').get_json()
+    assert [l['timestamp'][:10] for l in page['logs']] == ['2026-08-05', '2026-08-04']
+    page = client.get(f"/logs?limit=2&cursor={page['next_cursor']}").get_json()
+    assert [l['timestamp'][:10] for l in page['logs']] == ['2026-08-03', '2026-08-02']
+    assert len(client.get(f'/logs?habit_id={ids[1]}').get_json()['logs']) == 2
+    assert client.get('/habits?cursor=garbage').status_code == 400
+    # Cursors come back from the client: anything but [timestamp, id] is rejected
+    ts = '2026-01-01T00:00:00'
+    for bad in ([ts], [ts, [1]], [ts, {}], [ts, 1, 2], [ts, True], [ts, 2 ** 63], {'a': 1}, 5):
+        token = base64.urlsafe_b64encode(json.dumps(bad).encode()).decode()
+        assert client.get(f'/habits?cursor={token}').status_code == 400, bad
+        assert client.get(f'/logs?cursor={token}').status_code == 400, bad
+    assert client.get(f'/logs?cursor={encode_cursor([ts, 1])}').status_code == 200
+
+    # The dashboard renders only the first page
+    html = client.get('/').get_data(as_text=True)
+    assert 'H6' in html and 'H3' not in html and 'loadMoreHabits' in html
+
+    statements = _capture_sql(app)
+    client.get(f"/habits?cursor={client.get('/habits').get_json()['next_cursor']}")
+    client.get(f"/logs?limit=1&cursor={client.get('/logs?limit=1').get_json()['next_cursor']}")
+    assert _full_scans(app, statements) == []
+    assert _full_scans(app, statements, table='habit') == []
+
+
+def test_production_sqlite_profile(tmp_path):
+    from sqlalchemy import text
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "prod.db"}',
+        'DATABASE_PROFILE': 'production',
+        'DB_POOL_SIZE': 3
+    })
+    with app.app_context():
+        assert db.engine.pool.size() == 3
+        # Check the pragmas on several distinct pooled connections
+        conns = [db.engine.connect() for _ in range(3)]
+        for conn in conns:
+            assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert conn.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+            assert conn.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+        for conn in conns:
+            conn.close()
+
+    client = app.test_client()
+    hid = client.post('/add_habit', json={'name': 'WAL'}).get_json()['id']
+    assert client.post('/logs', json={'habit_id': hid}).status_code == 201
+
+
+def test_write_retry_on_locked_database():
+    from sqlalchemy.exc import OperationalError
+    import dbtuning
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'WRITE_RETRIES': 2
+    })
+    calls = []
+
+    @dbtuning.retry_on_locked
+    def flaky(fail_times, message='database is locked'):
+        calls.append(1)
+        if len(calls) <= fail_times:
+            raise OperationalError('INSERT', {}, Exception(message))
+        return 'ok'
+
+    with app.app_context():
+        assert flaky(2) == 'ok' and len(calls) == 3
+        calls.clear()
+        try:
+            flaky(3)
+            assert False, 'expected the lock error to propagate'
+        except OperationalError:
+            assert len(calls) == 3
+        calls.clear()
+        try:
+            flaky(1, message='no such table: habit')
+            assert False, 'non-lock errors are not retried'
+        except OperationalError:
+            assert len(calls) == 1
+
+
+def test_versioned_migrations_and_chunked_backfills(tmp_path):
+    import sqlite3
+    import migrations
+    db_path = tmp_path / 'old.db'
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE habit (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, created_at DATETIME);
+        CREATE TABLE habit_log (id INTEGER PRIMARY KEY, date DATE NOT NULL, mood_score INTEGER,
+                                habit_id INTEGER NOT NULL REFERENCES habit(id));
+        CREATE TABLE user (id INTEGER PRIMARY KEY, email VARCHAR(120) NOT NULL);
+        INSERT INTO habit (id, name) VALUES (1, 'Old');
+        INSERT INTO habit_log (date, habit_id) VALUES ('2025-05-01', 1), ('2025-05-02', 1), ('2025-05-03', 1);
+    """)
+    conn.close()
+    config = {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}', 'BACKFILL_MODE': 'manual'}
+
+    app = create_app(config)
+    with app.app_context():
+        assert migrations.get_version() == migrations.LATEST
+        assert migrations.pending_backfills() == ['log_timestamps', 'log_owners', 'local_dates', 'rollups', 'streaks',
+                                                  'change_seqs']
+        # Chunks of one row: every step commits and the runner resumes from state
+        # (logs got change numbers when local_dates rewrote them, so only the habit is left)
+        assert migrations.run_backfills(chunk_size=1) == {
+            'log_timestamps': 3, 'log_owners': 3, 'local_dates': 3, 'rollups': 3, 'streaks': 1, 'change_seqs': 1}
+        assert migrations.pending_backfills() == []
+    client = app.test_client()
+    delta = client.post('/sync', json={}).get_json()
+    assert (len(delta['habits']), len(delta['logs']), delta['cursor']) == (1, 3, 4)
+    assert client.get('/calendar/2025/5').get_json() == {'days_with_logs': [1, 2, 3]}
+    assert len(client.get('/day/2025/5/1').get_json()['logs']) == 1
+    assert '<p class="big">3</p>' in client.get('/streaks').get_data(as_text=True)
+
+    # A second boot of an up-to-date database applies nothing
+    app = create_app(config)
+    with app.app_context():
+        statements = _capture_sql(app)
+        assert migrations.upgrade() == []
+        assert [s for s, _ in statements] == ['PRAGMA user_version']
+
+
+def test_queued_write_mode_group_commits(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "queued.db"}',
+        'WRITE_MODE': 'queued',
+        'GROUP_COMMIT_MAX_DELAY_MS': 50
+    })
+    client = app.test_client()
+    writer = app.extensions['log_writer']
+    hid = client.post('/add_habit', json={'name': 'Queued'}).get_json()['id']
+
+    tokens = []
+    for hour in range(8):
+        resp = client.post('/logs', json={'habit_id': hid, 'timestamp': f'2026-09-01T{10 + hour}:00:00'})
+        assert resp.status_code == 202
+        tokens.append(resp.get_json()['token'])
+    assert client.post('/logs', json={'habit_id': 999}).status_code == 404
+
+    # Reads of a day with queued rows wait for the writer
+    assert len(client.get('/day/2026/9/1').get_json()['logs']) == 8
+    assert client.get('/calendar/2026/9').get_json() == {'days_with_logs': [1]}
+    acks = [client.get(f'/logs/ack/{t}').get_json() for t in tokens]
+    assert all(a['status'] == 'committed' for a in acks)
+    assert len({a['id'] for a in acks}) == 8
+    assert client.get('/logs/ack/nope').status_code == 404
+
+    # Shutdown commits whatever is still queued
+    client.post('/logs', json={'habit_id': hid, 'timestamp': '2026-09-02T10:00:00'})
+    writer.stop()
+    with app.app_context():
+        assert HabitLog.query.count() == 9
+
+
+def test_write_queue_backpressure():
+    from datetime import date
+    import writequeue
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    # Not started, so nothing drains the queue
+    writer = writequeue.GroupCommitWriter(app, max_queue=1, enqueue_timeout=0.01)
+    row = {'habit_id': 1, 'user_id': 1, 'timestamp': None, 'date': date(2026, 1, 1), 'local_date': date(2026, 1, 1), 'mood_score': None}
+    token = writer.submit(row)
+    assert writer.ack(token) == {'status': 'queued'}
+    try:
+        writer.submit(row)
+        assert False, 'expected QueueFull'
+    except writequeue.QueueFull:
+        pass
+    assert writer.has_pending(1, [date(2026, 1, 1)]) and not writer.has_pending(2, [date(2026, 1, 1)])
+    # Reads wait only a bounded time, and only for the user's own rows
+    assert writer.wait_for(1, [date(2026, 1, 1)], timeout=0.05) is False
+    assert writer.wait_for(2, [date(2026, 1, 1)], timeout=0.05) is True
+
+
+def test_read_your_writes_ignores_rows_queued_after_the_read():
+    import threading
+    import time
+    from datetime import date
+    import writequeue
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    writer = writequeue.GroupCommitWriter(app, max_queue=10)  # drained by hand below
+    day = date(2026, 1, 1)
+    row = {'habit_id': 1, 'user_id': 1, 'timestamp': None, 'date': day, 'local_date': day, 'mood_score': None}
+    writer.submit(row)
+    first = writer.queue.get()
+    result = {}
+    waiter = threading.Thread(target=lambda: result.setdefault('done', writer.wait_for(1, [day], timeout=5)))
+    waiter.start()
+    while not writer._settled._waiters:  # the read has taken its snapshot
+        time.sleep(0.001)
+    writer.submit(row)  # a later check-in for the same day keeps the queue busy
+    writer._settle([first])
+    waiter.join(timeout=2)
+    assert result == {'done': True} and writer.has_pending(1, [day])
+
+
+def test_metrics_endpoint_and_slow_request_profiles(tmp_path):
+    import re
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'METRICS_ENABLED': True,
+        'PROFILE_SLOW_MS': 0,
+        'PROFILE_DIR': str(tmp_path)
+    })
+    client = app.test_client()
+    hid = client.post('/add_habit', json={'name': 'Metered'}).get_json()['id']
+    client.post('/logs', json={'habit_id': hid, 'timestamp': '2026-10-01T08:00:00'})
+    client.get('/day/2026/10/1')
+    client.get('/profile')
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'habits_request_duration_seconds_count{route="/day/<int:year>/<int:month>/<int:day>",method="GET",status="200"} 1' in text
+    sql = re.search(r'habits_sql_statements_total\{route="/profile",method="GET",status="200"\} (\d+)', text)
+    assert sql and int(sql.group(1)) > 0
+    assert re.search(r'habits_template_seconds_total\{route="/profile",[^}]*\} 0\.\d*[1-9]', text)
+    assert re.search(r'habits_rows_hydrated_total\{route="/profile",[^}]*\} [1-9]', text)
+    assert '/metrics' not in text
+
+    # With a 0 ms threshold every request leaves a cProfile dump and folded stacks
+    assert list(tmp_path.glob('*GET_day*.prof')) and list(tmp_path.glob('*GET_day*.folded'))
+
+    # Only one request is profiled at a time (cProfile is process-wide on 3.12+);
+    # a request that arrives meanwhile is served unprofiled rather than failing
+    from instrumentation import RequestProfiler
+    busy = RequestProfiler()
+    assert busy.start() and not RequestProfiler().start()
+    before = len(list(tmp_path.glob('*.prof')))
+    assert client.get('/help').status_code == 200
+    busy.stop()
+    assert len(list(tmp_path.glob('*.prof'))) == before
+    assert client.get('/help').status_code == 200 and len(list(tmp_path.glob('*.prof'))) == before + 1
+
+
+def test_instrumentation_is_opt_in():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    assert app.test_client().get('/metrics').status_code == 404
+    assert 'metrics' not in app.extensions
+
+
+def test_delete_habit_soft_deletes_then_purges_in_chunks():
+    import migrations
+    from models import HabitDaily, HabitStreak
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'BACKFILL_MODE': 'manual',
+    })
+    client = app.test_client()
+    hid = client.post('/add_habit', json={'name': 'Old habit'}).get_json()['id']
+    keep = client.post('/add_habit', json={'name': 'Keeper'}).get_json()['id']
+    resp = client.post('/logs/bulk', json=[{'habit_id': hid, 'timestamp': f'2025-01-{d:02d}T08:00:00'} for d in range(1, 8)]
+                       + [{'habit_id': keep, 'timestamp': '2025-01-03T09:00:00'}])
+    assert resp.status_code == 200
+
+    statements = _capture_sql(app)
+    assert client.post('/delete_habit', json={'id': hid}).status_code == 200
+    # The request never reads or deletes individual logs
+    assert not [s for s, _ in statements if 'habit_log' in s]
+
+    # Hidden everywhere straight away, though its logs are still on disk
+    assert [h['id'] for h in client.get('/habits').get_json()['habits']] == [keep]
+    assert [l['habit_id'] for l in client.get('/logs').get_json()['logs']] == [keep]
+    assert client.get('/day/2025/1/2').get_json()['logs'] == []
+    assert client.post('/logs', json={'habit_id': hid}).status_code == 404
+    assert client.post('/delete_habit', json={'id': hid}).status_code == 404
+    with app.app_context():
+        assert HabitLog.query.filter_by(habit_id=hid).count() == 7
+        assert HabitDaily.query.filter_by(habit_id=hid).count() == 0
+        assert db.session.get(HabitStreak, hid) is None
+
+        # The purge runs in committed chunks and finally removes the habit row
+        done = migrations.run_backfills(chunk_size=3)
+        assert done['purge_habits'] == 7 + 3
+        assert HabitLog.query.filter_by(habit_id=hid).count() == 0
+        assert db.session.get(Habit, hid) is None
+        assert HabitLog.query.filter_by(habit_id=keep).count() == 1
+        assert migrations.pending_backfills() == []
+
+
+def test_timezone_setting_buckets_logs_by_local_day():
+    from models import User
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'BACKFILL_CHUNK_SIZE': 2,
+    })
+    client = app.test_client()
+    hid = client.post('/add_habit', json={'name': 'Late night'}).get_json()['id']
+    for ts in ('2026-03-04T20:00:00Z', '2026-03-05T20:00:00Z', '2026-03-06T01:00:00+05:30'):
+        assert client.post('/logs', json={'habit_id': hid, 'timestamp': ts}).status_code == 201
+    assert client.get('/calendar/2026/3').get_json() == {'days_with_logs': [4, 5]}
+    assert len(client.get('/day/2026/3/5').get_json()['logs']) == 2
+
+    assert client.post('/settings', json={'timezone': 'Mars/Olympus'}).status_code == 400
+    for bad in (5, ['UTC'], {'name': 'UTC'}):
+        assert client.post('/settings', json={'timezone': bad}).status_code == 400
+    assert client.post('/settings', json=['UTC']).status_code == 400
+    resp = client.post('/settings', json={'timezone': 'Asia/Tokyo'})
+    assert resp.get_json() == {'timezone': 'Asia/Tokyo', 'recomputing': True}
+    assert 'value="Asia/Tokyo"' in client.get('/settings').get_data(as_text=True)
+
+    # Recomputed in chunks (inline under TESTING): 20:00Z is the next morning in Tokyo
+    assert client.get('/calendar/2026/3').get_json() == {'days_with_logs': [5, 6]}
+    # Offsets are normalised to UTC on write: 01:00+05:30 is 19:30Z the day before
+    assert [l['timestamp'] for l in client.get('/day/2026/3/6').get_json()['logs']] == ['2026-03-05T19:30:00', '2026-03-05T20:00:00']
+    client.post('/logs', json={'habit_id': hid, 'timestamp': '2026-03-06T16:00:00Z'})  # 01:00 on the 7th
+    assert client.get('/calendar/2026/3?counts=1').get_json()['days_with_logs'] == [5, 6, 7]
+    with app.app_context():
+        assert db.session.get(User, 1).timezone == 'Asia/Tokyo'
+        assert {l.local_date.day for l in HabitLog.query} == {5, 6, 7}
+        # Insights bucket by Tokyo wall-clock time too: 20:00Z Wed/Thu is 05:00 Thu/Fri
+        import analytics
+        from datetime import date
+        heat = analytics.summary(1, today=date(2026, 3, 7))['weekday_hour']
+        assert heat[3, 5] == 1 and heat[4, 5] == 1 and heat[4, 4] == 1 and heat[5, 1] == 1
+    # Day views are a range on the local-date index, not a timestamp scan
+    statements = _capture_sql(app)
+    client.get('/day/2026/3/7')
+    [(statement, params)] = [(s, p) for s, p in statements if 'FROM habit_log' in s]
+    with app.app_context():
+        plan = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, params).fetchall()
+    assert any('ix_habit_log_user_id_local_date_timestamp' in row[-1] for row in plan)
+
+
+def test_profile_picture_variants_are_hashed_and_immutable(tmp_path):
+    import io
+    from PIL import Image
+    from models import User
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'AVATAR_DIR': str(tmp_path),
+    })
+    client = app.test_client()
+
+    def upload(color, name='me.png'):
+        buf = io.BytesIO()
+        Image.new('RGB', (600, 400), color).save(buf, 'PNG')
+        buf.seek(0)
+        return client.post('/profile', data={'display_name': 'Pat', 'email': 'pat@example.com',
+                                             'profile_picture': (buf, name)},
+                           content_type='multipart/form-data')
+
+    assert upload('red').status_code == 302
+    with app.app_context():
+        key = db.session.get(User, 1).profile_picture
+    files = sorted(p.name for p in tmp_path.iterdir())
+    assert files == sorted(f'{key}-{size}.{ext}' for size in (64, 256) for ext in ('webp', 'jpg'))
+
+    page = client.get('/profile').get_data(as_text=True)
+    assert f'srcset="/avatars/{key}-256.webp"' in page
+    resp = client.get(f'/avatars/{key}-64.webp')
+    assert resp.status_code == 200
+    assert resp.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert Image.open(io.BytesIO(resp.data)).size == (64, 64)
+    assert client.get('/avatars/..%2Fapp.py').status_code == 404
+
+    # A new picture gets new names and the old variants are removed
+    upload('blue')
+    with app.app_context():
+        new_key = db.session.get(User, 1).profile_picture
+    assert new_key != key and not list(tmp_path.glob(f'{key}-*'))
+
+    # Not an image, despite the extension
+    resp = client.post('/profile', data={'display_name': 'Pat', 'email': 'pat@example.com',
+                                         'profile_picture': (io.BytesIO(b'not an image'), 'x.png')},
+                       content_type='multipart/form-data')
+    assert b'Only image files are allowed' in resp.data
+    assert client.delete('/profile/picture').status_code == 200
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_same_picture_from_two_users_is_not_shared(tmp_path):
+    import io
+    import avatars
+    from PIL import Image
+    from models import User
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'AVATAR_DIR': str(tmp_path),
+    })
+    ann, bob = app.test_client(), app.test_client()
+    ann.post('/register', json={'email': 'ann@example.com', 'password': 'Secret1'})
+    bob.post('/register', json={'email': 'bob@example.com', 'password': 'Secret1'})
+    for client, email in ((ann, 'ann@example.com'), (bob, 'bob@example.com')):
+        buf = io.BytesIO()
+        Image.new('RGB', (300, 300), 'green').save(buf, 'PNG')
+        buf.seek(0)
+        client.post('/profile', data={'display_name': 'Pat', 'email': email, 'profile_picture': (buf, 'same.png')},
+                    content_type='multipart/form-data')
+    with app.app_context():
+        ann_key, bob_key = db.session.get(User, 1).profile_picture, db.session.get(User, 2).profile_picture
+    assert ann_key != bob_key
+    assert ann.delete('/profile/picture').status_code == 200
+    assert len(list(tmp_path.glob(f'{bob_key}-*'))) == 4 and not list(tmp_path.glob(f'{ann_key}-*'))
+
+    # Keys two users already shared (from before keys were per user) outlive either owner
+    with app.app_context():
+        db.session.get(User, 1).profile_picture = bob_key
+        db.session.commit()
+    assert ann.delete('/profile/picture').status_code == 200
+    assert len(list(tmp_path.glob(f'{bob_key}-*'))) == 4
+    with app.app_context():
+        assert avatars.variants(db.session.get(User, 2).profile_picture)
+
+
+def test_static_assets_are_fingerprinted_and_precompressed():
+    import gzip
+    import os
+    import re
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    client = app.test_client()
+    page = client.get('/').get_data(as_text=True)
+    css = re.search(r'href="(/static/css/style\.[0-9a-f]{12}\.css)"', page).group(1)
+    assert re.search(r'src="/static/js/nav\.[0-9a-f]{12}\.js"', page)
+    with open(os.path.join(app.static_folder, 'css', 'style.css'), 'rb') as fh:
+        original = fh.read()
+
+    resp = client.get(css, headers={'Accept-Encoding': 'gzip, deflate'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert resp.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert resp.headers['Vary'] == 'Accept-Encoding'
+    assert resp.mimetype == 'text/css'
+    assert gzip.decompress(resp.data) == original
+    assert client.get(css, headers={'Accept-Encoding': 'gzip', 'If-None-Match': resp.headers['ETag']}).status_code == 304
+
+    plain = client.get(css)
+    assert 'Content-Encoding' not in plain.headers and plain.data == original
+    # Unhashed names still work, with Flask's default headers
+    assert 'immutable' not in client.get('/static/css/style.css').headers.get('Cache-Control', '')
+
+    off = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'ASSETS_FINGERPRINT': False})
+    assert 'href="/static/css/style.css"' in off.test_client().get('/').get_data(as_text=True)
+
+
+def test_register_login_logout_and_auth_required():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'AUTH_REQUIRED': True
+    })
+    client = app.test_client()
+    # Anonymous: pages redirect to /login, API calls get 401
+    resp = client.get('/profile')
+    assert resp.status_code == 302 and resp.headers['Location'] == '/login?next=/profile'
+    assert client.post('/add_habit', json={'name': 'x'}).status_code == 401
+    assert client.get('/login').status_code == 200
+
+    assert client.post('/register', json={'email': 'ann@example.com', 'password': 'weak'}).status_code == 400
+    assert client.post('/register', json={'email': 'ann@example.com', 'password': 'Secret1'}).status_code == 201
+    assert client.post('/add_habit', json={'name': 'Run'}).status_code == 201
+    assert client.post('/logout', json={}).get_json() == {'status': 'logged out'}
+    assert client.get('/habits', headers={'Accept': 'application/json'}).status_code == 401
+
+    assert client.post('/register', json={'email': 'ann@example.com', 'password': 'Secret1'}).status_code == 400
+    assert client.post('/login', json={'email': 'ann@example.com', 'password': 'Wrong1'}).status_code == 401
+    resp = client.post('/login?next=/streaks', data={'email': 'ann@example.com', 'password': 'Secret1'})
+    assert resp.status_code == 302 and resp.headers['Location'] == '/streaks'
+    assert [h['name'] for h in client.get('/habits').get_json()['habits']] == ['Run']
+    # Bodies that are not objects, or fields that are not strings, get the usual 400/401
+    for body in ({'email': 5, 'password': 'Secret1'}, {'email': 'ann@example.com', 'password': ['Secret1']}, ['ann'], 'ann'):
+        assert client.post('/login', json=body).status_code == 401
+    for body in ({'email': 5, 'password': 'Secret1'}, {'email': 'cy@example.com', 'password': 'Secret1', 'display_name': {}}, ['cy']):
+        assert client.post('/register', json=body).status_code == 400
+    # Only same-site paths are followed after login
+    resp = client.post('/login?next=//evil.example', data={'email': 'ann@example.com', 'password': 'Secret1'})
+    assert resp.headers['Location'] == '/'
+
+
+def test_a_password_ends_anonymous_access_to_the_default_account():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    ann, anonymous = app.test_client(), app.test_client()
+    # Single-user mode: with no password anywhere, every visitor is the default account
+    anonymous.post('/add_habit', json={'name': 'Swim'})
+    assert 'Log out' not in anonymous.get('/').get_data(as_text=True)
+
+    # Setting a password signs that visitor in and requires login from everyone else
+    resp = ann.post('/profile', data={'display_name': 'Ann', 'email': 'ann@example.com', 'password': 'Secret1'})
+    assert resp.status_code == 302
+    resp = ann.get('/')
+    page = resp.get_data(as_text=True)
+    assert 'Swim' in page and 'Log out' in page and 'private' in resp.headers['Cache-Control']
+    assert anonymous.get('/').headers['Location'] == '/login?next=/'
+    assert anonymous.post('/profile', data={'display_name': 'Eve', 'email': 'ann@example.com',
+                                            'password': 'Stolen1'}).status_code == 401
+    assert anonymous.post('/login', json={'email': 'ann@example.com', 'password': 'Stolen1'}).status_code == 401
+    assert anonymous.post('/login', json={'email': 'ann@example.com', 'password': 'Secret1'}).status_code == 200
+
+    # The same holds when the first account is created through /register
+    fresh = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    fresh.test_client().post('/register', json={'email': 'alice@example.com', 'password': 'Secret1'})
+    assert fresh.test_client().get('/habits', headers={'Accept': 'application/json'}).status_code == 401
+
+
+def test_each_user_sees_only_their_own_data():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    ann, bob = app.test_client(), app.test_client()
+    ann.post('/register', json={'email': 'ann@example.com', 'password': 'Secret1'})
+    bob.post('/register', json={'email': 'bob@example.com', 'password': 'Secret1'})
+    run = ann.post('/add_habit', json={'name': 'Run'}).get_json()['id']
+    read = bob.post('/add_habit', json={'name': 'Read'}).get_json()['id']
+    log = ann.post('/logs', json={'habit_id': run, 'timestamp': '2026-05-01T08:00:00'}).get_json()['id']
+    bob.post('/logs/bulk', json=[{'habit_id': read, 'timestamp': '2026-05-02T08:00:00'},
+                                 {'habit_id': run, 'timestamp': '2026-05-02T09:00:00'}])
+    with app.app_context():
+        assert {(l.habit_id, l.user_id) for l in HabitLog.query} == {(run, 1), (read, 2)}
+
+    # Another user's habits and logs do not exist as far as bob is concerned
+    assert bob.post('/logs', json={'habit_id': run}).status_code == 404
+    assert bob.delete(f'/logs/{log}').status_code == 404
+    assert bob.post('/delete_habit', json={'id': run}).status_code == 404
+    assert [h['name'] for h in bob.get('/habits').get_json()['habits']] == ['Read']
+
+    statements = _capture_sql(app)
+    assert ann.get('/calendar/2026/5').get_json() == {'days_with_logs': [1]}
+    assert bob.get('/calendar/2026/5').get_json() == {'days_with_logs': [2]}
+    assert [l['habit_name'] for l in bob.get('/logs').get_json()['logs']] == ['Read']
+    assert bob.get('/day/2026/5/1').get_json() == {'logs': []}
+    assert b'Read' not in ann.get('/').data and b'Run' not in bob.get('/export').data
+    ann.get('/graph')
+    ann.get('/streaks')
+    # Every read is a search on a user-scoped index, so its cost does not
+    # grow with the number of tenants
+    with app.app_context():
+        conn = db.session.connection()
+        for statement, params in statements:
+            if statement.lstrip().upper().startswith('SELECT') and 'habit' in statement:
+                plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, params).fetchall()
+                assert not [row[-1] for row in plan if row[-1].startswith('SCAN habit')], statement
+
+
+def test_year_bitmaps_heatmap_and_streaks():
+    import base64
+    from datetime import date
+    import bitmaps
+    import migrations
+    from models import HabitYear
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    client = app.test_client()
+    hid = client.post('/add_habit', json={'name': 'Walk'}).get_json()['id']
+    client.post('/add_habit', json={'name': 'Idle'})
+    client.post('/logs', json={'habit_id': hid, 'timestamp': '2025-12-30T09:00:00'})
+    client.post('/logs/bulk', json=[{'habit_id': hid, 'timestamp': f'{day}T09:00:00'}
+                                    for day in ('2025-12-31', '2026-01-01', '2026-01-02', '2026-01-02', '2026-01-05')])
+
+    statements = _capture_sql(app)
+    data = client.get('/heatmap/2026').get_json()
+    assert len([s for s, _ in statements if 'habit_year' in s]) == 1
+    assert data['days'] == 365 and [h['name'] for h in data['habits']] == ['Walk', 'Idle']
+    walk, idle = data['habits']
+    raw = base64.b64decode(walk['bits'])
+    assert len(raw) == 46 and bitmaps.to_int(raw) == 0b10011
+    assert (walk['count'], walk['longest_streak']) == (3, 2)
+    assert idle['count'] == 0 and idle['bits'] == base64.b64encode(bytes(46)).decode()
+
+    # Streaks run across New Year; a day off is allowed until it is over
+    with app.app_context():
+        years = {y: bitmaps.to_int(b) for y, b in db.session.query(HabitYear.year, HabitYear.bits)}
+        stats = bitmaps.year_stats(years[2026], 2026, date(2026, 1, 3), earlier=years.get)
+    assert stats == {'count': 2, 'longest_streak': 2, 'current_streak': 4, 'consistency': 0.667}
+    assert bitmaps.year_stats(years[2026], 2026, date(2026, 1, 4), years.get)['current_streak'] == 0
+
+    # Deleting logs clears a bit only once the day has no check-ins left
+    logs = client.get(f'/logs?habit_id={hid}').get_json()['logs']
+    second_day = [l['id'] for l in logs if l['timestamp'].startswith('2026-01-02')]
+    for log_id, expected in zip(second_day, (0b10011, 0b10001)):
+        client.delete(f'/logs/{log_id}')
+        with app.app_context():
+            assert bitmaps.to_int(db.session.get(HabitYear, (hid, 2026)).bits) == expected
+    assert client.get('/heatmap/2026').get_json()['habits'][0]['count'] == 2
+    assert 'Walk: 0 day streak, best 1' in client.get('/streaks').get_data(as_text=True)
+    assert b'Completed days by weekday' in client.get('/graph').data
+
+    # The backfill rebuilds the same bitmaps from the rollup
+    with app.app_context():
+        before = {(r.habit_id, r.year): r.bits for r in HabitYear.query}
+        HabitYear.query.delete()
+        migrations.queue_backfill('bitmaps')
+        db.session.commit()
+        migrations.run_backfills()
+        assert {(r.habit_id, r.year): r.bits for r in HabitYear.query} == before
+
+    client.post('/delete_habit', json={'id': hid})
+    with app.app_context():
+        assert HabitYear.query.count() == 0
+
+
+def _read_events(resp, until):
+    # Parse an SSE response until an event named `until` (or a resync) arrives
+    import json
+    seen, buffer, chunks = [], '', resp.iter_encoded()
+    while True:
+        buffer += next(chunks).decode()
+        while '\n\n' in buffer:
+            block, buffer = buffer.split('\n\n', 1)
+            fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line and not line.startswith(':'))
+            if 'event' in fields:
+                seen.append((fields['event'], json.loads(fields['data']), fields.get('id')))
+                if fields['event'] in (until, 'resync'):
+                    return seen
+
+
+def test_event_stream_pushes_deltas_and_drops_slow_consumers():
+    import events
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'EVENTS_HEARTBEAT': 0.05,
+        'EVENTS_BUFFER': 5,
+    })
+    client = app.test_client()
+    resp = client.get('/events')
+    assert resp.mimetype == 'text/event-stream' and resp.headers['Cache-Control'] == 'no-cache'
+
+    hid = client.post('/add_habit', json={'name': 'Read'}).get_json()['id']
+    log_id = client.post('/logs', json={'habit_id': hid, 'timestamp': '2026-03-04T10:00:00'}).get_json()['id']
+    client.delete(f'/logs/{log_id}')
+    client.post('/delete_habit', json={'id': hid})
+    seen = _read_events(resp, 'habit_deleted')
+    assert [name for name, _, _ in seen] == ['habit_added', 'log_added', 'log_deleted', 'habit_deleted']
+    assert seen[1][1] == {'id': log_id, 'habit_id': hid, 'habit_name': 'Read',
+                          'timestamp': '2026-03-04T10:00:00', 'local_date': '2026-03-04'}
+    assert seen[2][1]['day_count'] == 0
+    resp.close()
+    assert events.get_broker(app).subscriber_count() == 0
+
+    # Reconnecting with Last-Event-ID replays what was missed
+    resp = client.get('/events', headers={'Last-Event-ID': seen[1][2]})
+    assert [name for name, _, _ in _read_events(resp, 'habit_deleted')] == ['log_deleted', 'habit_deleted']
+    resp.close()
+
+    # Another user's stream never sees these events
+    # Give the default account a password (and a session) before a second user signs up
+    client.post('/profile', data={'display_name': 'Ann', 'email': 'ann@example.com', 'password': 'Secret1'})
+    other = app.test_client()
+    other.post('/register', json={'email': 'bob@example.com', 'password': 'Secret1'})
+    other_resp = other.get('/events')
+    client.post('/add_habit', json={'name': 'Mine'})
+    other.post('/add_habit', json={'name': 'Theirs'})
+    assert [data['name'] for _, data, _ in _read_events(other_resp, 'habit_added')] == ['Theirs']
+    other_resp.close()
+
+    # A consumer that falls more than EVENTS_BUFFER events behind is told to resync
+    resp = client.get('/events')
+    for n in range(6):
+        client.post('/add_habit', json={'name': f'Habit {n}'})
+    assert [name for name, _, _ in _read_events(resp, 'never')] == ['resync']
+    assert events.get_broker(app).subscriber_count() == 0
+
+    # Streams hold a server thread each, so one user may only keep EVENTS_STREAMS_PER_USER open;
+    # that does not stop anyone else, and a page retrying later replays via ?last_event_id=
+    open_streams = [client.get('/events') for _ in range(app.config['EVENTS_STREAMS_PER_USER'])]
+    refused = client.get('/events')
+    assert refused.status_code == 503 and refused.headers['Retry-After'] == '1'
+    other_resp = other.get('/events')
+    assert other_resp.status_code == 200
+    other_resp.close()
+    client.post('/add_habit', json={'name': 'Before'})
+    last_id = _read_events(open_streams[0], 'habit_added')[-1][2]
+    client.post('/add_habit', json={'name': 'Missed'})
+    for resp in open_streams:
+        resp.close()
+    resp = client.get(f'/events?last_event_id={last_id}')
+    assert [data['name'] for _, data, _ in _read_events(resp, 'habit_added')] == ['Missed']
+    resp.close()
+
+
+def test_profile_cards_are_lazy_and_cached_per_data_version():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'
+    })
+    client = app.test_client()
+    hid = client.post('/add_habit', json={'name': 'Stretch'}).get_json()['id']
+    client.post('/logs', json={'habit_id': hid, 'timestamp': '2026-05-02T08:00:00'})
+
+    # The page itself reads only the account; the cards point at their endpoints
+    statements = _capture_sql(app)
+    page = client.get('/profile').get_data(as_text=True)
+    assert not [s for s, _ in statements if 'habit_log' in s or 'habit_streak' in s]
+    assert 'data-fragment="/profile/habits"' in page and 'data-fragment="/profile/recent"' in page
+
+    progress = client.get('/profile/habits').get_json()
+    assert (progress['habit_count'], progress['recent_count']) == (1, 1) and 'Total Habits' in progress['html']
+    assert [l['habit_name'] for l in client.get('/profile/recent').get_json()['logs']] == ['Stretch']
+
+    # Built once per data version: repeats and the page reuse the rendered cards
+    statements = _capture_sql(app)
+    assert client.get('/profile/habits').get_json() == progress
+    page = client.get('/profile').get_data(as_text=True)
+    assert not [s for s, _ in statements if 'habit' in s]
+    assert 'data-fragment="' not in page and '<li>Stretch</li>' in page
+
+    # Any write moves the version on, so the cards are rebuilt
+    client.post('/add_habit', json={'name': 'Nap'})
+    assert 'data-fragment="/profile/habits"' in client.get('/profile').get_data(as_text=True)
+    assert client.get('/profile/habits').get_json()['habit_count'] == 2
+    client.post('/logs', json={'habit_id': hid, 'timestamp': '2026-05-03T08:00:00'})
+    assert client.get('/profile/recent').get_json()['logs'][0]['timestamp'] == '2026-05-03T08:00:00'
+
+
+def test_sync_applies_queued_changes_once_and_returns_deltas():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SYNC_PAGE_SIZE': 3
+    })
+    client = app.test_client()
+    hid = client.post('/add_habit', json={'name': 'Water'}).get_json()['id']
+
+    # First sync from scratch: the habit, paged by SYNC_PAGE_SIZE
+    delta = client.post('/sync', json={'cursor': 0}).get_json()
+    assert [h['name'] for h in delta['habits']] == ['Water'] and not delta['has_more']
+    cursor = delta['cursor']
+
+    batch = {'cursor': cursor, 'changes': [
+        {'op': 'add_log', 'client_id': 'a1', 'habit_id': hid, 'timestamp': '2026-07-01T08:00:00'},
+        {'op': 'add_log', 'client_id': 'a2', 'habit_id': hid, 'timestamp': '2026-07-02T08:00:00', 'mood_score': 7},
+        {'op': 'add_log', 'client_id': 'a3', 'habit_id': 999, 'timestamp': '2026-07-03T08:00:00'},
+        {'op': 'add_log', 'habit_id': hid},
+    ]}
+    statements = _capture_sql(app)
+    resp = client.post('/sync', json=batch).get_json()
+    assert _full_scans(app, statements) == [] and _full_scans(app, statements, 'sync_deletion') == []
+    assert [r['status'] for r in resp['results']] == ['created', 'created', 'error', 'error']
+    assert resp['logs'] == []  # the client's own check-ins are not echoed back
+    pulled = client.post('/sync', json={'cursor': cursor}).get_json()['logs']
+    assert [(l['client_id'], l['local_date'], l['mood_score']) for l in pulled] == [('a1', '2026-07-01', None), ('a2', '2026-07-02', 7)]
+
+    # The same batch resent after a dropped response changes nothing
+    again = client.post('/sync', json=batch).get_json()
+    assert [r['status'] for r in again['results'][:2]] == ['duplicate', 'duplicate']
+    assert [r['id'] for r in again['results'][:2]] == [r['id'] for r in resp['results'][:2]]
+    with app.app_context():
+        assert HabitLog.query.count() == 2
+
+    # Deletions by client id (or server id) arrive as tombstones; repeating one is harmless
+    client.post('/logs', json={'habit_id': hid, 'timestamp': '2026-07-04T08:00:00'})
+    deletion = {'cursor': resp['cursor'], 'changes': [{'op': 'delete_log', 'client_id': 'a1'}]}
+    delta = client.post('/sync', json=deletion).get_json()
+    assert delta['results'] == [{'status': 'deleted', 'client_id': 'a1'}]
+    assert [l['timestamp'] for l in delta['logs']] == ['2026-07-04T08:00:00']
+    assert delta['deleted'] == [{'type': 'log', 'id': resp['results'][0]['id'], 'client_id': 'a1'}]
+    assert client.post('/sync', json=deletion).get_json()['results'][0]['status'] == 'deleted'
+    assert client.get('/calendar/2026/7').get_json()['days_with_logs'] == [2, 4]
+
+    # Deleting a habit is one tombstone; paging walks the rest in order
+    client.post('/delete_habit', json={'id': hid})
+    for n in range(4):
+        client.post('/add_habit', json={'name': f'New {n}'})
+    page = client.post('/sync', json={'cursor': delta['cursor']}).get_json()
+    assert page['deleted'] == [{'type': 'habit', 'id': hid, 'client_id': None}] and page['has_more']
+    rest = client.post('/sync', json={'cursor': page['cursor']}).get_json()
+    assert [h['name'] for h in page['habits'] + rest['habits']] == ['New 0', 'New 1', 'New 2', 'New 3']
+    assert not rest['has_more'] and client.post('/sync', json={'cursor': rest['cursor']}).get_json()['habits'] == []
+
+    # Another user's sync sees none of it
+    # Give the default account a password (and a session) before a second user signs up
+    client.post('/profile', data={'display_name': 'Ann', 'email': 'ann@example.com', 'password': 'Secret1'})
+    other = app.test_client()
+    other.post('/register', json={'email': 'bob@example.com', 'password': 'Secret1'})
+    empty = other.post('/sync', json={'cursor': 0}).get_json()
+    assert (empty['habits'], empty['logs'], empty['deleted']) == ([], [], [])
+    assert client.post('/sync', json={'cursor': -1}).status_code == 400
+    assert client.post('/sync', json={'cursor': True}).status_code == 400
+    assert client.post('/sync', json={'cursor': 10 ** 30}).status_code == 400
+    bad = client.post('/sync', json={'cursor': 0, 'changes': [
+        {'op': 'add_log', 'client_id': {}, 'habit_id': 1}, {'op': 'delete_log', 'client_id': ['x']},
+        {'op': 'add_log', 'client_id': 'x' * 65, 'habit_id': 1}, {'op': 'delete_log', 'id': True},
+        {'op': 'delete_log', 'id': 10 ** 30}, {'op': 'add_log', 'client_id': 'big', 'habit_id': 2 ** 63}]})
+    assert bad.status_code == 200 and [r['status'] for r in bad.get_json()['results']] == ['error'] * 6
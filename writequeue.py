@@ -0,0 +1,205 @@
+# writequeue.py — optional group-commit write path for POST /logs
+# With WRITE_MODE='queued', add_log validates the request, hands the row to
+# GroupCommitWriter and answers 202 with an ack token. One background thread
+# drains the bounded queue and commits up to GROUP_COMMIT_MAX_ROWS rows (or
+# whatever arrived within GROUP_COMMIT_MAX_DELAY_MS) per transaction, so a
+# burst of check-ins shares one fsync instead of paying one each.
+import atexit
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from types import SimpleNamespace
+from sqlalchemy import insert
+from models import db, Habit, HabitLog
+import cache
+import dbtuning
+import events
+import rollups
+import streaks
+import sync
+
+_STOP = object()
+
+
+def write_logs(rows):
+    """
+    Insert validated log rows in one transaction, keeping the rollup, streak
+    summaries and response cache in step, then publish a log_added event per
+    row. Returns the new ids in row order.
+    """
+    first = sync.reserve(len(rows))
+    ids = db.session.execute(
+        insert(HabitLog).returning(HabitLog.id, sort_by_parameter_order=True),
+        [dict(row, change_seq=first + n) for n, row in enumerate(rows)]
+    ).scalars().all()
+    # Apply in date order so streak updates stay on their O(1) path
+    for row in sorted(rows, key=lambda r: (r['habit_id'], r['local_date'])):
+        rollups.record_log(SimpleNamespace(**row))
+        streaks.record_checkin(row['habit_id'], row['local_date'])
+    rollups.mark_applied(min(ids), max(ids))
+    db.session.commit()
+    cache.invalidate(invalidated_keys(rows))
+    names = dict(db.session.query(Habit.id, Habit.name).filter(Habit.id.in_({r['habit_id'] for r in rows})))
+    for log_id, row in zip(ids, rows):
+        events.publish(row['user_id'], 'log_added', {
+            'id': log_id, 'habit_id': row['habit_id'], 'habit_name': names.get(row['habit_id']),
+            'timestamp': row['timestamp'].replace(tzinfo=None).isoformat(), 'local_date': row['local_date'].isoformat()})
+    return ids
+
+
+def invalidated_keys(rows):
+    """Response cache keys stale after inserting `rows` (each carries user_id and local_date)."""
+    keys = set()
+    for user_id in {r['user_id'] for r in rows}:
+        keys |= cache.keys_for_dates(user_id, {r['local_date'] for r in rows if r['user_id'] == user_id})
+    return keys
+
+
+class QueueFull(Exception):
+    """The write queue stayed full for the whole enqueue timeout."""
+
+
+class GroupCommitWriter:
+    """Bounded queue plus one writer thread that group-commits batches."""
+
+    def __init__(self, app, max_rows=500, max_delay_ms=20, max_queue=10000, enqueue_timeout=1.0, retries=5):
+        self.app = app
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self.enqueue_timeout = enqueue_timeout
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.retries = retries
+        # token -> None (queued), log id, or False (failed); bounded, oldest first
+        self.keep_acks = max_queue * 2
+        self._acks = OrderedDict()
+        # (user_id, local date) -> sequence numbers of its queued, uncommitted rows
+        self._pending = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._settled = threading.Condition(self._lock)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def submit(self, row):
+        """Queue a validated row; returns its ack token. Raises QueueFull (backpressure)."""
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self._pending.setdefault((row['user_id'], row['local_date']), set()).add(seq)
+            self._acks[token] = None
+        try:
+            self.queue.put((token, row, seq), timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._settle([(token, row, seq)])
+            with self._lock:
+                self._acks.pop(token, None)
+            raise QueueFull()
+        return token
+
+    def ack(self, token):
+        """'queued', 'committed' or 'failed' plus the log id, or None for unknown tokens."""
+        with self._lock:
+            if token not in self._acks:
+                return None
+            log_id = self._acks[token]
+        if log_id is None:
+            return {'status': 'queued'}
+        if log_id is False:
+            return {'status': 'failed'}
+        return {'status': 'committed', 'id': log_id}
+
+    def has_pending(self, user_id, dates):
+        with self._lock:
+            return any((user_id, d) in self._pending for d in dates)
+
+    def wait_for(self, user_id, dates, timeout):
+        """
+        Block until the rows of `user_id` on `dates` that are queued right now
+        are committed (or failed), or `timeout` seconds pass. Rows queued
+        meanwhile are not waited for, so steady check-ins cannot starve a
+        read. Returns False on timeout.
+        """
+        keys = [(user_id, d) for d in dates]
+        with self._lock:
+            target = max((max(self._pending[k]) for k in keys if k in self._pending), default=0)
+            return self._settled.wait_for(
+                lambda: not any(seq <= target for k in keys for seq in self._pending.get(k, ())), timeout)
+
+    def flush(self):
+        """Block until the queue is empty, including rows queued while waiting (tests, benchmarks)."""
+        self.queue.join()
+
+    def stop(self):
+        """Durable shutdown: commit everything still queued, then stop the thread."""
+        if self._thread and self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join()
+
+    def _settle(self, items):
+        # Rows that are committed, failed or never queued; wake waiting readers
+        with self._lock:
+            for _, row, seq in items:
+                key = (row['user_id'], row['local_date'])
+                self._pending[key].discard(seq)
+                if not self._pending[key]:
+                    del self._pending[key]
+            self._settled.notify_all()
+
+    def _next_batch(self):
+        first = self.queue.get()
+        if first is _STOP:
+            return None, True
+        batch, stop = [first], False
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_rows:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run(self):
+        with self.app.app_context():
+            stop = False
+            while not stop:
+                batch, stop = self._next_batch()
+                if batch:
+                    self._commit(batch)
+                if stop:
+                    self.queue.task_done()  # the _STOP marker
+            db.session.remove()
+
+    def _commit(self, batch):
+        rows = [row for _, row, _ in batch]
+        for attempt in range(self.retries + 1):
+            try:
+                ids = write_logs(rows)
+                break
+            except Exception as exc:
+                db.session.rollback()
+                if attempt < self.retries and dbtuning.is_lock_error(exc):
+                    time.sleep(0.01 * (2 ** attempt))
+                    continue
+                ids = [False] * len(rows)
+                print(f'Group commit of {len(rows)} logs failed: {exc}')
+                break
+        with self._lock:
+            for (token, _, _), log_id in zip(batch, ids):
+                self._acks[token] = log_id
+            while len(self._acks) > self.keep_acks:
+                self._acks.popitem(last=False)
+        self._settle(batch)
+        for _ in batch:
+            self.queue.task_done()